@@ -1,33 +1,31 @@
-from random import randint, randrange
+import numpy as np
+
+from aleatorio import (bases_aleatorias, criar_gerador, motif_aleatorio,
+                       sequencia_aleatoria)
+from hamming import codificar_padroes, distancia, distancias_janelas
+from kmers import codificar
+from mediana import median_string
+from motifs import busca_aleatoria, gibbs
+from perfil import Profile, pontuar_janelas
+from sequencia import MatrizMotif
+from vizinhanca import VIZINHANCAS
 
 
 class DNA(object):
 
     @staticmethod
-    def criar_kmer_aleatorio(k):
+    def criar_kmer_aleatorio(k, semente=None):
         """
         Retorna uma sequencia(kmer) aleatória de tamanho k
         :param k: tamanho (length) do kmer desejado.
-        :rtype: list()
-        :return lista de sequencia aleatoria
+        :param semente: semente ou numpy.random.Generator, para repetir o
+        resultado (ver aleatorio.py, que também gera com conteúdo GC ou
+        cadeia de Markov)
+        :rtype: Sequencia
+        :return sequencia aleatoria
         """
 
-        kmer = []
-        letra = str
-
-        for i in range(k):
-            random = randint(1, 4)
-            if random == 1:
-                letra = 'A'
-            elif random == 2:
-                letra = 'T'
-            elif random == 3:
-                letra = 'G'
-            elif random == 4:
-                letra = 'C'
-            kmer.append(letra)
-
-        return kmer
+        return sequencia_aleatoria(k, semente)
 
     @staticmethod
     def calcular_erros(trecho, kmer, k):
@@ -40,26 +38,29 @@ class DNA(object):
         :return:
         """
 
-        erros = 0
-        for i in range(k):
-            if trecho[i] != kmer[i]:
-                erros += 1
-        return erros
+        return int(np.count_nonzero(codificar(trecho[:k]) !=
+                                    codificar(kmer[:k])))
+
+    @staticmethod
+    def vizinhanca(kmer, d):
+        """
+        Todos os kmers com no máximo d erros (mutações) em relação ao kmer,
+        ele incluído, em ordem alfabética. As vizinhanças já calculadas são
+        reaproveitadas (ver vizinhanca.py)
+        :rtype: list
+        """
+
+        return VIZINHANCAS.kmers(kmer, d)
 
     def percorrer(self, kmer, trecho, k):
         """
         Slice and Switch
-        Percorre o kmer original
-        :rtype: int
+        Percorre o kmer original, calculando os erros do trecho em cada
+        janela de uma vez (ver hamming.py)
+        :rtype: list
         """
 
-        numero_de_erros = []
-        numero_de_pulos = len(kmer) - k + 1
-
-        for i in range(numero_de_pulos):
-            comparador = kmer[i: i + k]
-            numero_de_erros.append(self.calcular_erros(trecho, comparador, k))
-        return numero_de_erros
+        return distancias_janelas(trecho[:k], kmer).tolist()
 
     def calcular_distancia(self, sequencia, k):
         trecho = self.criar_kmer_aleatorio(k)
@@ -74,55 +75,29 @@ class DNA(object):
 
         return distancia
 
-    def criar_motif(self, linha, coluna):
+    def criar_motif(self, linha, coluna, semente=None):
         """
-        Cria o motif (matriz contendo várias sequencias aleatórias de motif).
+        Cria o motif (matriz contendo várias sequencias aleatórias de motif),
+        todo de uma vez.
         :param linha: quantidade de sequencias
         :param coluna: tamanho (length) das sequencias
+        :param semente: semente ou numpy.random.Generator
         :return: a matriz de motif
+        :rtype: MatrizMotif
         """
 
-        motif = []
-
-        for i in range(linha):
-            sequencia = self.criar_kmer_aleatorio(coluna)
-            motif.append(sequencia)
-
-        return motif
+        return motif_aleatorio(linha, coluna, semente)
 
     @staticmethod
     def profile_frequencia(motif):
         """
         Calcula a frequencia e cria o profile (matriz com a criar_frequencia),
-        retornando-o.
+        retornando-o. Para atualizar o profile kmer a kmer use perfil.Profile.
         :param motif: a matriz de motif
         :rtype: matriz contendo a frequencia absoluta
         """
 
-        linhas = len(motif)
-        colunas = len(motif[0])
-        profile = [[], [], [], []]
-
-        # zerando a matriz de resultados
-        for i in range(4):
-            for j in range(colunas):
-                profile[i].append(0)
-
-        for i in range(colunas):
-            for j in range(linhas):
-                if motif[j][i] == 'A':
-                    profile[0][i] += 1
-
-                elif motif[j][i] == 'C':
-                    profile[1][i] += 1
-
-                elif motif[j][i] == 'G':
-                    profile[2][i] += 1
-
-                elif motif[j][i] == 'T':
-                    profile[3][i] += 1
-
-        return profile
+        return Profile.de_motif(motif).contagens.tolist()
 
     @staticmethod
     def criar_sequencia_provavel(profile):
@@ -133,95 +108,43 @@ class DNA(object):
         :rtype: list
         """
 
-        colunas = len(profile[0])
-        sequencia_provavel = []
-
-        # zerando a sequencia
-        for i in range(colunas):
-            sequencia_provavel.append(0)
-
-        # calculando maior ocorrencia
-        for i in range(colunas):
-            maior_numero = 0
-
-            if profile[0][i] >= maior_numero:
-                maior_numero = profile[0][i]
-                sequencia_provavel[i] = 'A'
-
-            if profile[1][i] >= maior_numero:
-                maior_numero = profile[1][i]
-                sequencia_provavel[i] = 'C'
-
-            if profile[2][i] >= maior_numero:
-                maior_numero = profile[2][i]
-                sequencia_provavel[i] = 'G'
-
-            if profile[3][i] >= maior_numero:
-                maior_numero = profile[3][i]
-                sequencia_provavel[i] = 'T'
-
-        return sequencia_provavel
+        # num empate fica a última base (A, C, G, T) com a maior ocorrencia
+        profile = np.asarray(profile)
+        mais_frequentes = 3 - np.argmax(profile[::-1], axis=0)
+        return ['ACGT'[i] for i in mais_frequentes]
 
     @staticmethod
     def profile_probabilidade(profile):
         """
         Transforma o profile original (matriz de frequencia) em um profile com
         as probabilidades (matriz com numeros flutuantes, utilizando
-        percentagem)
+        percentagem). Cada coluna é dividida pela sua própria soma.
         :rtype: uma matriz de profile
         """
 
-        colunas = len(profile[0])
-        soma_colunas = 0
-        novo_profile = [[], [], [], []]
-
-        # zerando matriz para novo profile, e pegando a soma das colunas
-        for i in range(4):
-            soma_colunas += profile[i][0]
-            for j in range(colunas):
-                novo_profile[i].append(0.0)
-
-        for i in range(colunas):
-            for j in range(4):
-                valor = profile[j][i] / soma_colunas
-                novo_profile[j][i] = valor
-
-        return novo_profile
+        profile = np.asarray(profile, dtype=np.float64)
+        soma_colunas = profile.sum(axis=0)
+        return (profile / np.where(soma_colunas > 0, soma_colunas, 1)).tolist()
 
     @staticmethod
     def calcular_probabilidade_trecho(trecho, profile):
         """
         Dado um trecho de tamanho (len) igual a do profile, retorna a
-        probabilidade de sua ocorrencia
-        (com 4 casas decimais).
+        probabilidade de sua ocorrencia. A conta é feita em log (ver
+        perfil.py) e não é arredondada, então trechos longos não viram 0.0.
+        Para varrer uma sequencia inteira use perfil.pontuar_janelas.
         :rtype: float
         """
 
-        trecho = list(trecho)
-        resultado = 1
-
-        for i in range(len(trecho)):
-            if trecho[i] == 'A':
-                resultado *= profile[0][i]
-
-            elif trecho[i] == 'C':
-                resultado *= profile[1][i]
-
-            elif trecho[i] == 'G':
-                resultado *= profile[2][i]
-
-            elif trecho[i] == 'T':
-                resultado *= profile[3][i]
-
-        return round(resultado, 4)
+        return float(np.exp(pontuar_janelas(profile, trecho)[0]))
 
     @staticmethod
-    def seleciona_trecho_aleatorio(k, motif):
+    def seleciona_trecho_aleatorio(k, motif, semente=None):
         """
-        Ainda não implementada/chamada/usada. Tem o mesmo propósito do método
-        'criar_motif_de_trechos_aleatorios'. Somente será usada quando alterar
-        o estilo de implementação de strings de DNA do projeto inteiro.
-        Ou seja, passar disso:
+        Tem o mesmo propósito do método 'criar_motif_de_trechos_aleatorios':
+        um trecho aleatório de tamanho k de cada linha do motif. Aceita o
+        motif como MatrizMotif, lista de strings/Sequencia ou, como antes,
+        lista de listas de letras:
 
         [['T', 'A', 'A', 'C'],
         ['G', 'T', 'C', 'T'],
@@ -229,64 +152,62 @@ class DNA(object):
         ['A', 'C', 'T', 'A'],
         ['A', 'G', 'G', 'T']]
 
-        pra isso:
-
-        ["TTAC", "GTCT", "CCGG", "ACTA", "AGGT"]
-
         :param k:
         :param motif:
+        :param semente: semente ou numpy.random.Generator
         :return
-        :rtype: list
+        :rtype: MatrizMotif
         """
-        tam_linha = len(motif[0])
+        gerador = criar_gerador(semente)
         kmers = []
-        for motif in motif:
-            inicio_max = randrange(tam_linha - k)
-            trecho = motif[inicio_max:inicio_max + k]
-            kmers.append(trecho)
+        for linha in motif:
+            inicio = gerador.integers(len(linha) - k + 1)
+            kmers.append(linha[inicio:inicio + k])
 
-        return kmers
+        return MatrizMotif(kmers)
 
     @staticmethod
-    def criar_motif_de_trechos_aleatorios(motif, k):
+    def criar_motif_de_trechos_aleatorios(motif, k, semente=None):
         """
         Cria uma nova matriz de motif, com trechos selecionados aleatoriamente
         da matriz de motif anterior (passada como parametro).
         :return uma nova matriz
         :param k: o tamanho (length) do trecho aleatorio a ser gerado
         :param motif: o motif a ser analisado
-        :rtype: list
+        :param semente: semente ou numpy.random.Generator
+        :rtype: MatrizMotif
         """
 
-        linhas = len(motif)
-        motif_aleatorio = [[0] * k for i in range(linhas)]
-
-        for i in range(linhas):
-            ponto_partida_maximo = linhas - k
-            inicio_random = randint(0, ponto_partida_maximo)
-            trecho = motif[i][inicio_random:inicio_random + k]
-            motif_aleatorio[i] = trecho
+        inicios = criar_gerador(semente).integers(
+            0, [len(linha) - k + 1 for linha in motif])
+        return MatrizMotif([linha[inicio:inicio + k]
+                            for linha, inicio in zip(motif, inicios)])
 
-        return motif_aleatorio
 
+def menores_distancias(qtd_sequencias=None, k=None):
+    # só pergunta o que não foi passado
+    if qtd_sequencias is None:
+        qtd_sequencias = int(input(
+            "\nInsira aqui a quantidade de sequencias que deseja analisar: "))
+    if k is None:
+        k = int(input("E qual será o tamanho dessas sequencias? "))
 
-def menores_distancias():
-    qtd_sequencias = int(
-        input("\nInsira aqui a quantidade de sequencias que deseja analisar: "))
-    k = int(input("E qual será o tamanho dessas sequencias? "))
-    somatorio = []
+    # todas as sequencias e trechos aleatórios são sorteados e comparados
+    # de uma vez
+    bases = bases_aleatorias(2 * qtd_sequencias, k)
+    somatorio = distancia(codificar_padroes(bases[:qtd_sequencias])[0],
+                          codificar_padroes(bases[qtd_sequencias:])[0])
 
-    for i in range(qtd_sequencias):
-        dna = DNA()
-        sequencia = dna.criar_kmer_aleatorio(k)
-        somatorio.append(dna.calcular_distancia(sequencia, k))
+    print("A soma das menores distancias é: ", int(somatorio.sum()))
+    return int(somatorio.sum())
 
-    print("A soma das menores distancias é: ", sum(somatorio))
 
-
-def criar_matriz_de_motif():
-    linha = int(input("\nInsira aqui quantas sequencias deseja analisar: "))
-    coluna = int(input("\nInsira aqui o tamanho das sequencias: "))
+def criar_matriz_de_motif(linha=None, coluna=None):
+    if linha is None:
+        linha = int(input(
+            "\nInsira aqui quantas sequencias deseja analisar: "))
+    if coluna is None:
+        coluna = int(input("\nInsira aqui o tamanho das sequencias: "))
 
     dna = DNA()
     motif = dna.criar_motif(linha, coluna)
@@ -313,137 +234,66 @@ def criar_profile(motif):
 def calcular_probabilidade_sequencia(sequencia, profile):
     """
         Dado um código genético (sequencia), calcular qual a probabilidade de
-        cada trecho de tamanho kmer, se analisado o profile.
+        cada trecho de tamanho kmer (o tamanho do profile), se analisado o
+        profile.
         :param sequencia: o codigo genetico em si
         :param profile: o profile da sequencia
     """
-    k = int(input("Qual é o tamanho dos trechos que serão analisados? "))
-    numero_de_pulos = len(sequencia) - k + 1
+    k = len(profile[0])
+    log_probabilidades = pontuar_janelas(profile, sequencia)
 
-    for i in range(numero_de_pulos):
+    for i, log_prob in enumerate(log_probabilidades):
         trecho = sequencia[i: i + k]
-        prob = DNA.calcular_probabilidade_trecho(trecho, profile)
-        print(f"O trecho é {trecho} e a probabilidade é {prob}")
+        print(f"O trecho é {trecho} e a probabilidade é {np.exp(log_prob)} "
+              f"(log = {log_prob:.4f})")
 
 
-def randomized_motif_search(motif):
+def randomized_motif_search(motif, k, reinicios=1, semente=None):
     """
-    Algoritmo de busca de motifs aleatório
+    Algoritmo de busca de motifs aleatório. Cada reinício itera até o score
+    do motif parar de melhorar; para muitos reinícios em paralelo e as
+    estatísticas de cada um use motifs.busca_aleatoria.
     :param motif: o motif (matriz contendo várias sequencias de DNA).
-    :return:
+    :param k: o tamanho do trecho
+    :param reinicios: quantas buscas aleatórias fazer
+    :param semente: semente para repetir o resultado
+    :return a lista com o melhor trecho de cada sequencia
+    :rtype: list
     """
 
-    k = int(input("\nQual será o tamanho do trecho (k)? "))
-
-    random_motif = DNA.criar_motif_de_trechos_aleatorios(motif, k)
-    # random_motif = [
-    #     ['T', 'A', 'A', 'C'],
-    #     ['G', 'T', 'C', 'T'],
-    #     ['C', 'C', 'G', 'G'],
-    #     ['A', 'C', 'T', 'A'],
-    #     ['A', 'G', 'G', 'T']
-    # ]
+    return busca_aleatoria(motif, k, reinicios, semente).motifs
 
-    profile = DNA.profile_frequencia(random_motif)
-    profile = DNA.profile_probabilidade(profile)
 
-    qtd_linhas = len(motif)
-    qtd_colunas = len(motif[0])
-    numero_de_pulos = qtd_colunas - k + 1
-    dict_resultados = {}
-    melhor_trecho = ''
-    melhor_motif = []
-
-    for i in range(qtd_linhas):
-        maior_prob = 0
-        for j in range(numero_de_pulos):
-
-            trecho = motif[i][j:j + k]
-            trecho = ''.join(trecho)
-            float_prob = DNA.calcular_probabilidade_trecho(trecho, profile)
-            dict_resultados[trecho] = float_prob
-
-            if float_prob > maior_prob:
-                maior_prob = float_prob
-                melhor_trecho = trecho
-
-        melhor_motif.append(melhor_trecho)
-
-    return melhor_motif
-
-
-def gibbs_sampler(motif, linha, coluna, k):
+def gibbs_sampler(motif, k, iteracoes=1000, cadeias=20, semente=None):
     """
-    É um trampo
-    :rtype: sei la
+    Gibbs sampler: a cada passo uma linha do motif é retirada do profile e o
+    seu novo trecho é sorteado proporcionalmente à probabilidade dada pelo
+    profile das outras linhas. Para as estatísticas de cada cadeia e parada
+    antecipada use motifs.gibbs.
+    :param motif: o motif (matriz contendo várias sequencias de DNA).
+    :param k: o tamanho do trecho
+    :param iteracoes: quantos passos cada cadeia dá
+    :param cadeias: quantas cadeias independentes executar
+    :param semente: semente para repetir o resultado
+    :return a lista com o melhor trecho de cada sequencia
+    :rtype: list
     """
 
-    dna = DNA()
-    motif_original = dna.criar_motif(linha, coluna)
-    motif_random = DNA.criar_motif_de_trechos_aleatorios(motif_original, k)
-
-    # removendo linha e guardar ela posteriomente
-    index_linha_retirada = randint(0, len(motif_random))
-    kmer_retirado = motif_random[index_linha_retirada]
-    kmer_original_retirado = motif_original[index_linha_retirada]
-    del (motif_random, motif_random[index_linha_retirada])
-
-    # criando profile com o que sobrou da matriz
-    profile = DNA.profile_frequencia(motif_random)
-    profile = DNA.profile_probabilidade(profile)
-
-    lista_prob = []
-    numero_de_pulos = len(kmer_original_retirado) - k + 1
-
-    # iniciando fora do laço pra poder armazenar
-    trecho_maior_prob = []
-    maior_prob = 0.0
-    for i in range(numero_de_pulos):
-        trecho = kmer_original_retirado[i:i + k]
-        prob = DNA.calcular_probabilidade_trecho(trecho, profile)
-        lista_prob.append(prob)
-        if prob > max(lista_prob):
-            maior_prob = prob
-            trecho_maior_prob = trecho
-
-
-def gibbs(motif_original, k):
-    removed_sequence = []
-    iteracoes = len(motif_original)
-
-    # criando/zerando matriz de resultados de uma vez
-    resultado = [[''] * k for i in range(iteracoes)]
+    return gibbs(motif, k, cadeias, iteracoes, semente=semente).motifs
 
-    # fazer isso até o motif original não ter mais nada
-    for i in range(0, iteracoes):
-        # add em um e remove no outro
-        linha_random = randint(0, len(motif_original))
-        removed_sequence.append(motif_original[linha_random])
-        motif_original.remove(motif_original[linha_random])
 
-        # criando motif com base no original
-        motif_random = DNA.criar_motif_de_trechos_aleatorios(motif_original, k)
-
-        # criando profile com base no motif random
-        profile = DNA.profile_frequencia(motif_random)
-        profile = DNA.profile_probabilidade(profile)
-
-        # percorrendo a linha dos removidos e calculando a probabilidade para
-        # cada trecho dentro dessa linha kkk
-        numero_de_pulos = len(removed_sequence[i]) - k + 1
-
-        trecho_maior_prob = []
-        maior_prob = 0.0
-        for j in range(numero_de_pulos):
-            trecho = removed_sequence[i][j:j + k]
-            prob = DNA.calcular_probabilidade_trecho(trecho, profile)
-            if prob > maior_prob:
-                trecho_maior_prob = trecho
-
-        # armazena os trechos de maior probabilidade dentro de uma matriz
-        resultado[i].append(trecho_maior_prob)
+def encontrar_mediana(motif, k):
+    """
+    Median string: os padrões de tamanho k com a menor soma das menores
+    distâncias a cada linha do motif (ver mediana.py).
+    :param motif: o motif (matriz contendo várias sequencias de DNA).
+    :param k: o tamanho do padrão
+    :return (lista de padrões, distância total)
+    :rtype: tuple
+    """
 
-    return resultado
+    resultado = median_string(motif, k)
+    return resultado.padroes, resultado.distancia
 
 
 def main():
@@ -487,10 +337,9 @@ def main():
         ['C', 'G', 'T', 'C', 'A', 'G', 'A', 'G', 'G', 'T']
     ]
 
-    # randomized_motif_search(motif_4)
-
-    novo_motif = DNA.remover_kmer_random(motif_5, true)
-    print(novo_motif)
+    print(randomized_motif_search(motif_4, 4, reinicios=100, semente=0))
+    print(gibbs_sampler(motif_4, 4, semente=0))
+    print(encontrar_mediana(motif_4, 4))
 
 
 if __name__ == '__main__':
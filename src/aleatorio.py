@@ -0,0 +1,225 @@
+"""
+Geração de DNA aleatório em lote: kmers, matrizes de motif e genomas
+inteiros, para modelos nulos (sequencias de fundo).
+
+Tudo parte de um numpy.random.Generator (ou de uma semente), então o mesmo
+valor de 'semente' gera sempre a mesma sequencia. A composição pode ser
+uniforme, ter um conteúdo GC dado ou seguir uma cadeia de Markov de ordem n
+(treinada numa sequencia de referência, ver ModeloMarkov.treinar).
+
+As sequencias são geradas em linhas de TAMANHO_LINHA bases: as linhas são
+sorteadas juntas, uma coluna por vez, então mesmo a cadeia de Markov é
+vetorizada. Cada linha começa num n-mer sorteado pelas frequências de
+n-mers do modelo; para uma cadeia de Markov isso é uma quebra de dependência
+a cada TAMANHO_LINHA bases, sem efeito na composição. A geração em blocos
+(blocos_aleatorios) produz exatamente a mesma sequencia que a geração de
+uma vez só.
+"""
+
+import numpy as np
+
+from kmers import contar_kmers
+from sequencia import MatrizMotif, Sequencia
+
+# bases por linha na geração de sequencias longas
+TAMANHO_LINHA = 1 << 12
+
+# bases por bloco em blocos_aleatorios (arredondado para linhas inteiras)
+TAMANHO_BLOCO = 1 << 22
+
+_LETRAS = np.frombuffer(b'ACGT', dtype=np.uint8)
+
+
+def criar_gerador(semente=None):
+    """
+    :param semente: None, um inteiro, uma np.random.SeedSequence ou um
+    np.random.Generator (devolvido como está)
+    :rtype: numpy.random.Generator
+    """
+
+    if isinstance(semente, np.random.Generator):
+        return semente
+    return np.random.default_rng(semente)
+
+
+class ModeloMarkov(object):
+    """
+    Cadeia de Markov de ordem n sobre ACGT. A ordem 0 é uma composição fixa
+    (bases independentes).
+
+    - iniciais: probabilidade de cada um dos 4^n n-mers (de onde cada linha
+      começa)
+    - transicoes: matriz 4^n x 4, a probabilidade da próxima base dado o
+      n-mer anterior (em código de 2 bits, ver kmers.py)
+    """
+
+    __slots__ = ('ordem', 'iniciais', 'transicoes')
+
+    def __init__(self, iniciais, transicoes):
+        iniciais = np.asarray(iniciais, dtype=np.float64)
+        transicoes = np.asarray(transicoes, dtype=np.float64)
+        ordem = int(round(np.log(len(transicoes)) / np.log(4)))
+        if len(iniciais) != 4 ** ordem or transicoes.shape != (4 ** ordem, 4):
+            raise ValueError("o modelo deve ter 4^n probabilidades iniciais "
+                             "e uma matriz de transição 4^n x 4")
+        if np.any(transicoes < 0) or np.any(iniciais < 0):
+            raise ValueError("probabilidades não podem ser negativas")
+
+        self.ordem = ordem
+        self.iniciais = iniciais / iniciais.sum()
+        self.transicoes = transicoes / transicoes.sum(axis=1, keepdims=True)
+
+    @classmethod
+    def composicao(cls, probabilidades):
+        """
+        Modelo de ordem 0 com as probabilidades de A, C, G e T.
+        """
+
+        return cls([1.0], [probabilidades])
+
+    @classmethod
+    def conteudo_gc(cls, gc):
+        """
+        Modelo de ordem 0 com uma fração 'gc' de G + C.
+        """
+
+        if not 0 <= gc <= 1:
+            raise ValueError(f"o conteúdo GC deve estar entre 0 e 1, "
+                             f"recebido {gc}")
+        return cls.composicao([(1 - gc) / 2, gc / 2, gc / 2, (1 - gc) / 2])
+
+    @classmethod
+    def treinar(cls, sequencia, ordem, pseudocontagem=1):
+        """
+        Estima o modelo de ordem 'ordem' pelas contagens de (n+1)-mers de
+        uma sequencia de referência (qualquer formato aceito por
+        kmers.codificar, inclusive genoma.Genoma).
+        :param pseudocontagem: somada a cada contagem, para nenhuma
+        transição ficar com probabilidade zero
+        """
+
+        if ordem < 0:
+            raise ValueError(f"a ordem não pode ser negativa, recebida "
+                             f"{ordem}")
+
+        contagens = np.full(4 ** (ordem + 1), pseudocontagem,
+                            dtype=np.float64)
+        codigos, quantidades = contar_kmers(sequencia, ordem + 1)
+        contagens[codigos.astype(np.intp)] += quantidades
+        transicoes = contagens.reshape(4 ** ordem, 4)
+        return cls(transicoes.sum(axis=1), transicoes)
+
+
+def _modelo(gc, markov):
+    if gc is not None and markov is not None:
+        raise ValueError("informe o conteúdo GC ou o modelo de Markov, não "
+                         "os dois")
+    if markov is not None:
+        return markov
+    return ModeloMarkov.conteudo_gc(0.5 if gc is None else gc)
+
+
+def _sortear(acumuladas, sorteios):
+    # índice da categoria de cada sorteio em [0, 1), pelas probabilidades
+    # acumuladas (de cada linha, quando 'acumuladas' é 2D)
+    if acumuladas.ndim == 1:
+        categorias = np.zeros(sorteios.shape, dtype=np.uint8)
+        for limite in acumuladas[:-1]:
+            categorias += sorteios >= limite
+        return categorias
+    return (sorteios[:, None] >= acumuladas[:, :-1]).sum(axis=1)
+
+
+def _gerar(linhas, colunas, gerador, modelo):
+    """
+    Sorteia uma matriz linhas x colunas de bases (2 bits), a partir de um
+    único gerador.random((linhas, colunas)).
+    """
+
+    if colunas < modelo.ordem:
+        raise ValueError(f"as linhas precisam ter pelo menos {modelo.ordem} "
+                         f"bases para um modelo de ordem {modelo.ordem}")
+
+    # float32 basta para sortear entre 4 bases e é duas vezes mais rápido
+    sorteios = gerador.random((linhas, colunas), dtype=np.float32)
+    transicoes = np.cumsum(modelo.transicoes, axis=1).astype(np.float32)
+    if modelo.ordem == 0:
+        return _sortear(transicoes[0], sorteios)
+
+    bases = np.empty((linhas, colunas), dtype=np.uint8)
+    n = modelo.ordem
+    estados = _sortear(np.cumsum(modelo.iniciais).astype(np.float32),
+                       sorteios[:, 0]).astype(np.intp)
+    for j in range(n):
+        bases[:, j] = (estados >> (2 * (n - 1 - j))) & 3
+
+    mascara = 4 ** n - 1
+    for j in range(n, colunas):
+        proxima = _sortear(transicoes[estados], sorteios[:, j])
+        bases[:, j] = proxima
+        estados = ((estados << 2) | proxima) & mascara
+
+    return bases
+
+
+def bases_aleatorias(linhas, colunas, semente=None, gc=None, markov=None):
+    """
+    Matriz linhas x colunas de bases aleatórias, já codificadas em 2 bits
+    (A=0, C=1, G=2, T=3), numa chamada vetorizada.
+    :param semente: semente ou numpy.random.Generator (ver criar_gerador)
+    :param gc: fração de G + C (padrão: 0.5, composição uniforme)
+    :param markov: um ModeloMarkov, no lugar de 'gc'
+    :rtype: numpy.ndarray (uint8)
+    """
+
+    return _gerar(linhas, colunas, criar_gerador(semente),
+                  _modelo(gc, markov))
+
+
+def motif_aleatorio(linhas, colunas, semente=None, gc=None, markov=None):
+    """
+    Matriz de motif com 'linhas' sequencias aleatórias de tamanho 'colunas'.
+    :rtype: MatrizMotif
+    """
+
+    return MatrizMotif(_LETRAS[bases_aleatorias(linhas, colunas, semente, gc,
+                                                markov)])
+
+
+def blocos_aleatorios(tamanho, tamanho_bloco=TAMANHO_BLOCO, semente=None,
+                      gc=None, markov=None):
+    """
+    Gera um genoma aleatório de 'tamanho' bases em pedaços, sem nunca
+    guardá-lo inteiro. O resultado é o mesmo de sequencia_aleatoria com a
+    mesma semente.
+    :param tamanho_bloco: bases por pedaço (arredondado para um múltiplo de
+    TAMANHO_LINHA)
+    :return gerador de (posicao de inicio, pedaco em bytes ASCII)
+    """
+
+    gerador = criar_gerador(semente)
+    modelo = _modelo(gc, markov)
+    largura = min(TAMANHO_LINHA, max(tamanho, modelo.ordem, 1))
+    linhas_por_bloco = max(1, tamanho_bloco // largura)
+    total_de_linhas = -(-tamanho // largura)
+
+    for primeira in range(0, total_de_linhas, linhas_por_bloco):
+        linhas = min(linhas_por_bloco, total_de_linhas - primeira)
+        inicio = primeira * largura
+        bases = _gerar(linhas, largura, gerador, modelo).reshape(-1)
+        yield inicio, _LETRAS[bases[:tamanho - inicio]]
+
+
+def sequencia_aleatoria(tamanho, semente=None, gc=None, markov=None):
+    """
+    Sequencia (ou genoma) aleatória de 'tamanho' bases, numa chamada
+    vetorizada.
+    :param semente: semente ou numpy.random.Generator (ver criar_gerador)
+    :param gc: fração de G + C (padrão: 0.5, composição uniforme)
+    :param markov: um ModeloMarkov, no lugar de 'gc'
+    :rtype: Sequencia
+    """
+
+    pedacos = [pedaco for _, pedaco in blocos_aleatorios(
+        tamanho, max(tamanho, 1), semente, gc, markov)]
+    return Sequencia(np.concatenate(pedacos) if pedacos else b'')
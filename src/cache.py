@@ -0,0 +1,187 @@
+"""
+Cache em disco das contagens de kmers.
+
+Cada contagem é guardada no formato binário de resultados.py (que pode ser
+mapeado na memória) num arquivo cujo nome sai de (hash do conteúdo do
+genoma, k, canônica ou não). O hash é das bases já codificadas, então o
+mesmo genoma em FASTA, em várias linhas ou em minúsculas cai na mesma
+entrada, e qualquer mudança nas bases gera outra chave: uma entrada nunca
+fica desatualizada, só deixa de ser usada.
+
+O diretório tem um tamanho máximo: a data de modificação de cada arquivo é
+atualizada a cada uso, e os menos usados recentemente (LRU) são apagados
+quando o total passa do limite.
+"""
+
+import hashlib
+import os
+
+from kmers import codificar, contar_kmers_canonicos, validar_k
+from paralelo import contar_kmers_multiplos_paralelo, contar_kmers_paralelo
+from resultados import carregar_contagem, salvar_contagem
+
+# tamanho máximo do diretório do cache (em bytes)
+TAMANHO_MAXIMO = 1 << 30
+
+EXTENSAO = '.kmers'
+
+
+def hash_do_conteudo(sequencia):
+    """
+    Hash das bases (codificadas em 2 bits) de uma sequencia ou genoma.
+    :rtype: str
+    """
+
+    return hashlib.blake2b(codificar(sequencia).tobytes(),
+                           digest_size=16).hexdigest()
+
+
+class CacheDeContagens(object):
+    """
+    Contagens de kmers guardadas num diretório, por conteúdo do genoma.
+    As contagens canônicas guardam o total de cada kmer canônico (kmer e
+    complemento reverso somados).
+    """
+
+    def __init__(self, diretorio, tamanho_maximo=TAMANHO_MAXIMO):
+        self.diretorio = diretorio
+        self.tamanho_maximo = tamanho_maximo
+        self.acertos = 0
+        self.faltas = 0
+        os.makedirs(diretorio, exist_ok=True)
+
+    def caminho(self, chave, k, canonica=False):
+        sufixo = '_canonica' if canonica else ''
+        return os.path.join(self.diretorio,
+                            f"{chave}_k={k}{sufixo}{EXTENSAO}")
+
+    def _ler(self, caminho):
+        """
+        A contagem de 'caminho', mapeada na memória, ou None se ela não
+        está no cache.
+        """
+
+        try:
+            codigos, contagens, _ = carregar_contagem(caminho, mapear=True)
+        except (OSError, ValueError):
+            self.faltas += 1
+            return None
+
+        # marca como usada agora (a ordem do LRU)
+        os.utime(caminho)
+        self.acertos += 1
+        return codigos, contagens
+
+    def _guardar(self, caminho, codigos, contagens, k, canonica):
+        # salvar_contagem escreve num temporário e renomeia, então ninguém
+        # lê uma entrada pela metade
+        salvar_contagem(caminho, codigos, contagens, k, canonica)
+
+    def contagem(self, sequencia, k, canonica=False, chave=None,
+                 processos=1):
+        """
+        A contagem de kmers de tamanho k da sequencia, do cache ou contada
+        agora (e guardada).
+        :param chave: o hash_do_conteudo da sequencia, se já calculado
+        :param processos: processos da contagem não canônica, se ela não
+        estiver no cache (None: todos os núcleos; ver paralelo.py)
+        :return (codigos distintos em ordem crescente, contagens)
+        :rtype: tuple
+        """
+
+        validar_k(k)
+        if chave is None:
+            chave = hash_do_conteudo(sequencia)
+        caminho = self.caminho(chave, k, canonica)
+
+        contagem = self._ler(caminho)
+        if contagem is not None:
+            return contagem
+
+        if canonica:
+            codigos, diretas, reversas = contar_kmers_canonicos(sequencia, k)
+            contagens = diretas + reversas
+        else:
+            codigos, contagens = contar_kmers_paralelo(sequencia, k,
+                                                       processos)
+        self._guardar(caminho, codigos, contagens, k, canonica)
+        self.limpar()
+        return codigos, contagens
+
+    def contagens(self, sequencia, ks, chave=None, processos=1):
+        """
+        As contagens (não canônicas) de vários k. As que faltam no cache
+        são contadas juntas, numa única passada pela sequencia, ou divididas
+        entre 'processos' processos (ver
+        paralelo.contar_kmers_multiplos_paralelo).
+        :return dicionario {k: (codigos, contagens)}
+        :rtype: dict
+        """
+
+        if chave is None:
+            chave = hash_do_conteudo(sequencia)
+
+        resultado = {}
+        for k in sorted(set(ks)):
+            validar_k(k)
+            contagem = self._ler(self.caminho(chave, k))
+            if contagem is not None:
+                resultado[k] = contagem
+
+        faltando = [k for k in sorted(set(ks)) if k not in resultado]
+        if faltando:
+            for k, (codigos, contagens) in contar_kmers_multiplos_paralelo(
+                    sequencia, faltando, processos).items():
+                self._guardar(self.caminho(chave, k), codigos, contagens, k,
+                              False)
+                resultado[k] = codigos, contagens
+            self.limpar()
+
+        return resultado
+
+    def tamanho(self):
+        """
+        Total (em bytes) das entradas do cache.
+        """
+
+        return sum(tamanho for _, tamanho, _ in self._entradas())
+
+    def _entradas(self):
+        entradas = []
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith(EXTENSAO):
+                continue
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                informacoes = os.stat(caminho)
+            except OSError:
+                continue
+            entradas.append((informacoes.st_mtime_ns, informacoes.st_size,
+                             caminho))
+        return entradas
+
+    def limpar(self, tamanho_maximo=None):
+        """
+        Apaga as entradas usadas há mais tempo até o cache caber em
+        'tamanho_maximo' (padrão: o do cache).
+        :return quantas entradas foram apagadas
+        :rtype: int
+        """
+
+        if tamanho_maximo is None:
+            tamanho_maximo = self.tamanho_maximo
+
+        entradas = sorted(self._entradas())
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        apagadas = 0
+        for _, tamanho, caminho in entradas:
+            if total <= tamanho_maximo:
+                break
+            try:
+                os.remove(caminho)
+            except OSError:
+                # ainda aberta (mapeada) em algum lugar; fica para a próxima
+                continue
+            total -= tamanho
+            apagadas += 1
+        return apagadas
@@ -0,0 +1,132 @@
+"""
+Busca de clumps (L, t): kmers que aparecem pelo menos t vezes dentro de
+alguma janela de tamanho L do genoma (úteis para achar a origem de
+replicação).
+
+Deslizar a janela somando o kmer que entra e tirando o que sai diz, a cada
+passo, se algum kmer chegou a t ocorrências. Aqui a mesma resposta sai de
+uma vez para todas as janelas: com as ocorrências de cada kmer em ordem de
+posição, um kmer chega a t numa janela exatamente quando alguma ocorrência
+i tem a ocorrência i + t - 1 (do mesmo kmer) até L - k posições depois
+dela. As ocorrências são agrupadas por kmer com uma ordenação estável por
+dígitos de 16 bits do código (radix, O(N)), e o teste é uma comparação do
+vetor com ele mesmo deslocado de t - 1.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from kmers import (blocos_de_bases, codificar, codigos_kmers,
+                   janelas_validas, validar_k)
+
+# bits do código ordenados em cada passada da ordenação por dígitos (o
+# NumPy usa radix sort na ordenação estável de inteiros de 16 bits)
+_BITS_POR_DIGITO = 16
+
+# bytes por base de um bloco em encontrar_clumps (códigos, posições, ordem e
+# a ordenação)
+_BYTES_POR_BASE = 64
+
+Clumps = namedtuple('Clumps', ['codigos', 'repeticoes', 'posicoes'])
+Clumps.__doc__ = """
+Resultado de encontrar_clumps, em ordem crescente de código: os kmers que
+formam clumps, o maior número de ocorrências de cada um numa janela de
+tamanho L e a posição da ocorrência que começa a primeira janela em que
+ele aparece t vezes.
+"""
+
+
+def ordenar_codigos(codigos, k):
+    """
+    Ordem estável dos códigos de 2k bits (como np.argsort(kind='stable')),
+    por dígitos de 16 bits, do menos para o mais significativo.
+    :rtype: numpy.ndarray (intp)
+    """
+
+    ordem = np.arange(len(codigos))
+    mascara = np.uint64((1 << _BITS_POR_DIGITO) - 1)
+    for deslocamento in range(0, 2 * k, _BITS_POR_DIGITO):
+        digitos = ((codigos[ordem] >> np.uint64(deslocamento)) &
+                   mascara).astype(np.uint16)
+        ordem = ordem[np.argsort(digitos, kind='stable')]
+    return ordem
+
+
+def encontrar_clumps(sequencia, k, L, t):
+    """
+    Os kmers de tamanho k que aparecem pelo menos t vezes em alguma janela
+    de tamanho L da sequencia (janelas com bases fora de ACGT não contam).
+    :param sequencia: qualquer formato aceito por kmers.codificar,
+    inclusive genoma.Genoma
+    :rtype: Clumps
+    """
+
+    validar_k(k)
+    if L < k:
+        raise ValueError(f"a janela (L={L}) deve ter pelo menos k={k} bases")
+    if t < 1:
+        raise ValueError(f"t deve ser positivo, recebido {t}")
+
+    bases = codificar(sequencia)
+    codigos = codigos_kmers(bases, k)
+    validas = janelas_validas(bases, k)
+    posicoes = np.arange(len(codigos), dtype=np.int64) if validas is None \
+        else np.flatnonzero(validas)
+    if len(codigos) == 0 or len(bases) < L:
+        return Clumps(codigos[:0], np.zeros(0, dtype=np.int64),
+                      np.zeros(0, dtype=np.int64))
+
+    # as posições já estão em ordem crescente, e a ordenação estável as
+    # mantém assim dentro de cada kmer
+    ordem = ordenar_codigos(codigos, k)
+    codigos, posicoes = codigos[ordem], posicoes[ordem]
+
+    # ocorrências que começam uma janela com t ocorrências do mesmo kmer
+    fim = len(codigos) - (t - 1)
+    atingem = np.flatnonzero(
+        (codigos[:fim] == codigos[t - 1:]) &
+        (posicoes[t - 1:] - posicoes[:fim] <= L - k))
+    clumps, primeiras = np.unique(codigos[atingem], return_index=True)
+
+    # o maior número de ocorrências numa janela, só para os clumps: cada
+    # kmer numa faixa própria de chaves, para a busca binária não passar
+    # de um kmer para o próximo
+    ocorrencias = np.flatnonzero(np.isin(codigos, clumps))
+    grupos = np.searchsorted(clumps, codigos[ocorrencias])
+    chaves = grupos * (len(bases) + L + 1) + posicoes[ocorrencias]
+    na_janela = np.searchsorted(chaves, chaves + (L - k), 'right') - \
+        np.arange(len(chaves))
+    repeticoes = np.zeros(len(clumps), dtype=np.int64)
+    np.maximum.at(repeticoes, grupos, na_janela)
+
+    return Clumps(clumps, repeticoes, posicoes[atingem[primeiras]])
+
+
+def encontrar_clumps_em_blocos(sequencia, k, L, t, memoria):
+    """
+    Mesmo resultado de encontrar_clumps, com memória limitada: a sequencia
+    é lida em blocos (ver kmers.blocos_de_bases) que avançam sobre o
+    próximo L - 1 bases, então toda janela de tamanho L cabe inteira em
+    algum bloco. Os clumps de cada bloco são juntados no fim (a maior
+    repetição e a primeira posição de cada kmer).
+    :param memoria: memória aproximada (em bytes) usada por bloco
+    :rtype: Clumps
+    """
+
+    validar_k(k)
+    tamanho = max(L, memoria // _BYTES_POR_BASE)
+    partes = [(clumps.codigos, clumps.repeticoes, clumps.posicoes + inicio)
+              for inicio, bases in blocos_de_bases(sequencia, tamanho, L - 1)
+              for clumps in [encontrar_clumps(bases, k, L, t)]]
+    if not partes:
+        return encontrar_clumps('', k, L, t)
+
+    codigos, repeticoes, posicoes = (np.concatenate(coluna)
+                                     for coluna in zip(*partes))
+    clumps, grupos = np.unique(codigos, return_inverse=True)
+    maiores = np.zeros(len(clumps), dtype=np.int64)
+    np.maximum.at(maiores, grupos, repeticoes)
+    primeiras = np.full(len(clumps), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(primeiras, grupos, posicoes)
+    return Clumps(clumps, maiores, primeiras)
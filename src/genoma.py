@@ -0,0 +1,266 @@
+"""
+Leitura de genomas por mmap.
+
+O arquivo é mapeado na memória uma única vez e aceita tanto o formato antigo
+do projeto (a sequencia inteira numa linha só) quanto texto quebrado em
+várias linhas e FASTA com um ou vários registros, em maiúsculas ou
+minúsculas. Os registros de um FASTA são emendados com um 'N' entre eles,
+assim nenhum kmer atravessa a fronteira entre dois registros (as funções de
+contagem descartam janelas com bases inválidas).
+"""
+
+import mmap
+import os
+import re
+
+import numpy as np
+
+from kmers import codificar
+
+# tamanho (em bytes do arquivo) de cada pedaço lido no modo em blocos
+TAMANHO_BLOCO = 1 << 22
+
+SEPARADOR = ord('N')
+
+_CABECALHO = re.compile(rb'^>([^\r\n]*)', re.MULTILINE)
+
+
+class _Filtro(object):
+    """
+    Remove cabeçalhos FASTA e espaços/quebras de linha de um arquivo lido
+    pedaço por pedaço, guardando entre um pedaço e outro o estado da linha
+    atual. Cada registro a partir do segundo começa com um SEPARADOR.
+    """
+
+    __slots__ = ('em_cabecalho', 'inicio_de_linha', 'emitidos', 'inicios')
+
+    def __init__(self):
+        self.em_cabecalho = False
+        self.inicio_de_linha = True
+        self.emitidos = 0
+        self.inicios = []
+
+    def filtrar(self, bruto):
+        """
+        Trabalha por linhas: só as posições das quebras e dos '>' são
+        procuradas, e só as linhas de cabeçalho (poucas) são percorridas uma
+        a uma, então a memória extra é de alguns bytes por byte do pedaço.
+        :param bruto: pedaço do arquivo (array de bytes)
+        :return as bases do pedaço, sem cabeçalhos nem quebras de linha
+        :rtype: numpy.ndarray (uint8)
+        """
+
+        tamanho = len(bruto)
+        if tamanho == 0:
+            return bruto
+
+        quebras = np.flatnonzero(bruto == ord('\n'))
+        # '>' só abre um cabeçalho no começo de uma linha
+        cabecalhos = np.flatnonzero(bruto == ord('>'))
+        no_comeco = np.zeros(len(cabecalhos), dtype=bool)
+        dentro = cabecalhos > 0
+        no_comeco[dentro] = bruto[cabecalhos[dentro] - 1] == ord('\n')
+        no_comeco[~dentro] = self.inicio_de_linha
+        cabecalhos = cabecalhos[no_comeco]
+        # cada cabeçalho vai até a próxima quebra de linha (inclusive)
+        proximas = np.searchsorted(quebras, cabecalhos)
+        fins = np.full(len(cabecalhos), tamanho, dtype=np.int64)
+        com_quebra = proximas < len(quebras)
+        fins[com_quebra] = quebras[proximas[com_quebra]] + 1
+
+        pedacos = []
+        emitidos = self.emitidos
+        cursor = 0
+        if self.em_cabecalho:
+            # o cabeçalho do pedaço anterior continua neste
+            cursor = int(quebras[0]) + 1 if len(quebras) else tamanho
+            self.em_cabecalho = cursor == tamanho and not len(quebras)
+
+        for inicio, fim in zip(cabecalhos.tolist(), fins.tolist()):
+            trecho = bruto[cursor:inicio]
+            pedacos.append(trecho[trecho > ord(' ')])
+            emitidos += len(pedacos[-1])
+            if emitidos > 0:
+                pedacos.append(np.array([SEPARADOR], dtype=np.uint8))
+                emitidos += 1
+            self.inicios.append(emitidos)
+            cursor = fim
+            self.em_cabecalho = fim == tamanho and bruto[-1] != ord('\n')
+
+        trecho = bruto[cursor:]
+        pedacos.append(trecho[trecho > ord(' ')])
+        saida = pedacos[0] if len(pedacos) == 1 else np.concatenate(pedacos)
+
+        self.inicio_de_linha = bool(bruto[-1] == ord('\n'))
+        self.emitidos += len(saida)
+        return saida
+
+
+class Genoma(object):
+    """
+    Genoma lido de um arquivo por mmap.
+
+    - 'dados' é a sequencia em bytes ASCII (um array NumPy). Se o arquivo já
+      está numa linha só, sem cabeçalho, é uma visão direta do mmap, sem
+      cópia; senão é montado uma única vez, sem cabeçalhos nem quebras.
+    - 'bases' é a sequencia já codificada em 2 bits (ver kmers.codificar), e
+      também é o que np.asarray(genoma) devolve, então o Genoma pode ser
+      passado direto para as funções de contagem.
+    - 'blocos' percorre a sequencia em pedaços, sem carregá-la inteira, e
+      len(genoma) também não monta 'dados'.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._mapa = None
+        self._dados = None
+        self._bases = None
+        self._registros = None
+        self._tamanho = None
+
+        with open(caminho, 'rb') as arquivo:
+            if os.fstat(arquivo.fileno()).st_size > 0:
+                self._mapa = mmap.mmap(arquivo.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+
+        if self._mapa is None:
+            self._bruto = np.zeros(0, dtype=np.uint8)
+        else:
+            self._bruto = np.frombuffer(self._mapa, dtype=np.uint8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        self.fechar()
+
+    def __len__(self):
+        if self._tamanho is None:
+            if self._dados is not None or self._texto_puro():
+                self._tamanho = len(self.dados)
+            else:
+                self._tamanho = sum(len(pedaco) for pedaco in
+                                    self._pedacos_filtrados(_Filtro()))
+        return self._tamanho
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.bases
+        return self.bases.astype(dtype)
+
+    def fechar(self):
+        self._bruto = self._dados = self._bases = None
+        if self._mapa is not None:
+            try:
+                self._mapa.close()
+            except BufferError:
+                # ainda existe alguma visão do mmap em uso; ele é fechado
+                # quando ela for liberada
+                pass
+            self._mapa = None
+
+    def _fim_do_texto(self):
+        fim = len(self._bruto)
+        while fim > 0 and self._bruto[fim - 1] <= ord(' '):
+            fim -= 1
+        return fim
+
+    def _texto_puro(self):
+        """
+        Se o arquivo é uma sequencia numa linha só, sem cabeçalho.
+        """
+
+        fim = self._fim_do_texto()
+        if fim == 0:
+            return True
+        if self._bruto[0] == ord('>'):
+            return False
+        # em pedaços, para não criar uma máscara do tamanho do arquivo
+        return not any(np.any(self._bruto[inicio:min(inicio + TAMANHO_BLOCO,
+                                                     fim)] <= ord(' '))
+                       for inicio in range(0, fim, TAMANHO_BLOCO))
+
+    def _pedacos_filtrados(self, filtro):
+        for inicio in range(0, len(self._bruto), TAMANHO_BLOCO):
+            pedaco = filtro.filtrar(self._bruto[inicio:inicio + TAMANHO_BLOCO])
+            # o pedaço filtrado é uma cópia: as páginas já lidas do arquivo
+            # podem sair da memória (onde o sistema permite)
+            if hasattr(mmap, 'MADV_DONTNEED'):
+                self._mapa.madvise(
+                    mmap.MADV_DONTNEED, inicio,
+                    min(TAMANHO_BLOCO, len(self._bruto) - inicio))
+            if len(pedaco):
+                yield pedaco
+
+    @property
+    def dados(self):
+        if self._dados is None:
+            if self._texto_puro():
+                self._dados = self._bruto[:self._fim_do_texto()]
+                self._registros = [(os.path.basename(self.caminho), 0,
+                                    len(self._dados))]
+            else:
+                filtro = _Filtro()
+                pedacos = list(self._pedacos_filtrados(filtro))
+                self._dados = np.concatenate(pedacos) if pedacos \
+                    else np.zeros(0, dtype=np.uint8)
+                self._registros = self._montar_registros(filtro.inicios)
+        return self._dados
+
+    @property
+    def bases(self):
+        if self._bases is None:
+            self._bases = codificar(self.dados)
+        return self._bases
+
+    @property
+    def registros(self):
+        """
+        Lista de (nome, inicio, fim) de cada registro, em posições de 'dados'.
+        """
+
+        if self._registros is None:
+            self.dados
+        return self._registros
+
+    def _montar_registros(self, inicios):
+        nomes = [m.group(1).decode('ascii', 'replace').strip()
+                 for m in _CABECALHO.finditer(self._mapa)]
+        if not inicios or inicios[0] > 0:
+            # texto antes do primeiro cabeçalho (ou arquivo sem cabeçalho)
+            nomes.insert(0, os.path.basename(self.caminho))
+            inicios = [0] + inicios
+
+        fins = [i - 1 for i in inicios[1:]] + [len(self._dados)]
+        return list(zip(nomes, inicios, fins))
+
+    def blocos(self, tamanho=TAMANHO_BLOCO, sobreposicao=0):
+        """
+        Percorre a sequencia (em bytes ASCII) em pedaços de 'tamanho' bases.
+        Cada pedaço se estende por mais 'sobreposicao' bases dentro do
+        próximo (use k - 1 para não perder nenhum kmer na emenda). Se 'dados'
+        ainda não foi montado, o arquivo é lido direto do mmap, sem nunca
+        guardar a sequencia inteira.
+        :return gerador de (posicao de inicio, pedaco)
+        """
+
+        if self._dados is not None or self._texto_puro():
+            dados = self.dados
+            for inicio in range(0, max(len(dados), 1), tamanho):
+                pedaco = dados[inicio:inicio + tamanho + sobreposicao]
+                if inicio > 0 and len(pedaco) <= sobreposicao:
+                    break
+                yield inicio, pedaco
+            return
+
+        inicio = 0
+        acumulado = np.zeros(0, dtype=np.uint8)
+        for pedaco in self._pedacos_filtrados(_Filtro()):
+            acumulado = np.concatenate((acumulado, pedaco))
+            while len(acumulado) >= tamanho + sobreposicao:
+                yield inicio, acumulado[:tamanho + sobreposicao]
+                acumulado = acumulado[tamanho:]
+                inicio += tamanho
+
+        if inicio == 0 or len(acumulado) > sobreposicao:
+            yield inicio, acumulado
@@ -0,0 +1,421 @@
+"""
+Distância de Hamming em lote entre padrões e as janelas de várias
+sequencias.
+
+Padrões e janelas viram códigos de 2 bits por base (como em kmers.py). Nas
+buscas em lote (distancias_minimas e ocorrencias_aproximadas) cada código é
+separado em dois planos de bits, um com o bit alto e outro com o bit baixo
+de cada base, cortados em bytes (_separar_planos; as janelas de um genoma
+vão direto das bases para os planos em _planos_das_janelas). Duas bases
+diferem quando diferem em algum dos planos, então a distância é a soma, byte
+a byte, de popcount((alto_a ^ alto_b) | (baixo_a ^ baixo_b)), calculada em
+uint8 sobre blocos inteiros de padrões x janelas.
+
+Para comparar só alguns pares de códigos, 'distancia' usa o uint64
+direto: x = a ^ b tem um par de bits diferente de zero em cada base que
+difere, e (x | x >> 1) & 0x5555... deixa um único bit por base diferente.
+
+Janelas com bases fora de ACGT são ignoradas. Quando uma sequencia não tem
+nenhuma janela válida, a distância e a posição voltam como SEM_JANELA.
+
+ocorrencias_aproximadas faz o caminho inverso: em vez da menor distância,
+devolve todas as janelas de um genoma (nas duas fitas) até uma distância
+d de algum padrão, lendo o genoma uma vez só para o lote inteiro.
+"""
+
+from collections import namedtuple
+from itertools import repeat
+
+import numpy as np
+
+from kmers import (INVALIDA, blocos_de_bases, codificar, complemento_reverso,
+                   janelas_validas, validar_k)
+from paralelo import (PEDACOS_POR_PROCESSO, ArrayCompartilhado,
+                      criar_executor, dividir, numero_de_processos,
+                      usar_compartilhado)
+
+SEM_JANELA = -1
+
+# quantas comparações (padrão x janela) cada bloco faz de uma vez
+COMPARACOES_POR_BLOCO = 1 << 17
+
+# quantas bases do genoma ocorrencias_aproximadas lê de cada vez
+BASES_POR_BLOCO = 1 << 20
+
+FITA_DIRETA = 0
+FITA_REVERSA = 1
+
+Ocorrencias = namedtuple('Ocorrencias', ['padroes', 'posicoes', 'fitas',
+                                         'distancias'])
+Ocorrencias.__doc__ = """
+Resultado de ocorrencias_aproximadas, uma entrada por ocorrência, em ordem
+de padrão, fita e posição: o índice do padrão, a posição (início da janela
+na fita direta), a fita (FITA_DIRETA ou FITA_REVERSA) e a distância.
+"""
+
+_UMA_POR_BASE = np.uint64(0x5555555555555555)
+
+_BITS_POR_BYTE = np.array([bin(i).count('1') for i in range(256)],
+                          dtype=np.uint8)
+
+
+def contar_bits(x, saida):
+    """
+    Popcount de um array de inteiros sem sinal, guardado em 'saida' (uint8).
+    """
+
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x, out=saida)
+
+    # NumPy < 2.0: soma os bits de cada byte por tabela
+    por_byte = np.ascontiguousarray(x).view(np.uint8)
+    por_byte = por_byte.reshape(x.shape + (x.itemsize,))
+    return _BITS_POR_BYTE[por_byte].sum(axis=-1, dtype=np.uint8, out=saida)
+
+
+def distancia(a, b):
+    """
+    Distância de Hamming entre códigos de kmers de mesmo tamanho, elemento
+    a elemento (com broadcasting).
+    :rtype: numpy.ndarray (uint8)
+    """
+
+    x = np.bitwise_xor(np.asarray(a, dtype=np.uint64),
+                       np.asarray(b, dtype=np.uint64))
+    x |= x >> np.uint64(1)
+    x &= _UMA_POR_BASE
+    return contar_bits(x, np.empty(x.shape, dtype=np.uint8))
+
+
+def codificar_padroes(padroes):
+    """
+    Códigos de 2 bits de padrões de mesmo tamanho.
+    :param padroes: lista de padrões (str ou listas de letras) ou um array
+    t x k já codificado (uint8)
+    :return (codigos, k)
+    :rtype: tuple
+    """
+
+    if isinstance(padroes, np.ndarray) and padroes.ndim == 2:
+        bases = codificar(padroes)
+    else:
+        bases = [codificar(padrao) for padrao in padroes]
+        if len({len(padrao) for padrao in bases}) > 1:
+            raise ValueError("os padrões devem ter todos o mesmo tamanho")
+        bases = np.stack(bases) if bases else np.zeros((0, 1), np.uint8)
+
+    k = bases.shape[1]
+    validar_k(k)
+    if np.any(bases == INVALIDA):
+        raise ValueError("os padrões só podem ter as bases ACGT")
+
+    codigos = np.zeros(len(bases), dtype=np.uint64)
+    for j in range(k):
+        codigos <<= np.uint64(2)
+        codigos |= bases[:, j].astype(np.uint64)
+    return codigos, k
+
+
+def codificar_janelas(sequencias, k):
+    """
+    Códigos de todas as janelas de tamanho k de cada sequencia, numa matriz
+    (uma linha por sequencia, completada no fim para as sequencias mais
+    curtas).
+    :return (codigos, validas): matriz uint64 e máscara das janelas que
+    existem e só têm ACGT (None quando todas são válidas)
+    :rtype: tuple
+    """
+
+    bases = [codificar(sequencia) for sequencia in sequencias]
+    maior = max([len(sequencia) for sequencia in bases] + [k])
+    matriz = np.full((len(bases), maior), INVALIDA, dtype=np.uint8)
+    for linha, sequencia in zip(matriz, bases):
+        linha[:len(sequencia)] = sequencia
+
+    numero_de_janelas = maior - k + 1
+    codigos = np.zeros((len(bases), numero_de_janelas), dtype=np.uint64)
+    for j in range(k):
+        codigos <<= np.uint64(2)
+        codigos |= (matriz[:, j:j + numero_de_janelas] & 3).astype(np.uint64)
+
+    invalidas = np.zeros((len(bases), maior + 1), dtype=np.int64)
+    np.cumsum(matriz == INVALIDA, axis=1, out=invalidas[:, 1:])
+    validas = invalidas[:, k:] == invalidas[:, :numero_de_janelas]
+    return codigos, None if validas.all() else validas
+
+
+def distancias_janelas(padrao, sequencia):
+    """
+    Distância de um padrão a cada janela de uma sequencia (janelas com
+    bases inválidas ficam com distância k).
+    :rtype: numpy.ndarray (int64)
+    """
+
+    codigos, k = codificar_padroes([padrao])
+    janelas, validas = codificar_janelas([sequencia], k)
+    distancias = distancia(codigos[0], janelas[0]).astype(np.int64)
+    if validas is not None:
+        distancias[~validas[0]] = k
+    return distancias
+
+
+def _separar_planos(codigos, k):
+    """
+    Separa os códigos de 2 bits em dois planos de k bits: o bit alto e o
+    bit baixo de cada base, cada plano cortado em bytes (um array uint8
+    por byte). Duas janelas diferem numa base quando diferem em algum dos
+    dois planos, então a distância é a soma, byte a byte, de
+    popcount((alto_a ^ alto_b) | (baixo_a ^ baixo_b)); com uint8 todas essas
+    operações são vetorizadas pelo NumPy.
+    :return (alto, baixo), arrays (bytes,) + codigos.shape
+    """
+
+    alto = np.zeros(codigos.shape, dtype=np.uint64)
+    baixo = np.zeros(codigos.shape, dtype=np.uint64)
+    for j in range(k):
+        deslocamento = np.uint64(2 * (k - 1 - j))
+        alto <<= np.uint64(1)
+        alto |= (codigos >> (deslocamento + np.uint64(1))) & np.uint64(1)
+        baixo <<= np.uint64(1)
+        baixo |= (codigos >> deslocamento) & np.uint64(1)
+
+    deslocamentos = np.arange(0, k, 8, dtype=np.uint64)
+    deslocamentos = deslocamentos.reshape((-1,) + (1,) * codigos.ndim)
+    return ((alto >> deslocamentos).astype(np.uint8),
+            (baixo >> deslocamentos).astype(np.uint8))
+
+
+def _planos_das_janelas(bases, k):
+    """
+    Os mesmos planos de _separar_planos para os códigos de todas as
+    janelas de tamanho k das bases, montados direto das bases, byte a byte
+    (sem passar pelos códigos de 64 bits).
+    :return (alto, baixo), arrays (bytes, janelas)
+    """
+
+    numero_de_janelas = len(bases) - k + 1
+    planos = []
+    for bit in (1, 0):
+        plano = ((bases >> bit) & 1).astype(np.uint8)
+        bytes_ = np.zeros(((k + 7) // 8, numero_de_janelas), dtype=np.uint8)
+        for j in range(k):
+            # a base j da janela vai para o bit (k - 1 - j) do plano
+            posicao = k - 1 - j
+            bytes_[posicao // 8] |= plano[j:j + numero_de_janelas] << \
+                np.uint8(posicao % 8)
+        planos.append(bytes_)
+    return planos[0], planos[1]
+
+
+def _minimos_em_blocos(padroes, janelas, validas, k):
+    """
+    Menor distância (e a posição da primeira janela que a atinge) de cada
+    padrão em cada sequencia. As comparações são feitas em blocos de
+    padrões x sequencias pequenos o bastante para ficar no cache, sempre
+    nos mesmos buffers.
+    """
+
+    padroes_alto, padroes_baixo = _separar_planos(padroes, k)
+    janelas_alto, janelas_baixo = _separar_planos(janelas, k)
+
+    numero_de_janelas = janelas.shape[1]
+    sequencias_por_bloco = max(1, min(len(janelas), COMPARACOES_POR_BLOCO //
+                                      numero_de_janelas))
+    padroes_por_bloco = max(1, COMPARACOES_POR_BLOCO //
+                            (sequencias_por_bloco * numero_de_janelas))
+    formato = (padroes_por_bloco, sequencias_por_bloco, numero_de_janelas)
+    x = np.empty(formato, dtype=np.uint8)
+    temporario = np.empty(formato, dtype=np.uint8)
+    distancias = np.empty(formato, dtype=np.uint8)
+    iguais = np.empty(formato, dtype=bool)
+
+    minimas = np.empty((len(padroes), len(janelas)), dtype=np.int8)
+    posicoes = np.empty((len(padroes), len(janelas)), dtype=np.int32)
+    for a in range(0, len(padroes), padroes_por_bloco):
+        padrao = np.s_[:, a:a + padroes_por_bloco, None, None]
+        quantos = len(padroes[a:a + padroes_por_bloco])
+        for b in range(0, len(janelas), sequencias_por_bloco):
+            linhas = np.s_[b:b + sequencias_por_bloco]
+            partes = np.s_[:quantos, :len(janelas[linhas])]
+            x_, t_, d = x[partes], temporario[partes], distancias[partes]
+
+            for byte in range(len(padroes_alto)):
+                np.bitwise_xor(padroes_alto[padrao][byte],
+                               janelas_alto[byte, None, linhas], out=x_)
+                np.bitwise_xor(padroes_baixo[padrao][byte],
+                               janelas_baixo[byte, None, linhas], out=t_)
+                np.bitwise_or(x_, t_, out=x_)
+                if byte == 0:
+                    contar_bits(x_, d)
+                else:
+                    d += contar_bits(x_, t_)
+
+            if validas is not None:
+                d[:, ~validas[linhas]] = np.iinfo(np.uint8).max
+
+            # argmin ao longo do último eixo é lento no NumPy; o mínimo e a
+            # primeira posição igual a ele dão a mesma resposta
+            minima = d.min(axis=2)
+            np.equal(d, minima[..., None], out=iguais[partes])
+            minimas[a:a + quantos, linhas] = minima
+            posicoes[a:a + quantos, linhas] = iguais[partes].argmax(axis=2)
+
+    if validas is not None:
+        sem_janela = ~validas.any(axis=1)
+        minimas[:, sem_janela] = SEM_JANELA
+        posicoes[:, sem_janela] = SEM_JANELA
+    return minimas, posicoes
+
+
+def _minimos_trecho(janelas, validas, padroes, k):
+    return _minimos_em_blocos(padroes, janelas, validas, k)
+
+
+def _minimos_compartilhados(descricoes, padroes, k):
+    return usar_compartilhado(descricoes, _minimos_trecho, padroes, k)
+
+
+def distancias_minimas(padroes, sequencias, processos=None):
+    """
+    Menor distância de Hamming de cada padrão a alguma janela de cada
+    sequencia, e onde ela acontece (a primeira janela, num empate).
+    :param padroes: lista de padrões de mesmo tamanho k (str, listas de
+    letras) ou um array t x k já codificado
+    :param sequencias: lista de sequencias (str, listas de letras, arrays)
+    :param processos: quantos processos usar (padrão: todos os núcleos)
+    :return (distancias, posicoes): matrizes padrões x sequencias (int8 e
+    int32)
+    :rtype: tuple
+    """
+
+    codigos, k = codificar_padroes(padroes)
+    janelas, validas = codificar_janelas(sequencias, k)
+    processos = numero_de_processos(processos)
+    comparacoes = len(codigos) * janelas.size
+    if processos == 1 or comparacoes < PEDACOS_POR_PROCESSO * \
+            COMPARACOES_POR_BLOCO or len(codigos) < processos:
+        return _minimos_em_blocos(codigos, janelas, validas, k)
+
+    if validas is None:
+        validas = np.ones(janelas.shape, dtype=bool)
+
+    blocos = dividir(len(codigos), processos * PEDACOS_POR_PROCESSO)
+    with ArrayCompartilhado(janelas.shape, janelas.dtype) as codigos_janelas, \
+            ArrayCompartilhado(validas.shape, bool) as mascara, \
+            criar_executor(processos) as executor:
+        codigos_janelas.array[:] = janelas
+        mascara.array[:] = validas
+        partes = list(executor.map(
+            _minimos_compartilhados,
+            repeat([codigos_janelas.descricao, mascara.descricao]),
+            [codigos[a:b] for a, b in blocos], repeat(k)))
+
+    return (np.concatenate([d for d, _ in partes]),
+            np.concatenate([p for _, p in partes]))
+
+
+def _ocorrencias_no_bloco(padroes_alto, padroes_baixo, janelas_alto,
+                          janelas_baixo, validas, d):
+    """
+    Os pares (padrão, janela) com distância até d, comparando blocos de
+    padrões x janelas pequenos o bastante para ficar no cache.
+    :return (indices dos padroes, indices das janelas, distancias)
+    """
+
+    numero_de_padroes = padroes_alto.shape[1]
+    numero_de_janelas = janelas_alto.shape[1]
+    janelas_por_bloco = max(1, min(numero_de_janelas, COMPARACOES_POR_BLOCO))
+    padroes_por_bloco = max(1, COMPARACOES_POR_BLOCO // janelas_por_bloco)
+    formato = (padroes_por_bloco, janelas_por_bloco)
+    x = np.empty(formato, dtype=np.uint8)
+    temporario = np.empty(formato, dtype=np.uint8)
+    distancias = np.empty(formato, dtype=np.uint8)
+
+    achados = []
+    for a in range(0, numero_de_padroes, padroes_por_bloco):
+        padrao = np.s_[:, a:a + padroes_por_bloco, None]
+        quantos = padroes_alto[padrao].shape[1]
+        for b in range(0, numero_de_janelas, janelas_por_bloco):
+            janela = np.s_[:, None, b:b + janelas_por_bloco]
+            partes = np.s_[:quantos, :janelas_alto[janela].shape[2]]
+            x_, t_, dist = x[partes], temporario[partes], distancias[partes]
+
+            for byte in range(len(padroes_alto)):
+                np.bitwise_xor(padroes_alto[padrao][byte],
+                               janelas_alto[janela][byte], out=x_)
+                np.bitwise_xor(padroes_baixo[padrao][byte],
+                               janelas_baixo[janela][byte], out=t_)
+                np.bitwise_or(x_, t_, out=x_)
+                if byte == 0:
+                    contar_bits(x_, dist)
+                else:
+                    dist += contar_bits(x_, t_)
+
+            achou = dist <= d
+            if not achou.any():
+                continue
+            # flatnonzero é bem mais rápido que nonzero num array 2D
+            indices_padroes, indices_janelas = np.divmod(
+                np.flatnonzero(achou), achou.shape[1])
+            achados.append((indices_padroes + a, indices_janelas + b,
+                            dist[indices_padroes, indices_janelas]))
+
+    if validas is not None:
+        achados = [(p[validas[j]], j[validas[j]], dist[validas[j]])
+                   for p, j, dist in achados]
+    return achados
+
+
+def ocorrencias_aproximadas(padroes, sequencia, d, fitas=True,
+                            bases_por_bloco=BASES_POR_BLOCO):
+    """
+    Todas as posições em que algum padrão aparece com até d bases
+    diferentes (distância de Hamming), numa passada só pela sequencia para
+    o lote inteiro de padrões. Cada janela é comparada com cada padrão (e
+    com o complemento reverso dele, para a fita reversa) pelos planos de
+    bits, com popcount. Um padrão palíndromo aparece nas duas fitas.
+    :param padroes: lista de padrões de mesmo tamanho k (str, listas de
+    letras) ou um array t x k já codificado
+    :param sequencia: qualquer formato aceito por kmers.codificar; um
+    genoma.Genoma é lido em blocos
+    :param d: distância máxima
+    :param fitas: se False, só a fita direta
+    :rtype: Ocorrencias
+    """
+
+    if d < 0:
+        raise ValueError(f"d não pode ser negativo, recebido {d}")
+
+    codigos, k = codificar_padroes(padroes)
+    if fitas:
+        codigos = np.concatenate((codigos, complemento_reverso(codigos, k)))
+    padroes_alto, padroes_baixo = _separar_planos(codigos, k)
+
+    indices, posicoes, distancias = [], [], []
+    for inicio, bases in blocos_de_bases(sequencia, bases_por_bloco, k - 1):
+        if len(bases) < k:
+            continue
+        janelas_alto, janelas_baixo = _planos_das_janelas(bases, k)
+        for p, j, dist in _ocorrencias_no_bloco(
+                padroes_alto, padroes_baixo, janelas_alto, janelas_baixo,
+                janelas_validas(bases, k), d):
+            indices.append(p)
+            posicoes.append(j + inicio)
+            distancias.append(dist)
+
+    if not indices:
+        vazio = np.zeros(0, dtype=np.int64)
+        return Ocorrencias(vazio, vazio, vazio.astype(np.int8),
+                           vazio.astype(np.uint8))
+
+    indices = np.concatenate(indices)
+    posicoes = np.concatenate(posicoes).astype(np.int64)
+    distancias = np.concatenate(distancias)
+    numero_de_padroes = len(codigos) // 2 if fitas else len(codigos)
+    fitas = np.where(indices >= numero_de_padroes, FITA_REVERSA,
+                     FITA_DIRETA).astype(np.int8)
+    indices = (indices % numero_de_padroes).astype(np.int64)
+
+    ordem = np.lexsort((posicoes, fitas, indices))
+    return Ocorrencias(indices[ordem], posicoes[ordem], fitas[ordem],
+                       distancias[ordem])
@@ -0,0 +1,409 @@
+"""
+Índice FM de um genoma: quantas vezes e onde um padrão aparece, sem
+percorrer o genoma de novo.
+
+O índice é montado uma vez só a partir do vetor de sufixos (ordenado por
+duplicação de prefixos, só nos grupos ainda empatados):
+
+- a BWT (a base antes de cada sufixo, na ordem dos sufixos);
+- para cada base, um vetor de bits das posições da BWT com ela e as
+  contagens acumuladas a cada 64 posições, de onde sai Occ(base, i) com uma
+  soma e uma contagem de bits;
+- uma amostra do vetor de sufixos: as posições múltiplas de 'taxa' (e as
+  logo depois de um separador), marcadas num outro vetor de bits.
+
+contar(padrao) faz a busca para trás, O(k); localizar(padrao) anda no
+máximo 'taxa' passos de LF por ocorrência até um sufixo amostrado,
+O(k + ocorrências). Bases fora de ACGT (como o 'N' entre os registros de
+um FASTA) viram separadores, então nenhuma ocorrência passa por elas. As
+posições são as de genoma.Genoma.dados. Para a fita reversa, consulte o
+complemento reverso do padrão (kmers.complemento_reverso), como faz
+main.possui_inversa com contar_codigos.
+"""
+
+import os
+
+import numpy as np
+
+from hamming import contar_bits
+from kmers import INVALIDA, codificar, validar_k
+
+# a cada quantas posições do genoma o vetor de sufixos é guardado
+TAXA_DE_AMOSTRAGEM = 32
+
+# símbolos do texto do índice: fim (o menor de todos), as bases ACGT
+# (código de 2 bits + 1) e o separador, no lugar de qualquer outra letra
+_FIM = 0
+_SEPARADOR = INVALIDA + 1
+
+# quantos símbolos (de 3 bits) entram na primeira ordenação dos sufixos
+_SIMBOLOS_INICIAIS = 21
+
+# até quantas ocorrências localizar anda uma de cada vez, com inteiros do
+# Python (para poucas linhas, as operações com arrays custam mais)
+_LINHAS_SEM_VETORIZAR = 64
+
+# código de 2 bits de cada byte ASCII (para os padrões em str)
+_TRADUCAO = bytes(codificar(bytes(range(256))))
+
+
+def _ordenar_sufixos(simbolos):
+    """
+    Vetor de sufixos por duplicação de prefixos. A primeira ordenação usa
+    os primeiros _SIMBOLOS_INICIAIS símbolos de cada sufixo; a cada rodada,
+    só os grupos de sufixos ainda empatados são reordenados, pelo grupo do
+    sufixo h posições à frente, e h dobra.
+    :param simbolos: o texto, terminado por um único _FIM
+    :rtype: numpy.ndarray (int64)
+    """
+
+    n = len(simbolos)
+    chaves = np.zeros(n, dtype=np.uint64)
+    for j in range(_SIMBOLOS_INICIAIS):
+        chaves <<= np.uint64(3)
+        chaves[:max(n - j, 0)] |= simbolos[j:]
+
+    sufixos = np.argsort(chaves, kind='stable')
+    ordenadas = chaves[sufixos]
+    del chaves
+
+    # 'grupo' de cada posição do texto é a primeira linha do seu grupo
+    novo_grupo = np.ones(n + 1, dtype=bool)
+    novo_grupo[1:n] = ordenadas[1:] != ordenadas[:-1]
+    del ordenadas
+    linhas = np.arange(n)
+    grupo = np.empty(n, dtype=np.int64)
+    grupo[sufixos] = np.maximum.accumulate(np.where(novo_grupo[:n], linhas,
+                                                    0))
+
+    h = _SIMBOLOS_INICIAIS
+    while True:
+        # linhas de grupos com mais de um sufixo
+        pendentes = np.flatnonzero(~(novo_grupo[:n] & novo_grupo[1:]))
+        if len(pendentes) == 0:
+            return sufixos
+
+        posicoes = sufixos[pendentes]
+        seguintes = posicoes + h
+        chave = np.where(seguintes < n,
+                         grupo[np.minimum(seguintes, n - 1)] + 1, 0)
+        chave += grupo[posicoes] * (n + 1)
+        ordem = np.argsort(chave, kind='stable')
+        chave = chave[ordem]
+
+        inicio = np.ones(len(pendentes), dtype=bool)
+        inicio[1:] = chave[1:] != chave[:-1]
+        novo_grupo[pendentes] = inicio
+        sufixos[pendentes] = posicoes[ordem]
+        grupo[sufixos[pendentes]] = np.maximum.accumulate(
+            np.where(inicio, pendentes, 0))
+        h *= 2
+
+
+def _vetor_de_bits(marcas):
+    """
+    :return (palavras, acumulados): os bits em palavras de 64 (o bit i da
+    palavra w é a posição 64w + i) e quantos bits 1 vêm antes de cada
+    palavra
+    :rtype: tuple
+    """
+
+    completo = np.zeros((len(marcas) // 64 + 1) * 64, dtype=bool)
+    completo[:len(marcas)] = marcas
+    palavras = np.packbits(completo, bitorder='little').view('<u8')
+    por_palavra = contar_bits(palavras, np.empty(len(palavras),
+                                                 dtype=np.uint8))
+    acumulados = np.zeros(len(palavras), dtype=np.int64)
+    np.cumsum(por_palavra[:-1], out=acumulados[1:])
+    return palavras, acumulados
+
+
+def _rank(palavras, acumulados, posicoes):
+    """
+    Quantos bits 1 vêm antes de cada posição (vetorizado).
+    """
+
+    palavra = posicoes >> 6
+    mascara = (np.uint64(1) << (posicoes & 63).astype(np.uint64)) - \
+        np.uint64(1)
+    antes = palavras[palavra] & mascara
+    return acumulados[palavra] + contar_bits(
+        antes, np.empty(antes.shape, dtype=np.uint8))
+
+
+def _bases_do_padrao(padrao):
+    """
+    As bases de um padrão, como lista de códigos de 2 bits.
+    """
+
+    if isinstance(padrao, str):
+        bases = list(padrao.encode('ascii', 'replace').translate(_TRADUCAO))
+    else:
+        bases = codificar(padrao).tolist()
+    # a busca é base a base, então não há limite de tamanho (só
+    # contar_codigos usa os códigos de 2 bits, de até 32 bases)
+    if not bases:
+        raise ValueError("o padrão não pode ser vazio")
+    if INVALIDA in bases:
+        raise ValueError("os padrões só podem ter as bases ACGT")
+    return bases
+
+
+class IndiceFM(object):
+    """
+    Índice FM de uma sequencia (ver o começo do módulo). Monte com
+    IndiceFM.construir, ou carregue um salvo com IndiceFM.carregar.
+    """
+
+    __slots__ = ('bwt', 'anteriores', 'palavras', 'acumulados',
+                 'amostradas', 'acumulados_amostradas', 'amostras', 'taxa',
+                 '_listas')
+
+    def __init__(self, bwt, anteriores, palavras, acumulados, amostradas,
+                 acumulados_amostradas, amostras, taxa):
+        self.bwt = bwt
+        # quantos símbolos do texto são menores que cada base
+        self.anteriores = anteriores
+        self.palavras = palavras
+        self.acumulados = acumulados
+        self.amostradas = amostradas
+        self.acumulados_amostradas = acumulados_amostradas
+        self.amostras = amostras
+        self.taxa = taxa
+        self._listas = None
+
+    @classmethod
+    def construir(cls, sequencia, taxa=TAXA_DE_AMOSTRAGEM):
+        """
+        :param sequencia: qualquer formato aceito por kmers.codificar,
+        inclusive genoma.Genoma
+        :param taxa: a cada quantas posições o vetor de sufixos é guardado
+        (mais alta, índice menor e localizar mais lento)
+        :rtype: IndiceFM
+        """
+
+        bases = codificar(sequencia)
+        simbolos = np.empty(len(bases) + 1, dtype=np.uint8)
+        np.add(bases, 1, out=simbolos[:-1])
+        simbolos[-1] = _FIM
+
+        sufixos = _ordenar_sufixos(simbolos)
+        bwt = simbolos[sufixos - 1]
+
+        contagens = np.bincount(simbolos, minlength=_SEPARADOR + 1)
+        anteriores = np.cumsum(contagens)[:4]
+
+        planos = [_vetor_de_bits(bwt == base + 1) for base in range(4)]
+        palavras = np.stack([p for p, _ in planos])
+        acumulados = np.stack([a for _, a in planos])
+
+        # também é amostrado todo sufixo que começa depois do fim ou de um
+        # separador, assim localizar nunca anda por eles
+        amostradas = (sufixos % taxa == 0) | (bwt == _FIM) | \
+            (bwt == _SEPARADOR)
+        palavras_amostradas, acumulados_amostradas = \
+            _vetor_de_bits(amostradas)
+
+        return cls(bwt, anteriores, palavras, acumulados, palavras_amostradas,
+                   acumulados_amostradas, sufixos[amostradas], taxa)
+
+    @classmethod
+    def carregar(cls, caminho):
+        """
+        Carrega um índice salvo por 'salvar'.
+        :rtype: IndiceFM
+        """
+
+        with np.load(caminho) as arquivo:
+            return cls(arquivo['bwt'], arquivo['anteriores'],
+                       arquivo['palavras'], arquivo['acumulados'],
+                       arquivo['amostradas'],
+                       arquivo['acumulados_amostradas'], arquivo['amostras'],
+                       int(arquivo['taxa']))
+
+    def salvar(self, caminho, **extras):
+        """
+        Salva o índice num arquivo .npz.
+        :param extras: arrays a mais guardados junto (ver indice_do_genoma)
+        """
+
+        with open(caminho, 'wb') as arquivo:
+            np.savez(arquivo, bwt=self.bwt, anteriores=self.anteriores,
+                     palavras=self.palavras, acumulados=self.acumulados,
+                     amostradas=self.amostradas,
+                     acumulados_amostradas=self.acumulados_amostradas,
+                     amostras=self.amostras, taxa=self.taxa, **extras)
+
+    def __len__(self):
+        """
+        Tamanho da sequencia indexada.
+        """
+
+        return len(self.bwt) - 1
+
+    def _tabelas(self):
+        """
+        Os vetores de bits como listas de inteiros do Python, para as
+        consultas de um padrão só (um passo de cada vez, sem o custo de
+        uma operação com arrays a cada passo).
+        """
+
+        if self._listas is None:
+            self._listas = (self.palavras.tolist(), self.acumulados.tolist(),
+                            self.anteriores.tolist(),
+                            self.amostradas.tolist(),
+                            self.acumulados_amostradas.tolist())
+        return self._listas
+
+    def _intervalo(self, bases):
+        """
+        Busca para trás de um padrão: o intervalo [inicio, fim) das linhas
+        (sufixos ordenados) que começam com ele.
+        """
+
+        palavras, acumulados, anteriores, _, _ = self._tabelas()
+        inicio, fim = 0, len(self.bwt)
+        for base in reversed(bases):
+            bits, antes = palavras[base], acumulados[base]
+            inicio = anteriores[base] + antes[inicio >> 6] + \
+                (bits[inicio >> 6] & ((1 << (inicio & 63)) - 1)).bit_count()
+            fim = anteriores[base] + antes[fim >> 6] + \
+                (bits[fim >> 6] & ((1 << (fim & 63)) - 1)).bit_count()
+            if inicio >= fim:
+                return 0, 0
+        return inicio, fim
+
+    def _ocorrencias(self, base, linhas):
+        """
+        Occ(base, linha) vetorizado: quantas vezes cada base aparece na BWT
+        antes de cada linha.
+        """
+
+        palavra = linhas >> 6
+        mascara = (np.uint64(1) << (linhas & 63).astype(np.uint64)) - \
+            np.uint64(1)
+        antes = self.palavras[base, palavra] & mascara
+        return self.acumulados[base, palavra] + contar_bits(
+            antes, np.empty(antes.shape, dtype=np.uint8))
+
+    def _posicao(self, linha):
+        """
+        A posição na sequencia de uma linha: anda para trás pela BWT (LF)
+        até uma linha amostrada.
+        """
+
+        palavras, acumulados, anteriores, amostradas, acumulados_amostradas = \
+            self._tabelas()
+        passos = 0
+        while not amostradas[linha >> 6] >> (linha & 63) & 1:
+            base = int(self.bwt[linha]) - 1
+            linha = anteriores[base] + acumulados[base][linha >> 6] + \
+                (palavras[base][linha >> 6] &
+                 ((1 << (linha & 63)) - 1)).bit_count()
+            passos += 1
+
+        indice = acumulados_amostradas[linha >> 6] + \
+            (amostradas[linha >> 6] & ((1 << (linha & 63)) - 1)).bit_count()
+        return int(self.amostras[indice]) + passos
+
+    def _posicoes(self, linhas):
+        """
+        A posição na sequencia de cada linha, como em _posicao, mas com
+        todas as linhas andando ao mesmo tempo.
+        """
+
+        if len(linhas) <= _LINHAS_SEM_VETORIZAR:
+            return np.array([self._posicao(linha) for linha in linhas],
+                            dtype=np.int64)
+
+        linhas = np.asarray(linhas, dtype=np.int64)
+        posicoes = np.empty(len(linhas), dtype=np.int64)
+        pendentes = np.arange(len(linhas))
+        passos = 0
+        while len(pendentes):
+            amostradas = (self.amostradas[linhas >> 6] >>
+                          (linhas & 63).astype(np.uint64)) & np.uint64(1)
+            amostradas = amostradas.astype(bool)
+            indices = _rank(self.amostradas, self.acumulados_amostradas,
+                            linhas[amostradas])
+            posicoes[pendentes[amostradas]] = self.amostras[indices] + passos
+
+            linhas, pendentes = linhas[~amostradas], pendentes[~amostradas]
+            base = self.bwt[linhas].astype(np.intp) - 1
+            linhas = self.anteriores[base] + self._ocorrencias(base, linhas)
+            passos += 1
+
+        return posicoes
+
+    def contar(self, padrao):
+        """
+        Quantas vezes o padrão aparece na sequencia.
+        :param padrao: str, lista de letras, Sequencia ou array de bases
+        :rtype: int
+        """
+
+        inicio, fim = self._intervalo(_bases_do_padrao(padrao))
+        return fim - inicio
+
+    def localizar(self, padrao):
+        """
+        Onde o padrão aparece na sequencia.
+        :return as posições de início, em ordem crescente
+        :rtype: numpy.ndarray (int64)
+        """
+
+        inicio, fim = self._intervalo(_bases_do_padrao(padrao))
+        return np.sort(self._posicoes(range(inicio, fim)))
+
+    def contar_codigos(self, codigos, k):
+        """
+        Quantas vezes cada kmer aparece, para muitos kmers de uma vez (a
+        busca para trás é feita em todos ao mesmo tempo).
+        :param codigos: códigos de 2k bits (ver kmers.py)
+        :rtype: numpy.ndarray (int64)
+        """
+
+        validar_k(k)
+        codigos = np.atleast_1d(np.asarray(codigos, dtype=np.uint64))
+        inicio = np.zeros(len(codigos), dtype=np.int64)
+        fim = np.full(len(codigos), len(self.bwt), dtype=np.int64)
+        for deslocamento in range(0, 2 * k, 2):
+            base = ((codigos >> np.uint64(deslocamento)) &
+                    np.uint64(3)).astype(np.intp)
+            inicio = self.anteriores[base] + self._ocorrencias(base, inicio)
+            fim = self.anteriores[base] + self._ocorrencias(base, fim)
+        return np.maximum(fim - inicio, 0)
+
+
+def caminho_do_indice(caminho_genoma):
+    return caminho_genoma + '.fm.npz'
+
+
+def indice_do_genoma(genoma, caminho=None, taxa=TAXA_DE_AMOSTRAGEM):
+    """
+    O índice de um genoma.Genoma, montado uma vez só por arquivo: ele é
+    salvo ao lado do genoma (ou em 'caminho') e carregado de lá enquanto o
+    arquivo do genoma tiver o mesmo tamanho e a mesma data de modificação.
+    :rtype: IndiceFM
+    """
+
+    if caminho is None:
+        caminho = caminho_do_indice(genoma.caminho)
+    informacoes = os.stat(genoma.caminho)
+    origem = np.array([informacoes.st_size, informacoes.st_mtime_ns, taxa],
+                      dtype=np.int64)
+
+    if os.path.exists(caminho):
+        with np.load(caminho) as arquivo:
+            atualizado = 'origem' in arquivo and \
+                np.array_equal(arquivo['origem'], origem)
+        if atualizado:
+            return IndiceFM.carregar(caminho)
+
+    indice = IndiceFM.construir(genoma, taxa)
+    # escreve num temporário e renomeia: outros processos (ver lote.py)
+    # podem estar lendo o mesmo índice
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    indice.salvar(temporario, origem=origem)
+    os.replace(temporario, caminho)
+    return indice
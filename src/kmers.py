@@ -0,0 +1,378 @@
+"""
+Motor de contagem de k-mers com codificação de 2 bits por base.
+
+Cada base vira um inteiro de 2 bits (A=0, C=1, G=2, T=3), então um k-mer de
+tamanho k cabe em 2k bits de um inteiro sem sinal de 64 bits (k <= 32). Como a
+codificação segue a ordem alfabética, ordenar os códigos é o mesmo que ordenar
+as strings dos k-mers.
+"""
+
+import numpy as np
+
+BASES = 'acgt'
+INVALIDA = 4
+K_MAXIMO = 32
+
+# até esse k o vetor de contagem denso (4^k posições) ainda é pequeno o
+# bastante para usar bincount; acima disso, ordenar os códigos sai mais barato
+K_MAXIMO_BINCOUNT = 11
+
+_TABELA = np.full(256, INVALIDA, dtype=np.uint8)
+for _i, _base in enumerate(BASES):
+    _TABELA[ord(_base)] = _i
+    _TABELA[ord(_base.upper())] = _i
+
+
+def codificar(sequencia):
+    """
+    Transforma uma sequencia de DNA em um array de bases de 2 bits.
+    Aceita str, bytes, mmap, lista de caracteres, array de bytes ASCII ou
+    qualquer objeto com __array__ (como genoma.Genoma).
+    Qualquer caractere fora de ACGT (maiúsculo ou minúsculo) vira INVALIDA.
+    Arrays que já estão codificados (valores de 0 a 4) são devolvidos como
+    estão.
+    :param sequencia: o código genético
+    :rtype: numpy.ndarray (uint8)
+    """
+
+    if hasattr(sequencia, '__array__') and \
+            not isinstance(sequencia, np.ndarray):
+        # ex.: genoma.Genoma, que já entrega as bases codificadas
+        sequencia = np.asarray(sequencia)
+
+    if isinstance(sequencia, str):
+        dados = np.frombuffer(sequencia.encode('ascii', 'replace'),
+                              dtype=np.uint8)
+    elif isinstance(sequencia, (list, tuple)):
+        dados = np.frombuffer(''.join(sequencia).encode('ascii', 'replace'),
+                              dtype=np.uint8)
+    elif isinstance(sequencia, np.ndarray):
+        dados = sequencia.astype(np.uint8, copy=False)
+        if dados.size == 0 or dados.max() <= INVALIDA:
+            return dados
+    else:
+        dados = np.frombuffer(sequencia, dtype=np.uint8)
+
+    return _TABELA[dados]
+
+
+def blocos_de_bases(sequencia, tamanho, sobreposicao=0):
+    """
+    Percorre as bases (codificadas) da sequencia em blocos de 'tamanho'
+    bases, cada um estendido por mais 'sobreposicao' bases dentro do
+    próximo (use k - 1 para cada janela de tamanho k cair em um único
+    bloco). Um genoma.Genoma é lido em pedaços (ver Genoma.blocos), sem
+    ser carregado inteiro.
+    :return gerador de (posicao de inicio, bases)
+    """
+
+    if hasattr(sequencia, 'blocos'):
+        for inicio, pedaco in sequencia.blocos(tamanho, sobreposicao):
+            yield inicio, codificar(pedaco)
+        return
+
+    bases = codificar(sequencia)
+    for inicio in range(0, max(len(bases) - sobreposicao, 1), tamanho):
+        yield inicio, bases[inicio:inicio + tamanho + sobreposicao]
+
+
+def validar_k(k):
+    if not 1 <= k <= K_MAXIMO:
+        raise ValueError(f"k deve estar entre 1 e {K_MAXIMO}, recebido {k}")
+
+
+def janelas_validas(bases, k):
+    """
+    Retorna uma máscara dizendo quais janelas de tamanho k não contém nenhuma
+    base inválida, ou None quando todas são válidas.
+    :rtype: numpy.ndarray (bool) ou None
+    """
+
+    invalidas = bases == INVALIDA
+    if not invalidas.any():
+        return None
+
+    acumulado = np.concatenate(([0], np.cumsum(invalidas, dtype=np.int64)))
+    numero_de_janelas = len(bases) - k + 1
+    return acumulado[k:k + numero_de_janelas] == acumulado[:numero_de_janelas]
+
+
+def _codigos_deslizantes(bases, k, numero_de_janelas):
+    """
+    Código de 2k bits das primeiras 'numero_de_janelas' janelas, sem olhar
+    para bases inválidas (elas entram como se fossem T).
+    """
+
+    codigos = np.zeros(numero_de_janelas, dtype=np.uint64)
+    bases_2_bits = (bases & 3).astype(np.uint64)
+    for j in range(k):
+        codigos <<= np.uint64(2)
+        codigos |= bases_2_bits[j:j + numero_de_janelas]
+
+    return codigos
+
+
+def _codigos_em(bases, inicios, k):
+    """
+    Código de 2k bits das janelas que começam nas posições 'inicios'.
+    """
+
+    codigos = np.zeros(len(inicios), dtype=np.uint64)
+    for j in range(k):
+        codigos <<= np.uint64(2)
+        codigos |= (bases[inicios + j] & 3).astype(np.uint64)
+
+    return codigos
+
+
+def _bases_em_comum(ordenados, k):
+    """
+    Para cada código (de k bases) de um vetor ordenado, quantas bases iniciais
+    ele tem em comum com o código anterior. O primeiro recebe 0.
+    :rtype: numpy.ndarray (uint8)
+    """
+
+    diferenca = ordenados[1:] ^ ordenados[:-1]
+    # número de bits significativos da diferença, separado em duas metades de
+    # 32 bits para a conversão em float ser exata
+    _, bits_altos = np.frexp((diferenca >> np.uint64(32)).astype(np.float64))
+    _, bits_baixos = np.frexp(
+        (diferenca & np.uint64(0xffffffff)).astype(np.float64))
+    bits = np.where(bits_altos > 0, bits_altos + 32, bits_baixos)
+
+    comum = np.empty(len(ordenados), dtype=np.uint8)
+    comum[0] = 0
+    comum[1:] = k - (bits + 1) // 2
+    return comum
+
+
+def codigos_kmers(bases, k):
+    """
+    Gera o código de 2k bits de cada janela de tamanho k das bases, com a
+    atualização deslizante (desloca 2 bits e soma a próxima base). Janelas com
+    bases inválidas são descartadas.
+    :param bases: array de bases já codificado (ver 'codificar')
+    :param k: tamanho dos kmers
+    :rtype: numpy.ndarray (uint64)
+    """
+
+    validar_k(k)
+    numero_de_janelas = len(bases) - k + 1
+    if numero_de_janelas <= 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    codigos = _codigos_deslizantes(bases, k, numero_de_janelas)
+    validas = janelas_validas(bases, k)
+    if validas is not None:
+        codigos = codigos[validas]
+
+    return codigos
+
+
+def contar_codigos(codigos, k):
+    """
+    Conta quantas vezes cada código aparece. Para k pequeno usa bincount num
+    vetor denso de 4^k posições, para k grande ordena e agrupa (unique).
+    :return (codigos distintos em ordem crescente, contagens)
+    :rtype: tuple
+    """
+
+    if k <= K_MAXIMO_BINCOUNT:
+        contagens = np.bincount(codigos.astype(np.intp), minlength=4 ** k)
+        presentes = np.flatnonzero(contagens)
+        return presentes.astype(np.uint64), contagens[presentes]
+
+    if len(codigos) == 0:
+        return codigos, np.zeros(0, dtype=np.int64)
+
+    ordenados = np.sort(codigos)
+    inicios = np.flatnonzero(np.concatenate(
+        ([True], ordenados[1:] != ordenados[:-1])))
+    contagens = np.diff(np.append(inicios, len(ordenados)))
+    return ordenados[inicios], contagens
+
+
+def contar_kmers(sequencia, k):
+    """
+    Conta todos os kmers de tamanho k da sequencia.
+    :return (codigos distintos em ordem crescente, contagens)
+    :rtype: tuple
+    """
+
+    return contar_codigos(codigos_kmers(codificar(sequencia), k), k)
+
+
+def contar_kmers_multiplos(sequencia, ks):
+    """
+    Conta os kmers de vários tamanhos numa única passada pela sequencia.
+    As bases são codificadas uma só vez e é gerado, para cada posição, o
+    código do kmer de tamanho máximo que começa nela (o final é completado
+    com A). Esses códigos são ordenados uma única vez: como o prefixo de um
+    código ordenado também fica ordenado, a contagem de cada k é só um
+    agrupamento linear sobre o mesmo vetor, sem reordenar nem reler o genoma.
+    :param sequencia: o código genético
+    :param ks: os tamanhos de kmer desejados (ex.: range(7, 10))
+    :return dicionario {k: (codigos distintos em ordem crescente, contagens)}
+    :rtype: dict
+    """
+
+    ks = sorted(set(ks))
+    k_maximo = ks[-1]
+    for k in ks:
+        validar_k(k)
+
+    bases = codificar(sequencia)
+    tamanho = len(bases)
+    if tamanho == 0:
+        vazio = np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+        return {k: vazio for k in ks}
+
+    completo = np.concatenate((bases, np.zeros(k_maximo - 1, dtype=np.uint8)))
+    prefixos = np.sort(_codigos_deslizantes(completo, k_maximo, tamanho))
+    comum = _bases_em_comum(prefixos, k_maximo)
+
+    # as janelas que passam do fim do genoma ou tocam numa base inválida
+    # entraram na ordenação (completadas com A), mas não podem ser contadas
+    # para os k maiores que o trecho válido que elas têm
+    barreiras = np.append(np.flatnonzero(bases == INVALIDA), tamanho)
+    marcas = np.zeros(tamanho + 2, dtype=np.int64)
+    np.add.at(marcas, np.maximum(barreiras - k_maximo + 1, 0), 1)
+    np.add.at(marcas, barreiras + 1, -1)
+    inicios_curtos = np.flatnonzero(np.cumsum(marcas[:tamanho]) > 0)
+    proxima = barreiras[np.searchsorted(barreiras, inicios_curtos)]
+    alcance_curto = proxima - inicios_curtos
+    codigos_curtos = _codigos_em(completo, inicios_curtos, k_maximo)
+    posicao_curta = np.searchsorted(prefixos, codigos_curtos)
+
+    resultado = {}
+    for k in ks:
+        inicios = np.flatnonzero(comum < k)
+        contagens = np.diff(np.append(inicios, tamanho))
+
+        descartar = posicao_curta[alcance_curto < k]
+        if len(descartar):
+            grupos = np.searchsorted(inicios, descartar, 'right') - 1
+            contagens -= np.bincount(grupos, minlength=len(inicios))
+            manter = contagens > 0
+            inicios, contagens = inicios[manter], contagens[manter]
+
+        deslocamento = np.uint64(2 * (k_maximo - k))
+        resultado[k] = prefixos[inicios] >> deslocamento, contagens
+
+    return resultado
+
+
+def descontar(contagem, excesso):
+    """
+    Tira de uma contagem as janelas de 'excesso', que foram contadas nela
+    (como as janelas da emenda entre dois trechos, que o trecho seguinte
+    também conta). As duas têm códigos em ordem crescente; os códigos que
+    ficam com zero saem.
+    :return (codigos distintos em ordem crescente, contagens)
+    :rtype: tuple
+    """
+
+    codigos, contagens = contagem
+    indices = np.searchsorted(codigos, excesso[0])
+    contagens = contagens.copy()
+    contagens[indices] -= excesso[1]
+    restantes = contagens > 0
+    return codigos[restantes], contagens[restantes]
+
+
+def contagens_de(contagem, procurados):
+    """
+    Quantas vezes cada código de 'procurados' aparece numa contagem (zero
+    para os que não estão nela), por busca binária: a contagem pode ser uma
+    tabela mapeada do disco (ver resultados.carregar_contagem).
+    :rtype: numpy.ndarray (int64)
+    """
+
+    codigos, contagens = contagem
+    procurados = np.asarray(procurados, dtype=np.uint64)
+    repeticoes = np.zeros(len(procurados), dtype=np.int64)
+    if len(codigos):
+        posicoes = np.minimum(np.searchsorted(codigos, procurados),
+                              len(codigos) - 1)
+        achados = codigos[posicoes] == procurados
+        repeticoes[achados] = contagens[posicoes[achados]]
+    return repeticoes
+
+
+def complemento_reverso(codigos, k):
+    """
+    Calcula o complemento reverso de códigos de 2k bits direto no inteiro:
+    complementar é inverter os bits (A=00 <-> T=11, C=01 <-> G=10) e reverter
+    é inverter a ordem dos grupos de 2 bits.
+    :param codigos: um código (int) ou um array de códigos
+    :rtype: numpy.uint64 ou numpy.ndarray (uint64)
+    """
+
+    x = ~np.asarray(codigos, dtype=np.uint64)
+    x = (((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+         | ((x & np.uint64(0x3333333333333333)) << np.uint64(2)))
+    x = (((x >> np.uint64(4)) & np.uint64(0x0f0f0f0f0f0f0f0f))
+         | ((x & np.uint64(0x0f0f0f0f0f0f0f0f)) << np.uint64(4)))
+    x = x.byteswap()
+    return x >> np.uint64(64 - 2 * k)
+
+
+def contar_kmers_canonicos(sequencia, k):
+    """
+    Conta os kmers no modo canônico: cada janela é contada uma única vez sob
+    min(kmer, complemento reverso do kmer), guardando separadamente quantas
+    vezes o canônico apareceu na fita direta e quantas apareceu como
+    complemento reverso. Palíndromos (kmer igual ao seu complemento reverso)
+    contam sempre como diretos.
+    :return (canonicos em ordem crescente, contagens diretas, contagens
+    reversas)
+    :rtype: tuple
+    """
+
+    codigos = codigos_kmers(codificar(sequencia), k)
+    inversos = complemento_reverso(codigos, k)
+    canonicos = np.minimum(codigos, inversos)
+    reversos = codigos > inversos
+    del codigos, inversos
+
+    canonicos_distintos, totais = contar_codigos(canonicos, k)
+    so_reversos, contagens_reversas = contar_codigos(canonicos[reversos], k)
+
+    reversas = np.zeros_like(totais)
+    reversas[np.searchsorted(canonicos_distintos, so_reversos)] = \
+        contagens_reversas
+    return canonicos_distintos, totais - reversas, reversas
+
+
+def mais_frequentes(codigos, contagens):
+    """
+    Acha a maior repetição e os códigos que a atingem.
+    :return (codigos mais frequentes, maior repeticao)
+    :rtype: tuple
+    """
+
+    if len(contagens) == 0:
+        return codigos[:0], 0
+
+    maior_repeticao = int(contagens.max())
+    return codigos[contagens == maior_repeticao], maior_repeticao
+
+
+def decodificar(codigos, k, maiusculas=False):
+    """
+    Transforma códigos de 2k bits de volta em strings de DNA.
+    :param codigos: um código (int) ou um array de códigos
+    :return uma string, ou uma lista de strings se receber um array
+    """
+
+    unico = np.ndim(codigos) == 0
+    codigos = np.atleast_1d(np.asarray(codigos, dtype=np.uint64))
+    deslocamentos = np.arange(2 * (k - 1), -1, -2, dtype=np.uint64)
+    indices = (codigos[:, None] >> deslocamentos) & np.uint64(3)
+
+    alfabeto = BASES.upper() if maiusculas else BASES
+    letras = np.frombuffer(alfabeto.encode('ascii'), dtype=np.uint8)
+    texto = letras[indices].tobytes().decode('ascii')
+    kmers = [texto[i:i + k] for i in range(0, len(texto), k)]
+
+    return kmers[0] if unico else kmers
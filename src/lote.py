@@ -0,0 +1,297 @@
+"""
+Análise de vários genomas de uma vez, sem perguntar nada (para rodar por
+um agendador).
+
+O manifesto é um TSV com cabeçalho: a coluna 'genoma' (o caminho do
+arquivo, relativo ao manifesto) é obrigatória, e as colunas opcionais
+'nome', 'k', 'd', 'L' e 't' trocam, só para aquele genoma, os valores
+passados na linha de comando. Os valores de k, d, L e t podem ser listas
+('1,2') ou intervalos ('7-9'). O nome (padrão: o do arquivo, sem a
+extensão) é a pasta dos resultados do genoma e não pode se repetir (para
+analisar um genoma com vários valores, use listas numa linha só). Exemplo:
+
+    genoma                  nome    d
+    dna/vibrio.fasta        vibrio  1,2
+    dna/ecoli.fasta
+
+Cada genoma gera uma tarefa com todos os seus valores: a contagem (de todos
+os k de uma vez), as sequências, as inversas e a ori são feitas uma vez só,
+e só as mutações e os clumps são repetidos para cada d e cada (L, t) (ver
+main.analisar). As tarefas rodam num ProcessPoolExecutor com um processo
+por núcleo, dos maiores genomas para os menores; como cada genoma tem a sua
+pasta e uma tarefa só, duas tarefas nunca escrevem o mesmo arquivo. Os
+resultados de um genoma vão para <saida>/<nome>, com um resumo da tarefa (o
+tempo de cada etapa); uma tarefa cujo resumo é mais novo que o genoma já
+está em dia e é pulada. O lote inteiro é resumido em <saida>/lote.tsv, com
+a vazão em genomas por hora.
+
+    python lote.py manifesto.tsv -k 7-9 -d 1,2 -o resultados
+"""
+
+import argparse
+import os
+import sys
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import CACHE, RESULTADOS, analisar, regiao_padrao
+from paralelo import numero_de_processos
+from resultados import carregar_tsv, salvar_tsv
+
+FEITA = "feita"
+EM_DIA = "em dia"
+ERRO = "erro"
+
+Tarefa = namedtuple('Tarefa', ['nome', 'genoma', 'ks', 'ds', 'Ls', 'ts',
+                               'diretorio'])
+Tarefa.__doc__ = """
+A análise (main.analisar) de um genoma com todos os valores de k, d, L e t
+pedidos para ele, com os resultados em 'diretorio'.
+"""
+
+Execucao = namedtuple('Execucao', ['tarefa', 'situacao', 'segundos',
+                                   'mensagem'])
+Execucao.__doc__ = """
+Como terminou uma tarefa: FEITA, EM_DIA (pulada) ou ERRO (com a mensagem),
+e quanto tempo levou.
+"""
+
+
+def ler_valores(texto):
+    """
+    Os inteiros de '7-9', '1,2' ou '3' (e combinações como '1,4-6').
+    :rtype: list
+    """
+
+    valores = []
+    for parte in texto.split(','):
+        inicio, _, fim = parte.strip().partition('-')
+        valores.extend(range(int(inicio), int(fim or inicio) + 1))
+    if not valores:
+        raise ValueError(f"nenhum valor em '{texto}'")
+    return valores
+
+
+def escrever_valores(valores):
+    """
+    O inverso de ler_valores, sem intervalos: '1,2'.
+    """
+
+    return ",".join(str(valor) for valor in valores)
+
+
+def caminho_do_resumo(tarefa):
+    # com todos os valores no nome: 'k=7,9' não está em dia só porque
+    # 'k=7,8,9' está
+    return os.path.join(tarefa.diretorio, "resumo_k={}_d={}_L={}_t={}.tsv"
+                        .format(*(escrever_valores(valores) for valores in
+                                  (tarefa.ks, tarefa.ds, tarefa.Ls,
+                                   tarefa.ts))))
+
+
+def em_dia(tarefa):
+    """
+    Se a tarefa já foi feita depois da última mudança no genoma.
+    """
+
+    try:
+        return os.path.getmtime(caminho_do_resumo(tarefa)) >= \
+            os.path.getmtime(tarefa.genoma)
+    except OSError:
+        return False
+
+
+def ler_manifesto(caminho, ks, ds, Ls, ts, saida=RESULTADOS):
+    """
+    As tarefas de um manifesto (ver o começo do módulo).
+    :param ks, ds, Ls, ts: os valores usados quando o manifesto não tem a
+    coluna
+    :rtype: list
+    """
+
+    cabecalho, linhas = carregar_tsv(caminho)
+    if 'genoma' not in cabecalho:
+        raise ValueError(f"{caminho}: o manifesto precisa da coluna 'genoma'")
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    padroes = {'k': ks, 'd': ds, 'L': Ls, 't': ts}
+
+    tarefas, nomes = [], set()
+    for linha in linhas:
+        if not any(campo.strip() for campo in linha):
+            continue
+        campos = {coluna: campo.strip()
+                  for coluna, campo in zip(cabecalho, linha) if campo.strip()}
+        genoma = os.path.join(pasta, campos['genoma'])
+        nome = campos.get('nome') or \
+            os.path.splitext(os.path.basename(genoma))[0]
+        # o nome é a pasta dos resultados: duas tarefas com o mesmo nome
+        # escreveriam uma por cima da outra
+        if nome in nomes:
+            raise ValueError(f"{caminho}: o nome '{nome}' aparece em mais de "
+                             f"uma linha; dê nomes diferentes na coluna "
+                             f"'nome' ou junte os valores numa linha só")
+        nomes.add(nome)
+        valores = {coluna: ler_valores(campos[coluna]) if coluna in campos
+                   else padrao for coluna, padrao in padroes.items()}
+        tarefas.append(Tarefa(nome, genoma,
+                              *(sorted(set(valores[coluna]))
+                                for coluna in ('k', 'd', 'L', 't')),
+                              os.path.join(saida, nome)))
+    return tarefas
+
+
+def rodar(tarefa, forcar=False, cache=CACHE, processos=1, opcoes=None):
+    """
+    Roda uma tarefa (se ela não estiver em dia) e salva o seu resumo, com o
+    tempo de cada etapa. Um erro não interrompe o lote: ele é devolvido na
+    Execucao.
+    :param processos: processos de cada tarefa (ver main.analisar)
+    :param opcoes: outros argumentos de main.analisar (como 'memoria')
+    :rtype: Execucao
+    """
+
+    if not forcar and em_dia(tarefa):
+        return Execucao(tarefa, EM_DIA, 0.0, "")
+
+    inicio = time.perf_counter()
+    try:
+        tempos = analisar(tarefa.genoma, tarefa.ds, tarefa.ks, tarefa.Ls,
+                          tarefa.ts, tarefa.diretorio, cache, processos,
+                          **(opcoes or {}))
+    except Exception:
+        return Execucao(tarefa, ERRO, time.perf_counter() - inicio,
+                        traceback.format_exc().strip().splitlines()[-1])
+    segundos = time.perf_counter() - inicio
+
+    # as etapas de todos os k (ori e contagem) primeiro, e o total no fim
+    etapas = sorted(tempos, key=lambda chave: (chave[1] or 0, chave[0]))
+    linhas = [(etapa, '' if k is None else k, round(tempos[etapa, k], 4))
+              for etapa, k in etapas] + [("total", '', round(segundos, 4))]
+    salvar_tsv(caminho_do_resumo(tarefa), ("etapa", "k", "segundos"),
+               list(zip(*linhas)))
+    return Execucao(tarefa, FEITA, segundos, "")
+
+
+def rodar_lote(tarefas, processos=None, forcar=False, cache=CACHE,
+               saida=RESULTADOS, opcoes=None):
+    """
+    Roda as tarefas num pool de processos (padrão: um por núcleo), as dos
+    maiores genomas primeiro, e salva o resumo do lote em <saida>/lote.tsv.
+    :param opcoes: outros argumentos de main.analisar, iguais para todas as
+    tarefas; a 'memoria' é a do lote inteiro, dividida entre as tarefas
+    que rodam ao mesmo tempo
+    :return as execuções, na ordem das tarefas
+    :rtype: list
+    """
+
+    processos = numero_de_processos(processos)
+    # com várias tarefas ao mesmo tempo, cada uma fica num processo só; uma
+    # tarefa sozinha usa todos
+    paralelo = processos > 1 and len(tarefas) > 1
+    por_tarefa = 1 if paralelo else None
+    opcoes = dict(opcoes or {})
+    if paralelo and opcoes.get('memoria') is not None:
+        opcoes['memoria'] = max(1, opcoes['memoria'] // processos)
+    ordem = sorted(range(len(tarefas)), reverse=True,
+                   key=lambda i: _tamanho(tarefas[i].genoma))
+
+    inicio = time.perf_counter()
+    execucoes = [None] * len(tarefas)
+    if paralelo:
+        with ProcessPoolExecutor(processos) as executor:
+            futuros = {executor.submit(rodar, tarefas[i], forcar, cache,
+                                       por_tarefa, opcoes): i for i in ordem}
+            for futuro in as_completed(futuros):
+                execucoes[futuros[futuro]] = _informar(futuro.result())
+    else:
+        for i in ordem:
+            execucoes[i] = _informar(rodar(tarefas[i], forcar, cache,
+                                           por_tarefa, opcoes))
+    segundos = time.perf_counter() - inicio
+
+    cabecalho = ("nome", "genoma", "k", "d", "L", "t", "situacao",
+                 "segundos", "mensagem")
+    linhas = [(e.tarefa.nome, e.tarefa.genoma,
+               escrever_valores(e.tarefa.ks), escrever_valores(e.tarefa.ds),
+               escrever_valores(e.tarefa.Ls), escrever_valores(e.tarefa.ts),
+               e.situacao, round(e.segundos, 4), e.mensagem)
+              for e in execucoes]
+    os.makedirs(saida, exist_ok=True)
+    salvar_tsv(os.path.join(saida, "lote.tsv"), cabecalho,
+               list(zip(*linhas)) or [()] * len(cabecalho))
+
+    feitas = sum(e.situacao == FEITA for e in execucoes)
+    print(f"{len(tarefas)} genomas ({feitas} analisados) em {segundos:.1f} s:"
+          f" {feitas * 3600 / max(segundos, 1e-9):.1f} genomas por hora")
+    return execucoes
+
+
+def _tamanho(caminho):
+    try:
+        return os.path.getsize(caminho)
+    except OSError:
+        return 0
+
+
+def _informar(execucao):
+    tarefa = execucao.tarefa
+    print(f"{tarefa.nome} (d={escrever_valores(tarefa.ds)}, "
+          f"L={escrever_valores(tarefa.Ls)}, "
+          f"t={escrever_valores(tarefa.ts)}): "
+          f"{execucao.situacao} {execucao.mensagem}".rstrip() +
+          (f" em {execucao.segundos:.2f} s" if execucao.situacao == FEITA
+           else ""), flush=True)
+    return execucao
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(
+        description="Analisa os genomas de um manifesto (ver lote.py)")
+    parser.add_argument("manifesto", help="TSV com a coluna 'genoma'")
+    parser.add_argument("-k", default="7-9", help="tamanhos de kmer")
+    parser.add_argument("-d", default="2", help="taxas de mutação")
+    parser.add_argument("-L", default="500", help="janelas dos clumps")
+    parser.add_argument("-t", default="3",
+                        help="repetições na janela dos clumps")
+    parser.add_argument("-o", "--saida", default=RESULTADOS,
+                        help="pasta dos resultados (uma pasta por genoma)")
+    parser.add_argument("-p", "--processos", type=int,
+                        help="tarefas ao mesmo tempo (padrão: os núcleos)")
+    parser.add_argument("--cache", default=CACHE,
+                        help="pasta do cache de contagens")
+    parser.add_argument("-f", "--forcar", action="store_true",
+                        help="roda também as tarefas em dia")
+    parser.add_argument("--memoria", type=int,
+                        help="conta os kmers em partições no disco usando "
+                             "cerca dessa memória no lote todo, em MiB (para "
+                             "genomas maiores que a RAM)")
+    parser.add_argument("--aproximado", type=int, metavar="K",
+                        help="a partir desse k, acha só as sequências mais "
+                             "frequentes, aproximadas (ver sketch.py)")
+    parser.add_argument("--regiao", type=int,
+                        help="bases da região em volta da ori analisada "
+                             "(0: o genoma inteiro; padrão: "
+                             "skew.TAMANHO_REGIAO, ou 0 com --memoria)")
+    argumentos = parser.parse_args(argumentos)
+
+    tarefas = ler_manifesto(argumentos.manifesto, ler_valores(argumentos.k),
+                            ler_valores(argumentos.d),
+                            ler_valores(argumentos.L),
+                            ler_valores(argumentos.t), argumentos.saida)
+    opcoes = {}
+    if argumentos.memoria is not None:
+        opcoes['memoria'] = argumentos.memoria << 20
+    if argumentos.aproximado is not None:
+        opcoes['k_aproximado'] = argumentos.aproximado
+    if argumentos.regiao is not None or argumentos.memoria is not None:
+        opcoes['regiao'] = regiao_padrao(argumentos.regiao,
+                                         argumentos.memoria)
+    execucoes = rodar_lote(tarefas, argumentos.processos, argumentos.forcar,
+                           argumentos.cache, argumentos.saida, opcoes)
+    return 1 if any(e.situacao == ERRO for e in execucoes) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
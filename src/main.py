@@ -26,234 +26,471 @@ para k=7, k=8 e k=9)
 todas as sequencias que tiveram o maior número de repetições)
 """
 
+import argparse
+import os
+import time
+from itertools import product
+
+import numpy as np
+
+from cache import CacheDeContagens
+from clumps import encontrar_clumps, encontrar_clumps_em_blocos
+from genoma import Genoma
+from hamming import FITA_REVERSA, ocorrencias_aproximadas
+from indice import IndiceFM, indice_do_genoma
+from kmers import (complemento_reverso, contagens_de, decodificar,
+                   mais_frequentes)
+from paralelo import (contar_com_mutacao_paralelo, contar_kmers_paralelo,
+                      numero_de_processos)
+from particionado import MEMORIA_PADRAO as MEMORIA_PARTICIONADA
+from particionado import contar_particionado
+from pipeline import (REGISTROS_EM_ANDAMENTO, aplicar, contar,
+                      contar_em_particoes, executar, simultaneas)
+from resultados import carregar_contagem, salvar_contagem, salvar_tsv
+from sketch import MEMORIA_PADRAO, mais_frequentes_aproximado
+from skew import (BYTES_POR_BASE, JANELA_DO_PERFIL, TAMANHO_BLOCO,
+                  TAMANHO_REGIAO, perfil_do_desvio, regiao_ori)
+
+# os caminhos partem da pasta do projeto, e não de onde o programa é rodado
+ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                      "assets")
+GENOMA = os.path.join(ASSETS, "dna", "dna_vibrio_cholerae.txt")
+RESULTADOS = os.path.join(ASSETS, "resultados")
+CACHE = os.path.join(ASSETS, "cache")
+
 """
     Lê as sequências normais (não complementares) de tamanho k,
     chama a função que acha as sequências de maior repetição e salva o
     resultado em um arquivo.
+    A contagem é feita pelo motor de kmers de 2 bits (ver kmers.py),
+    dividida entre 'processos' processos (padrão: todos os núcleos; ver
+    paralelo.py).
 """
 
 
-def ler_sequencias_e_salvar(string, k):
-    numero_de_sequencias = len(string) - k + 1
-    dicionario = {}
+def ler_sequencias_e_salvar(string, k, diretorio=RESULTADOS, processos=None):
+    salvar_sequencias(contar_kmers_paralelo(string, k, processos), k,
+                      diretorio)
 
-    for i in range(numero_de_sequencias):
-        sequencia = string[i: i + k]
 
-        if sequencia in dicionario:
-            dicionario[sequencia] += 1
-        else:
-            dicionario[sequencia] = 1
+"""
+    Salva uma contagem já feita (códigos e contagens), como as produzidas por
+    contar_kmers_multiplos: a tabela completa vai para o formato binário
+    (sequencias_k=K.kmers, ver resultados.py) e as sequências de maior
+    repetição para um TSV (sequencias_k=K.tsv).
+"""
 
-    arquivo = open("../assets/resultados/sequencias_k={}.txt".format(k), "w")
-    resultado = str(achar_maior_repeticao(dicionario))
 
-    arquivo.write(resultado)
-    arquivo.close()
+def salvar_sequencias(contagem, k, diretorio=RESULTADOS):
+    codigos, contagens = contagem
+    salvar_contagem(caminho_sequencias(k, diretorio), codigos, contagens, k)
+    salvar_mais_repetidas(contagem, k, diretorio)
 
 
 """
-    Percorre todo o dicionário, acha as sequências com o maior número de
-    repetições e retorna um novo dicionário contendo somente as
-    sequências com o maior número de repetições.
+    Salva só as sequências de maior repetição de uma contagem
+    (sequencias_k=K.tsv), para quando a tabela completa já está salva.
 """
 
 
-def achar_maior_repeticao(dicionario):
-    novo_dicionario = {}
-    maior_repeticao = 1
+def salvar_mais_repetidas(contagem, k, diretorio=RESULTADOS):
+    resultado = achar_maior_repeticao(*contagem, k)
+    salvar_tsv(os.path.join(diretorio, "sequencias_k={}.tsv".format(k)),
+               ("kmer", "repeticoes"),
+               (list(resultado), list(resultado.values())))
+
+
+"""
+    Como ler_sequencias_e_salvar, para genomas maiores que a memória: os
+    kmers são contados em partições no disco, usando no máximo cerca de
+    'memoria' bytes (ver particionado.py), e os arquivos salvos são os
+    mesmos.
+"""
 
-    # achando qual é a maior repetição
-    for seq in dicionario:
-        if dicionario[seq] > maior_repeticao:
-            maior_repeticao = dicionario[seq]
 
-    # salvando somente as sequencias com a maior repeticao no novo dicionário
-    for seq in dicionario:
-        if dicionario[seq] == maior_repeticao:
-            if seq not in novo_dicionario:
-                novo_dicionario[seq] = maior_repeticao
+def ler_sequencias_e_salvar_particionado(genoma, k,
+                                         memoria=MEMORIA_PARTICIONADA,
+                                         processos=1, diretorio=RESULTADOS):
+    contagem = contar_particionado(genoma, k,
+                                   caminho_sequencias(k, diretorio), memoria,
+                                   processos=processos)
+    resultado = {seq: contagem.maior_repeticao
+                 for seq in decodificar(contagem.frequentes, k)}
+    salvar_tsv(os.path.join(diretorio, "sequencias_k={}.tsv".format(k)),
+               ("kmer", "repeticoes"),
+               (list(resultado), list(resultado.values())))
 
-    return novo_dicionario
+
+def caminho_sequencias(k, diretorio=RESULTADOS):
+    return os.path.join(diretorio, "sequencias_k={}.kmers".format(k))
 
 
 """
-    Verifica se determinada sequencia de tamanho k contém uma inversa
-    complementar. Caso realmente tenha, armazene num dicionário, juntamente
-    com suas possíveis repetições (dicionario[inversa] == repetição), e, por
-    último, salve num arquivo.
+    Carrega de volta (numa única leitura) a contagem completa salva por
+    salvar_sequencias, para que as outras etapas possam ser rodadas sem
+    contar de novo.
 """
 
 
-def possui_inversa(k):
-    arquivo = open("../assets/dna/dna_vibrio_cholerae.txt", "r")
-    string = arquivo.readline()
-    arquivo.close()
-    dicionario = transforma_arquivo_em_dicionario(k)
-    inversas_possiveis = criando_inversas(dicionario)
-    inversas_reais = {}
-
-    # para cada letra na string
-    for i in range(len(string)):
-        # caso o intervalo da string esteja na lista de possíveis inversas
-        # (já criada anteriormente)
-        if string[i: i + k] in inversas_possiveis:
-            # e se esse intervalo já foi adicionado ao dicionário de
-            # 'inversas reais', adicione +1 ao seu valor (mais uma repetição)
-            if string[i: i + k] in inversas_reais:
-                inversas_reais[string[i: i + k]] += 1
-            # caso já não tenha sido adicionada anteriormente, adicione agora
-            else:
-                inversas_reais[string[i: i + k]] = 1
-
-    # depois de tudo isso, salve as 'inversas reais' num arquivo de texto
-    arquivo = open("../assets/resultados/inversas_k={}.txt".format(k), "w")
-    arquivo.write(str(inversas_reais))
-    arquivo.close()
+def carregar_sequencias(k, diretorio=RESULTADOS):
+    codigos, contagens, _ = carregar_contagem(caminho_sequencias(k, diretorio))
+    return codigos, contagens
 
 
 """
-    Abre o arquivo com as sequências e transforma em um dicionário de novo,
-    para que seja fácil de manipular mais tarde.
+    Acha as sequências com o maior número de repetições a partir da contagem
+    (códigos e contagens) e retorna um dicionário contendo somente as
+    sequências com o maior número de repetições.
 """
 
 
-def transforma_arquivo_em_dicionario(k):
-    arquivo = open("../assets/resultados/sequencias_k={}.txt".format(k), "r")
-    resultado = arquivo.readline()
-    arquivo.close()
-    dicionario = {}
-
-    # transformando a string em dicionário de novo (olha dentro do arquivo e
-    # faz o rastreio, que fica fácil de entender)
-    for i in range(len(resultado)):
-        if resultado[i] == ":":
-            sequencia = resultado[i - (k + 1): i - 1]
-            repeticoes = resultado[i + 2]
-            dicionario[sequencia] = repeticoes
-
-    return dicionario
+def achar_maior_repeticao(codigos, contagens, k):
+    frequentes, maior_repeticao = mais_frequentes(codigos, contagens)
+    return {seq: maior_repeticao for seq in decodificar(frequentes, k)}
 
 
 """
-    Lê o dicionário das sequencias que contém repetições, cria uma lista de
-    "possíveis inversas", e retorna essa lista.
-    O primeiro laço é feito para cada chave do dicionário (ou seja, para cada
-    sequência armazenada no dicionário)
-    Depois, uma string vazia é declarada
-    Após isso, outro laço é chamado, percorrendo cada letra da sequência
-    E a string 'troca' vai ser alterada para cada letra encontrada na minha
-    sequência
-    E será armazenada na minha string 'inversa'
-    Após isso, a string 'inversa' será adicionada à minha lista de "possíveis
-    inversas"
-    Espero que, juntamente com o código, minha explicação tenha sido clara.
+    Para k grande, quando a contagem exata de todas as sequências não cabe
+    na memória: acha as 'quantos' sequências mais frequentes numa memória
+    fixa (ver sketch.py) e salva cada uma com o intervalo em que está a
+    sua quantidade real de repetições e, se 'verificar', com a quantidade
+    exata, contada numa segunda passada só para os candidatos.
 """
 
 
-def criando_inversas(dicionario):
-    sequencias = transforma_dicionario_em_lista(dicionario)
-    inversas = []
+def achar_maior_repeticao_aproximada(genoma, k, quantos=10,
+                                     memoria=MEMORIA_PADRAO, verificar=False,
+                                     diretorio=RESULTADOS):
+    frequentes = mais_frequentes_aproximado(genoma, k, quantos, memoria,
+                                            verificar)
 
-    for seq in sequencias:
-        inversa = ''
+    cabecalho = ["kmer", "minimo", "maximo"]
+    colunas = [decodificar(frequentes.codigos, k),
+               frequentes.minimos.tolist(), frequentes.maximos.tolist()]
+    if verificar:
+        cabecalho.append("repeticoes")
+        colunas.append(frequentes.exatas.tolist())
 
-        for i in seq[::-1]:  # ou 'for i in reverse(seq):'
-            troca = ''
-            if i == 'a':
-                troca = 't'
-            elif i == 't':
-                troca = 'a'
-            elif i == 'g':
-                troca = 'c'
-            elif i == 'c':
-                troca = 'g'
-            inversa += troca
-
-        inversas.append(inversa)
-
-    return inversas
+    salvar_tsv(os.path.join(diretorio, "frequentes_k={}.tsv".format(k)),
+               cabecalho, colunas)
+    return frequentes
 
 
 """
-    Dado um dicionário, retorna uma lista com as CHAVES do dicionário.
+    Verifica quais das sequências de maior repetição de tamanho k possuem uma
+    inversa complementar no genoma. As que realmente tiverem são armazenadas
+    juntamente com suas repetições e, por último, salvas num arquivo.
+    As inversas são contadas no índice FM do genoma (ver indice.py), sem
+    percorrer o genoma de novo; sem índice (indice=None), elas são
+    procuradas na própria contagem, que já tem todos os kmers do genoma.
 """
 
 
-def transforma_dicionario_em_lista(dicionario):
-    lista = list(dicionario)
-    return lista
+def possui_inversa(contagem, k, indice, diretorio=RESULTADOS):
+    codigos, contagens = contagem
+    frequentes, _ = mais_frequentes(codigos, contagens)
+    inversas = complemento_reverso(frequentes, k)
+    repeticoes = contagens_de(contagem, inversas) if indice is None \
+        else indice.contar_codigos(inversas, k)
+
+    reais = repeticoes > 0
+
+    # depois de tudo isso, salve as 'inversas reais' num arquivo
+    salvar_tsv(os.path.join(diretorio, "inversas_k={}.tsv".format(k)),
+               ("kmer", "inversa", "repeticoes"),
+               (decodificar(frequentes[reais], k),
+                decodificar(inversas[reais], k), repeticoes[reais].tolist()))
 
 
 """
-    Achar possíveis mutações dentre as sequências, num universo da string
-    original do dna.
+    Acha as sequências de tamanho k que mais se repetem quando se permite até
+    'd' erros (mutações) nas comparações, opcionalmente somando as
+    ocorrências das suas inversas complementares, e salva o resultado num
+    arquivo de uma vez só. Parte da contagem exata já feita: a vizinhança de
+    cada sequência distinta é gerada uma única vez (ver mutacoes.py), e o
+    trabalho é dividido entre 'processos' processos (padrão: todos os núcleos;
+    ver paralelo.py).
 """
 
 
-def achar_mutacao(k, d):
-    arquivo = open("../assets/resultados/sequencias_k={}.txt".format(k), "r")
-    seq = arquivo.readline()
-    arquivo.close
-    arquivo = open("../assets/dna/dna_vibrio_cholerae.txt", "r")
-    dna = arquivo.readline()
-    arquivo.close
+def achar_mutacao(contagem, k, d, inversas=False, processos=None,
+                  diretorio=RESULTADOS):
+    codigos, contagens = contagem
+    padroes, repeticoes = contar_com_mutacao_paralelo(
+        codigos, contagens, k, d, inversas, processos)
+    resultado = achar_maior_repeticao(padroes, repeticoes, k)
 
-    lista_seq = string_de_dicionario_para_lista(seq, k)
-    numero_de_sequencias = len(dna) - k + 1
+    salvar_tsv(os.path.join(diretorio, "mutacao_k={}_d={}.tsv".format(k, d)),
+               ("kmer", "repeticoes"),
+               (list(resultado), list(resultado.values())))
+    return list(resultado)
 
-    for i in range(numero_de_sequencias):
-        for seq in lista_seq:
-            mutacao(dna[i: i + k], seq, k, d)
+
+"""
+    Acha onde cada uma das sequências aparece no genoma, nas duas fitas,
+    com até 'd' erros (ver hamming.ocorrencias_aproximadas: uma passada
+    pelo genoma para todas de uma vez), e salva todas as ocorrências num
+    arquivo de uma vez só. 'deslocamento' é somado às posições (a posição
+    de 'genoma' quando ele é um trecho de outro).
+"""
+
+
+def localizar_mutacoes(genoma, sequencias, k, d, diretorio=RESULTADOS,
+                       deslocamento=0):
+    if not sequencias:
+        return
+    ocorrencias = ocorrencias_aproximadas(sequencias, genoma, d)
+    salvar_tsv(
+        os.path.join(diretorio, "ocorrencias_k={}_d={}.tsv".format(k, d)),
+        ("kmer", "fita", "posicao", "erros"),
+        ([sequencias[i] for i in ocorrencias.padroes.tolist()],
+         ['-' if fita == FITA_REVERSA else '+'
+          for fita in ocorrencias.fitas.tolist()],
+         (ocorrencias.posicoes + deslocamento).tolist(),
+         ocorrencias.distancias.tolist()))
 
 
 """
-    Pega a string (que está em formato de dicionário) e remove aspas,
-    dois-pontos, valor etc, retornando uma lista padrão.
+    Acha os clumps (L, t) de tamanho k, as sequências que aparecem pelo
+    menos t vezes dentro de alguma janela de L bases do genoma (ver
+    clumps.py), e salva cada uma com o maior número de repetições numa
+    janela e a posição onde começa a primeira janela com t repetições
+    (mais 'deslocamento', como em localizar_mutacoes). Com 'memoria' (em
+    bytes), o genoma é lido em blocos que usam cerca dessa memória.
 """
 
 
-def string_de_dicionario_para_lista(string, k):
-    lista = []
-    sequencia = ""
+def achar_clumps(genoma, k, L, t, diretorio=RESULTADOS, deslocamento=0,
+                 memoria=None):
+    clumps = encontrar_clumps(genoma, k, L, t) if memoria is None \
+        else encontrar_clumps_em_blocos(genoma, k, L, t, memoria)
+    salvar_tsv(os.path.join(diretorio, "clumps_k={}_L={}_t={}.tsv".format(
+        k, L, t)), ("kmer", "repeticoes", "posicao"),
+        (decodificar(clumps.codigos, k), clumps.repeticoes.tolist(),
+         (clumps.posicoes + deslocamento).tolist()))
+
+
+"""
+    Salva o perfil do desvio G - C do genoma em janelas de 'janela' bases
+    (ver skew.py) e devolve a região de 'tamanho' bases em volta do menor
+    desvio, a candidata a origem de replicação (ou None, sem 'tamanho'). O
+    genoma é lido em blocos, com memória limitada ('memoria' bytes, se
+    dada).
+"""
 
-    for i in range(len(string)):
-        if len(sequencia) == k:
-            lista.append(sequencia)
-            sequencia = ""
-        if string[i].isalpha():
-            sequencia += string[i]
 
-    return lista
+def localizar_ori(genoma, tamanho, janela, diretorio=RESULTADOS,
+                  memoria=None):
+    tamanho_bloco = TAMANHO_BLOCO if memoria is None else \
+        max(janela, memoria // BYTES_POR_BASE)
+    perfil = perfil_do_desvio(genoma, janela, tamanho_bloco)
+    salvar_tsv(os.path.join(diretorio,
+                            "desvio_janela={}.tsv".format(janela)),
+               ("inicio", "desvio", "acumulado"),
+               (perfil.inicios, np.round(perfil.desvios, 4),
+                perfil.acumulados))
+    return regiao_ori(genoma, tamanho, tamanho_bloco) if tamanho else None
 
 
-def mutacao(dna, seq, k, d):
-    erros = 0
-    for i in range(k):
-        if dna[i] != seq[i]:
-            erros += 1
-    if erros == d:
-        salvar_mutacao(seq, dna, k, d)
+"""
+    A análise completa de um genoma: o desvio G - C e a região da ori, as
+    sequências de maior repetição, as inversas, as mutações (com até 'd'
+    erros) e os clumps (L, t) de cada k, salvos em 'diretorio'. Devolve
+    quanto tempo (em segundos) cada etapa levou, por k. Não pergunta nada,
+    então pode ser chamada por um script ou pelo lote.py.
+
+    Num genoma maior que 2 * 'regiao', as etapas olham só a região de
+    'regiao' bases em volta do menor desvio (com 'regiao' 0 ou None, o
+    genoma inteiro); o perfil do desvio é salvo em janelas de 'janela'
+    bases. As posições em todos os arquivos são as do genoma inteiro. 'd', 'L' e 't' podem ser listas: as etapas que não dependem deles
+    (ori, contagem, sequências e inversas) rodam uma vez só, e as mutações e
+    os clumps uma vez para cada valor.
+
+    Com 'memoria' (em bytes), os kmers são contados em partições no disco,
+    sem passar muito disso (para genomas maiores que a RAM; ver
+    particionado.py), e as tabelas são lidas do disco conforme o uso; o
+    índice FM não é montado (as inversas são procuradas nas tabelas) e os
+    clumps são procurados em blocos. Para um genoma maior que a RAM, use
+    também regiao=0 (o main.py e o lote.py fazem isso quando só 'memoria'
+    é dada). Os k
+    a partir de 'k_aproximado' não são contados por inteiro: só as
+    sequências mais frequentes do genoma inteiro (sem recorte) são achadas,
+    numa memória fixa (achar_maior_repeticao_aproximada, com 'memoria' se
+    houver), antes de tudo e sem as outras etapas; se só sobram esses k,
+    nada mais é montado além do perfil do desvio.
+"""
 
 
-def salvar_mutacao(seq, dna, k, d):
-    arquivo = open("../assets/resultados/mutacao_k={}_d={}.txt".format(k, d), "a+")
-    resultado = "Original: " + seq + "\n Mutação: " + dna + "\n"
-    arquivo.write(resultado)
-    arquivo.close()
+def analisar(caminho, d, ks=range(7, 10), L=500, t=3, diretorio=RESULTADOS,
+             cache=CACHE, processos=None, memoria=None, k_aproximado=None,
+             regiao=TAMANHO_REGIAO, janela=JANELA_DO_PERFIL):
+    ds, Ls, ts = _lista(d), _lista(L), _lista(t)
+    aproximados = [] if k_aproximado is None else \
+        [k for k in ks if k >= k_aproximado]
+    ks = [k for k in ks if k not in aproximados]
+    tempos = {}
+
+    def medir(etapa, funcao):
+        # cada (etapa, k) tem a sua chave, então as threads não disputam
+        def medida(registro):
+            inicio = time.perf_counter()
+            funcao(registro)
+            tempos[etapa, registro.k] = time.perf_counter() - inicio
+        return medida
+
+    os.makedirs(diretorio, exist_ok=True)
+
+    # o genoma é mapeado uma única vez (aceita também FASTA e várias linhas)
+    with Genoma(caminho) as genoma:
+        for k in aproximados:
+            inicio = time.perf_counter()
+            achar_maior_repeticao_aproximada(
+                genoma, k, memoria=memoria or MEMORIA_PADRAO,
+                diretorio=diretorio)
+            tempos["frequentes", k] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        if not ks:
+            localizar_ori(genoma, None, janela, diretorio, memoria)
+            tempos["ori", None] = time.perf_counter() - inicio
+            return tempos
+
+        # num genoma completo, as etapas seguintes olham só a região em
+        # volta do menor desvio G - C; um arquivo que já tem mais ou menos
+        # esse tamanho (como o de exemplo, a ori de V. cholerae) é usado
+        # inteiro
+        recortar = bool(regiao) and len(genoma) > 2 * regiao
+        ori = localizar_ori(genoma, regiao if recortar else None, janela,
+                            diretorio, memoria)
+        if recortar:
+            alvo, deslocamento = ori.sequencia, ori.inicio
+        else:
+            alvo, deslocamento = genoma, 0
+        if memoria is not None:
+            # o índice de um genoma inteiro não caberia na memória
+            indice = None
+        elif recortar:
+            indice = IndiceFM.construir(alvo)
+        else:
+            # o índice FM é montado só na primeira vez e salvo ao lado do
+            # genoma
+            indice = indice_do_genoma(genoma)
+        tempos["ori", None] = time.perf_counter() - inicio
+
+        # todos os k são contados numa única passada, e só se o cache (por
+        # conteúdo) ainda não tiver as contagens; nas partições, as tabelas
+        # já ficam salvas em sequencias_k=K.kmers
+        inicio = time.perf_counter()
+        if memoria is None:
+            registros = executar(contar(alvo, ks, CacheDeContagens(cache),
+                                        processos=processos))
+        else:
+            registros = executar(contar_em_particoes(
+                alvo, ks, {k: caminho_sequencias(k, diretorio) for k in ks},
+                memoria, processos))
+        tempos["contagem", None] = time.perf_counter() - inicio
+
+        # as etapas seguintes só dependem da contagem de cada k e rodam ao
+        # mesmo tempo (ver pipeline.py); só os resultados finais vão para
+        # arquivos
+        def inversas(registro):
+            possui_inversa((registro.codigos, registro.contagens),
+                           registro.k, indice, diretorio)
+
+        # as mutações de até REGISTROS_EM_ANDAMENTO k rodam ao mesmo tempo,
+        # então os núcleos são divididos entre elas; com 'memoria', as
+        # etapas rodam uma de cada vez, para a memória delas não se somar
+        em_andamento = REGISTROS_EM_ANDAMENTO if memoria is None else 1
+        processos_por_k = max(1, numero_de_processos(processos) //
+                              em_andamento)
+
+        def mutacoes(registro):
+            k = registro.k
+            for d in ds:
+                inicio = time.perf_counter()
+                sequencias = achar_mutacao(
+                    (registro.codigos, registro.contagens), k, d,
+                    processos=processos_por_k, diretorio=diretorio)
+                localizar_mutacoes(alvo, sequencias, k, d, diretorio,
+                                   deslocamento)
+                tempos[f"mutacoes_d={d}", k] = time.perf_counter() - inicio
+
+        def clumps(registro):
+            for L, t in product(Ls, ts):
+                inicio = time.perf_counter()
+                achar_clumps(alvo, registro.k, L, t, diretorio,
+                             deslocamento, memoria)
+                tempos[f"clumps_L={L}_t={t}", registro.k] = \
+                    time.perf_counter() - inicio
+
+        def sequencias(registro):
+            # somente as de maior repeticao
+            salvar = salvar_sequencias if memoria is None \
+                else salvar_mais_repetidas
+            salvar((registro.codigos, registro.contagens), registro.k,
+                   diretorio)
+
+        registros = simultaneas(registros, {
+            "inversas": medir("inversas", inversas),
+            "mutacoes": mutacoes,
+            "clumps": clumps}, threads=None if memoria is None else 1,
+            em_andamento=em_andamento)
+        executar(aplicar(registros, medir("sequencias", sequencias)))
+
+    return tempos
+
+
+def _bytes(mebibytes):
+    return None if mebibytes is None else mebibytes << 20
 
 
-def main():
-    arquivo = open("../assets/dna/dna_vibrio_cholerae.txt", "r")
-    string = arquivo.readline()
-    arquivo.close()
+"""
+    A região (ver analisar) usada quando 'regiao' não foi pedida: o genoma
+    inteiro com 'memoria' (a contagem em partições é para genomas grandes),
+    senão skew.TAMANHO_REGIAO.
+"""
 
-    d = int(input("\n\tInsira aqui o taxa de mutação:  "))
 
-    for k in range(7, 10):
-        ler_sequencias_e_salvar(string, k)  # somente as de maior repeticao
-        possui_inversa(k)
-        achar_mutacao(k, d)
+def regiao_padrao(regiao, memoria):
+    if regiao is not None:
+        return regiao
+    return TAMANHO_REGIAO if memoria is None else 0
+
+
+def _lista(valor):
+    return [valor] if isinstance(valor, int) else list(valor)
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(
+        description="Sequências mais repetidas, inversas, mutações e "
+                    "clumps de um genoma (para vários genomas, ver lote.py)")
+    parser.add_argument("genoma", nargs="?", default=GENOMA,
+                        help="arquivo do genoma (padrão: o de V. cholerae)")
+    parser.add_argument("-d", type=int,
+                        help="taxa de mutação (sem ela, é perguntada)")
+    parser.add_argument("-o", "--saida", default=RESULTADOS,
+                        help="pasta dos resultados")
+    parser.add_argument("--memoria", type=int,
+                        help="conta os kmers em partições no disco usando "
+                             "cerca dessa memória, em MiB (para genomas "
+                             "maiores que a RAM)")
+    parser.add_argument("--aproximado", type=int, metavar="K",
+                        help="a partir desse k, acha só as sequências mais "
+                             "frequentes, aproximadas (ver sketch.py)")
+    parser.add_argument("--regiao", type=int,
+                        help="bases da região em volta da ori analisada "
+                             "(0: o genoma inteiro; padrão: "
+                             f"{TAMANHO_REGIAO}, ou 0 com --memoria)")
+    argumentos = parser.parse_args(argumentos)
+
+    d = argumentos.d
+    if d is None:
+        d = int(input("\n\tInsira aqui o taxa de mutação:  "))
+    analisar(argumentos.genoma, d, diretorio=argumentos.saida,
+             memoria=_bytes(argumentos.memoria),
+             k_aproximado=argumentos.aproximado,
+             regiao=regiao_padrao(argumentos.regiao, argumentos.memoria))
 
 
 if __name__ == "__main__":
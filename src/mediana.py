@@ -0,0 +1,234 @@
+"""
+Median string: o padrão de tamanho k que minimiza a soma, sobre um conjunto
+de sequencias, da menor distância de Hamming do padrão a alguma janela de
+cada sequencia.
+
+Os 4^k padrões são percorridos em ordem lexicográfica, como uma árvore de
+prefixos (branch-and-bound). Para cada prefixo é mantida, por sequencia e
+por janela, a quantidade de erros do prefixo contra o começo da janela; a
+soma dos mínimos por sequencia é um limite inferior para todos os padrões
+com esse prefixo, e a subárvore inteira é descartada quando ele passa do
+melhor total já conhecido. As últimas m bases de cada padrão são
+avaliadas todas de uma vez, com uma transformada de distância sobre os 4^m
+sufixos.
+
+O limite inicial vem dos próprios kmers das sequencias, avaliados em lote
+com hamming.distancias_minimas, e os primeiros níveis da árvore são
+repartidos entre processos.
+"""
+
+from collections import namedtuple
+from itertools import product, repeat
+
+import numpy as np
+
+from hamming import codificar_janelas, distancias_minimas
+from kmers import INVALIDA, codificar, decodificar, validar_k
+from paralelo import (PEDACOS_POR_PROCESSO, criar_executor, dividir,
+                      numero_de_processos)
+
+# quantas bases do fim de cada padrão são avaliadas de uma vez (4^m padrões)
+BASES_NO_SUFIXO = 10
+
+# tamanho máximo do array (sequencias x 4^m) das folhas
+ELEMENTOS_POR_BLOCO = 1 << 24
+
+# quantos kmers das sequencias (no máximo) definem o limite inicial
+CANDIDATOS_INICIAIS = 4096
+
+# erros de uma janela que não existe ou tem base fora de ACGT (maior que
+# qualquer distância real, e ainda cabe num uint8 somado a k)
+_SEM_JANELA = 200
+
+Mediana = namedtuple('Mediana', ['padroes', 'distancia'])
+Mediana.__doc__ = """
+Resultado da busca: todos os padrões com a menor distância total (em ordem
+lexicográfica) e essa distância.
+"""
+
+
+def _matriz_de_bases(sequencias, k):
+    bases = [codificar(sequencia) for sequencia in sequencias]
+    if not bases:
+        raise ValueError("nenhuma sequencia informada")
+
+    maior = max([len(sequencia) for sequencia in bases] + [k])
+    matriz = np.full((len(bases), maior), INVALIDA, dtype=np.uint8)
+    for linha, sequencia in zip(matriz, bases):
+        linha[:len(sequencia)] = sequencia
+    return matriz
+
+
+def _erros_iniciais(matriz, k):
+    """
+    Erros do prefixo vazio: zero nas janelas válidas, _SEM_JANELA nas
+    outras.
+    """
+
+    numero_de_janelas = matriz.shape[1] - k + 1
+    invalidas = np.zeros((len(matriz), matriz.shape[1] + 1), dtype=np.int64)
+    np.cumsum(matriz == INVALIDA, axis=1, out=invalidas[:, 1:])
+    validas = invalidas[:, k:] == invalidas[:, :numero_de_janelas]
+    if not validas.any(axis=1).all():
+        raise ValueError(f"toda sequencia precisa de uma janela de {k} "
+                         f"bases ACGT")
+    return np.where(validas, 0, _SEM_JANELA).astype(np.int16)
+
+
+def _limite_inicial(sequencias, k, processos):
+    """
+    Menor distância total entre (até CANDIDATOS_INICIAIS) kmers que
+    aparecem nas sequencias: um limite superior para a mediana.
+    """
+
+    janelas, validas = codificar_janelas(sequencias, k)
+    candidatos = np.unique(janelas if validas is None else janelas[validas])
+    if len(candidatos) > CANDIDATOS_INICIAIS:
+        escolhidos = np.linspace(0, len(candidatos) - 1, CANDIDATOS_INICIAIS)
+        candidatos = candidatos[escolhidos.astype(np.intp)]
+
+    deslocamentos = np.arange(2 * (k - 1), -1, -2, dtype=np.uint64)
+    bases = ((candidatos[:, None] >> deslocamentos) & np.uint64(3))
+    distancias, _ = distancias_minimas(bases.astype(np.uint8), sequencias,
+                                       processos)
+    return int(distancias.sum(axis=1, dtype=np.int64).min())
+
+
+class _Busca(object):
+    """
+    Estado da busca numa parte da árvore: as bases das sequencias, o sufixo
+    de cada janela e os melhores padrões achados até agora.
+    """
+
+    def __init__(self, matriz, k, limite):
+        self.matriz = matriz
+        self.k = k
+        self.m = min(BASES_NO_SUFIXO, k)
+        self.janelas = matriz.shape[1] - k + 1
+        self.melhor = limite
+        self.padroes = []
+
+        self.linhas_por_bloco = max(1, ELEMENTOS_POR_BLOCO // 4 ** self.m)
+
+        # código de 2m bits do sufixo de cada janela
+        self.sufixos = np.zeros((len(matriz), self.janelas), dtype=np.intp)
+        for j in range(k - self.m, k):
+            self.sufixos <<= 2
+            self.sufixos |= matriz[:, j:j + self.janelas] & 3
+
+    def erros_do_prefixo(self, prefixo):
+        erros = _erros_iniciais(self.matriz, self.k)
+        for posicao, base in enumerate(prefixo):
+            erros += self.matriz[:, posicao:posicao + self.janelas] != base
+        return erros
+
+    def _folhas(self, prefixo, erros):
+        """
+        Avalia de uma vez os 4^m padrões com esse prefixo. Para cada
+        sequencia, a distância de cada sufixo é o mínimo, entre as janelas,
+        de (erros do prefixo na janela + distância do sufixo ao sufixo da
+        janela): começa com os erros do prefixo no sufixo de cada janela e
+        é propagada uma posição do sufixo por vez (trocar a base de uma
+        posição custa 1), como a soma sobre a vizinhança de mutacoes.py.
+        """
+
+        totais = np.zeros(4 ** self.m, dtype=np.int64)
+        for a in range(0, len(erros), self.linhas_por_bloco):
+            linhas = np.s_[a:a + self.linhas_por_bloco]
+            quantas = len(erros[linhas])
+            distancias = np.full((quantas, 4 ** self.m), _SEM_JANELA,
+                                 dtype=np.uint8)
+            np.minimum.at(distancias,
+                          (np.arange(quantas)[:, None], self.sufixos[linhas]),
+                          erros[linhas])
+
+            for eixo in range(self.m):
+                # mínimo das 4 bases nessa posição, com 4 fatias (reduzir
+                # um eixo de tamanho 4 com .min é bem mais lento)
+                cubo = distancias.reshape(quantas, 4 ** eixo, 4, -1)
+                menor = np.minimum(cubo[:, :, 0], cubo[:, :, 1])
+                np.minimum(menor, cubo[:, :, 2], out=menor)
+                np.minimum(menor, cubo[:, :, 3], out=menor)
+                menor += 1
+                np.minimum(cubo, menor[:, :, None], out=cubo)
+            totais += distancias.sum(axis=0, dtype=np.int64)
+
+        menor = int(totais.min())
+        if menor > self.melhor:
+            return
+        if menor < self.melhor:
+            self.melhor = menor
+            self.padroes = []
+
+        codigo = 0
+        for base in prefixo:
+            codigo = (codigo << 2) | int(base)
+        codigo <<= 2 * self.m
+        self.padroes.extend(codigo + int(s)
+                            for s in np.flatnonzero(totais == menor))
+
+    def percorrer(self, prefixo, erros):
+        if len(prefixo) == self.k - self.m:
+            self._folhas(prefixo, erros)
+            return
+
+        posicao = len(prefixo)
+        coluna = self.matriz[:, posicao:posicao + self.janelas]
+        filhos = erros[None] + (coluna[None] != np.arange(4, dtype=np.uint8)
+                                [:, None, None])
+        limites = filhos.min(axis=2).sum(axis=1, dtype=np.int64)
+
+        for base in range(4):
+            # o melhor pode ter melhorado dentro do irmão anterior
+            if limites[base] <= self.melhor:
+                self.percorrer(prefixo + (base,), filhos[base])
+
+
+def _buscar_prefixos(matriz, k, limite, prefixos):
+    busca = _Busca(matriz, k, limite)
+    for prefixo in prefixos:
+        erros = busca.erros_do_prefixo(prefixo)
+        if erros.min(axis=1).sum(dtype=np.int64) <= busca.melhor:
+            busca.percorrer(prefixo, erros)
+    return busca.melhor, busca.padroes
+
+
+def median_string(sequencias, k, processos=None):
+    """
+    Acha os padrões de tamanho k com a menor soma das distâncias às
+    sequencias (a distância de um padrão a uma sequencia é a menor distância
+    de Hamming a alguma janela dela).
+    :param sequencias: lista de sequencias (str, listas de letras, arrays)
+    :param k: tamanho do padrão
+    :param processos: quantos processos usar (padrão: todos os núcleos)
+    :rtype: Mediana
+    """
+
+    validar_k(k)
+    matriz = _matriz_de_bases(sequencias, k)
+    _erros_iniciais(matriz, k)
+    processos = numero_de_processos(processos)
+    limite = _limite_inicial(sequencias, k, processos)
+
+    # prefixos que viram tarefas: o bastante para todos os processos, sem
+    # entrar nas bases do sufixo
+    profundidade = 0
+    while 4 ** profundidade < processos * PEDACOS_POR_PROCESSO and \
+            profundidade < k - min(BASES_NO_SUFIXO, k):
+        profundidade += 1
+    prefixos = list(product(range(4), repeat=profundidade))
+
+    if processos == 1 or len(prefixos) == 1:
+        melhor, padroes = _buscar_prefixos(matriz, k, limite, prefixos)
+    else:
+        blocos = dividir(len(prefixos), processos * PEDACOS_POR_PROCESSO)
+        with criar_executor(processos) as executor:
+            partes = list(executor.map(
+                _buscar_prefixos, repeat(matriz), repeat(k), repeat(limite),
+                [prefixos[a:b] for a, b in blocos]))
+
+        melhor = min(m for m, _ in partes)
+        padroes = [p for m, parte in partes if m == melhor for p in parte]
+
+    return Mediana(decodificar(np.array(padroes, dtype=np.uint64), k,
+                               maiusculas=True), melhor)
@@ -0,0 +1,244 @@
+"""
+Busca de motifs com reinícios aleatórios (randomized motif search) e Gibbs
+sampler, em paralelo.
+
+Cada reinício começa de um kmer aleatório em cada sequencia e repete
+profile -> kmers mais prováveis -> novo profile enquanto o score do motif
+(perfil.Profile.pontuacao) melhora. Os reinícios são independentes, então
+são repartidos entre processos; cada um tem o seu próprio gerador, criado a
+partir de np.random.SeedSequence(semente).spawn, e o resultado para uma
+semente é o mesmo com qualquer número de processos.
+
+O Gibbs sampler mantém um único perfil.Profile por cadeia: a cada passo só
+o kmer da sequencia sorteada sai e volta (O(k)), em vez de recontar a
+matriz de motif.
+"""
+
+from collections import namedtuple
+from itertools import repeat
+
+import numpy as np
+
+from kmers import INVALIDA, codificar, validar_k
+from paralelo import (PEDACOS_POR_PROCESSO, criar_executor, dividir,
+                      numero_de_processos)
+from perfil import Profile, mais_provaveis, pontuar_janelas
+
+_LETRAS = np.array(list('ACGT'))
+
+Resultado = namedtuple('Resultado', ['motifs', 'pontuacao', 'inicios',
+                                     'pontuacoes', 'iteracoes', 'semente'])
+Resultado.__doc__ = """
+Resultado de uma busca de motifs.
+- motifs: o melhor conjunto de kmers (lista de str, um por sequencia)
+- pontuacao: o score dele
+- inicios: a posição de cada kmer na sua sequencia
+- pontuacoes, iteracoes: o melhor score e o número de iterações de cada
+  reinício ou cadeia (arrays)
+- semente: a entropia da np.random.SeedSequence usada, para repetir a busca
+"""
+
+
+def preparar_sequencias(sequencias, k):
+    """
+    Codifica as sequencias (ver kmers.codificar) e confere se todas têm pelo
+    menos k bases e só têm ACGT.
+    :rtype: list (de numpy.ndarray)
+    """
+
+    validar_k(k)
+    bases = [codificar(sequencia) for sequencia in sequencias]
+    if not bases:
+        raise ValueError("nenhuma sequencia informada")
+    for i, sequencia in enumerate(bases):
+        if len(sequencia) < k:
+            raise ValueError(f"a sequencia {i} tem menos de {k} bases")
+        if np.any(sequencia == INVALIDA):
+            raise ValueError(f"a sequencia {i} tem bases fora de ACGT")
+    return bases
+
+
+def _motif(bases, inicios, k):
+    return np.stack([sequencia[inicio:inicio + k]
+                     for sequencia, inicio in zip(bases, inicios)])
+
+
+def texto_do_motif(bases, inicios, k):
+    """
+    Os kmers que começam em 'inicios', como strings.
+    :rtype: list
+    """
+
+    return [''.join(_LETRAS[kmer]) for kmer in _motif(bases, inicios, k)]
+
+
+def _busca(bases, k, gerador, pseudocontagem):
+    """
+    Um reinício: parte de kmers aleatórios e itera até o score parar de
+    melhorar.
+    :return (inicios, pontuacao, iteracoes)
+    """
+
+    limites = np.array([len(sequencia) - k + 1 for sequencia in bases])
+    inicios = gerador.integers(0, limites)
+    melhor = Profile.de_motif(_motif(bases, inicios, k), pseudocontagem)
+    iteracoes = 1
+
+    while True:
+        candidatos = mais_provaveis(melhor, bases)
+        profile = Profile.de_motif(_motif(bases, candidatos, k),
+                                   pseudocontagem)
+        if profile.pontuacao() >= melhor.pontuacao():
+            return inicios, melhor.pontuacao(), iteracoes
+        melhor, inicios = profile, candidatos
+        iteracoes += 1
+
+
+def _gibbs(bases, k, gerador, pseudocontagem, iteracoes, paciencia):
+    """
+    Uma cadeia do Gibbs sampler: a cada passo uma sequencia sorteada sai do
+    profile (O(k)), o seu novo kmer é sorteado com probabilidade
+    proporcional à do profile das outras e ela volta para o profile.
+    :return (inicios, pontuacao, passos) do melhor motif visto
+    """
+
+    limites = np.array([len(sequencia) - k + 1 for sequencia in bases])
+    inicios = gerador.integers(0, limites)
+    profile = Profile.de_motif(_motif(bases, inicios, k), pseudocontagem)
+    melhor_inicios = inicios.copy()
+    melhor = profile.pontuacao()
+    sem_melhora = 0
+
+    for passo in range(1, iteracoes + 1):
+        i = gerador.integers(len(bases))
+        sequencia = bases[i]
+        profile.remover_kmer(sequencia[inicios[i]:inicios[i] + k])
+
+        # normaliza em log antes de voltar para probabilidade, senão
+        # janelas longas viram todas 0.0
+        pontuacao = pontuar_janelas(profile, sequencia)
+        maior = pontuacao.max()
+        pesos = np.exp(pontuacao - maior) if np.isfinite(maior) \
+            else np.ones(len(pontuacao))
+        acumulado = np.cumsum(pesos)
+        inicios[i] = min(np.searchsorted(acumulado,
+                                         gerador.random() * acumulado[-1],
+                                         side='right'), len(pesos) - 1)
+
+        profile.adicionar_kmer(sequencia[inicios[i]:inicios[i] + k])
+        if profile.pontuacao() < melhor:
+            melhor = profile.pontuacao()
+            melhor_inicios = inicios.copy()
+            sem_melhora = 0
+        else:
+            sem_melhora += 1
+            if paciencia is not None and sem_melhora >= paciencia:
+                break
+
+    return melhor_inicios, melhor, passo
+
+
+def _executar_lote(busca, bases, k, sementes, *argumentos):
+    """
+    Executa uma busca (_busca ou _gibbs) para cada semente do lote.
+    :return (pontuacoes, iteracoes, inicios da melhor busca do lote)
+    """
+
+    pontuacoes = np.zeros(len(sementes), dtype=np.int64)
+    iteracoes = np.zeros(len(sementes), dtype=np.int64)
+    melhores_inicios = None
+
+    for i, semente in enumerate(sementes):
+        inicios, pontuacoes[i], iteracoes[i] = busca(
+            bases, k, np.random.default_rng(semente), *argumentos)
+        if melhores_inicios is None or pontuacoes[i] < pontuacoes[:i].min():
+            melhores_inicios = inicios
+
+    return pontuacoes, iteracoes, melhores_inicios
+
+
+def _executar(busca, sequencias, k, execucoes, semente, processos,
+              *argumentos):
+    """
+    Reparte as execuções independentes de uma busca entre processos e
+    junta os resultados. Em caso de empate no score fica a execução de menor
+    índice.
+    :rtype: Resultado
+    """
+
+    if execucoes < 1:
+        raise ValueError(f"o número de execuções deve ser positivo, "
+                         f"recebido {execucoes}")
+
+    bases = preparar_sequencias(sequencias, k)
+    processos = numero_de_processos(processos)
+    raiz = np.random.SeedSequence(semente)
+    sementes = raiz.spawn(execucoes)
+    lotes = dividir(execucoes, processos * PEDACOS_POR_PROCESSO)
+
+    if processos == 1 or len(lotes) == 1:
+        partes = [_executar_lote(busca, bases, k, sementes[a:b], *argumentos)
+                  for a, b in lotes]
+    else:
+        with criar_executor(processos) as executor:
+            partes = list(executor.map(
+                _executar_lote, repeat(busca), repeat(bases), repeat(k),
+                [sementes[a:b] for a, b in lotes],
+                *[repeat(argumento) for argumento in argumentos]))
+
+    pontuacoes = np.concatenate([p for p, _, _ in partes])
+    iteracoes = np.concatenate([n for _, n, _ in partes])
+
+    # o primeiro lote com o menor score tem a execução de menor índice
+    minimos = [p.min() for p, _, _ in partes]
+    inicios = partes[int(np.argmin(minimos))][2]
+
+    return Resultado(texto_do_motif(bases, inicios, k),
+                     int(pontuacoes.min()), np.asarray(inicios), pontuacoes,
+                     iteracoes, raiz.entropy)
+
+
+def busca_aleatoria(sequencias, k, reinicios=1000, semente=None,
+                    pseudocontagem=1, processos=None):
+    """
+    Randomized motif search com vários reinícios. Em caso de empate no
+    score fica o reinício de menor índice.
+    :param sequencias: lista de sequencias (str, listas de letras ou arrays)
+    :param k: tamanho dos kmers do motif
+    :param reinicios: quantas buscas independentes fazer
+    :param semente: semente (int) para resultados reproduzíveis; None sorteia
+    uma (ela volta em Resultado.semente)
+    :param pseudocontagem: pseudocontagem dos profiles (1 = Laplace)
+    :param processos: quantos processos usar (padrão: todos os núcleos)
+    :rtype: Resultado
+    """
+
+    return _executar(_busca, sequencias, k, reinicios, semente, processos,
+                     pseudocontagem)
+
+
+def gibbs(sequencias, k, cadeias=20, iteracoes=1000, paciencia=None,
+          semente=None, pseudocontagem=1, processos=None):
+    """
+    Gibbs sampler com várias cadeias independentes. Cada cadeia guarda o
+    melhor motif que visitou; o resultado é o melhor de todas (em
+    Resultado.iteracoes fica quantos passos cada cadeia deu).
+    :param sequencias: lista de sequencias (str, listas de letras ou arrays)
+    :param k: tamanho dos kmers do motif
+    :param cadeias: quantas cadeias executar
+    :param iteracoes: número máximo de passos de cada cadeia
+    :param paciencia: se informado, a cadeia para depois desse número de
+    passos seguidos sem melhorar o score
+    :param semente: semente (int) para resultados reproduzíveis
+    :param pseudocontagem: pseudocontagem do profile (1 = Laplace)
+    :param processos: quantos processos usar (padrão: todos os núcleos)
+    :rtype: Resultado
+    """
+
+    if iteracoes < 1:
+        raise ValueError(f"iteracoes deve ser positivo, recebido {iteracoes}")
+    if paciencia is not None and paciencia < 1:
+        raise ValueError(f"paciencia deve ser positiva, recebida {paciencia}")
+
+    return _executar(_gibbs, sequencias, k, cadeias, semente, processos,
+                     pseudocontagem, iteracoes, paciencia)
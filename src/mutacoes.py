@@ -0,0 +1,184 @@
+"""
+Kmers mais frequentes com até d mutações (erros de base), opcionalmente
+somando também as ocorrências do complemento reverso.
+
+Para cada padrão P de tamanho k, a contagem com mutação é quantas janelas do
+genoma estão a no máximo d erros de P. Em vez de comparar cada janela com
+cada padrão, a soma é feita sobre a contagem exata dos kmers distintos
+(kmers.contar_kmers), espalhando cada kmer para a sua d-vizinhança:
+
+- para k pequeno (4^k cabe na memória) a contagem vira um vetor denso de 4^k
+  posições e a soma sobre a vizinhança é feita posição a posição do kmer,
+  com uma camada por número de erros já usados (custo k * d * 4^k);
+- para k grande a vizinhança de cada kmer distinto é gerada com máscaras XOR
+  sobre os códigos de 2 bits e as contagens são somadas por código.
+"""
+
+from functools import lru_cache
+from itertools import combinations, product
+
+import numpy as np
+
+from kmers import complemento_reverso, validar_k
+
+# maior k para o qual a soma densa (vetor de 4^k posições) é usada
+K_MAXIMO_DENSO = 12
+
+# quantos vizinhos são gerados de uma vez no modo esparso
+VIZINHOS_POR_BLOCO = 1 << 22
+
+
+@lru_cache(maxsize=32)
+def mascaras_vizinhanca(k, d):
+    """
+    Gera as máscaras XOR que levam um código de 2k bits a todos os códigos a
+    no máximo d erros dele. Trocar a base b por b ^ x (x = 1, 2 ou 3) sempre
+    gera uma das outras três bases. A primeira máscara é 0 (o próprio kmer).
+    As máscaras de cada (k, d) são geradas uma vez só e guardadas (o array
+    devolvido é somente leitura).
+    :rtype: numpy.ndarray (uint64)
+    """
+
+    mascaras = [np.zeros(1, dtype=np.uint64)]
+    for erros in range(1, min(d, k) + 1):
+        # todas as combinações de posições x todas as trocas, de uma vez
+        posicoes = np.array(list(combinations(range(k), erros)),
+                            dtype=np.uint64)
+        deslocamentos = np.uint64(2 * (k - 1)) - np.uint64(2) * posicoes
+        trocas = np.array(list(product((1, 2, 3), repeat=erros)),
+                          dtype=np.uint64)
+        partes = trocas[None, :, :] << deslocamentos[:, None, :]
+        mascaras.append(np.bitwise_or.reduce(partes, axis=2).reshape(-1))
+
+    mascaras = np.concatenate(mascaras)
+    mascaras.flags.writeable = False
+    return mascaras
+
+
+def espalhar_vizinhanca(camadas, eixos):
+    """
+    Passo da soma sobre a vizinhança, feito no lugar. A camada j guarda as
+    contagens dos kmers que diferem em exatamente j das posições já
+    processadas; a cada posição (eixo), a camada j recebe a soma das outras
+    três bases da camada j - 1. As camadas são arrays com um eixo de tamanho
+    4 por posição do kmer (a ordem em que os eixos são processados não
+    importa).
+    :param camadas: lista com d + 1 arrays de mesmo formato
+    :param eixos: as posições do kmer a processar
+    """
+
+    for eixo in eixos:
+        for j in range(len(camadas) - 1, 0, -1):
+            anterior = camadas[j - 1]
+            camadas[j] -= anterior
+            camadas[j] += anterior.sum(axis=eixo, keepdims=True)
+
+
+def vetor_denso(codigos, contagens, k, inversas):
+    """
+    Coloca a contagem num vetor de 4^k posições, com um tipo inteiro que
+    comporta a maior soma possível.
+    """
+
+    total = int(contagens.sum()) * (2 if inversas else 1)
+    tipo = np.int32 if total < np.iinfo(np.int32).max else np.int64
+    densa = np.zeros(4 ** k, dtype=tipo)
+    densa[codigos.astype(np.intp)] = contagens
+    return densa
+
+
+def finalizar_denso(somas, k, inversas):
+    """
+    Soma o complemento reverso (se pedido) e devolve só os padrões com
+    contagem maior que zero.
+    :return (padroes em ordem crescente, contagens com mutação)
+    """
+
+    if inversas:
+        todos = np.arange(4 ** k, dtype=np.uint64)
+        somas = somas + somas[complemento_reverso(todos, k).astype(np.intp)]
+
+    padroes = np.flatnonzero(somas)
+    return padroes.astype(np.uint64), somas[padroes].astype(np.int64)
+
+
+def _somar_vizinhanca_densa(contagem_densa, k, d):
+    """
+    Soma, para cada um dos 4^k padrões, as contagens de todos os kmers a no
+    máximo d erros dele.
+    """
+
+    formato = (4,) * k
+    camadas = [contagem_densa.reshape(formato)]
+    camadas += [np.zeros(formato, dtype=contagem_densa.dtype)
+                for _ in range(min(d, k))]
+    espalhar_vizinhanca(camadas, range(k))
+
+    total = camadas[0].copy()
+    for camada in camadas[1:]:
+        total += camada
+
+    return total.reshape(-1)
+
+
+def agrupar(codigos, pesos):
+    distintos, grupo = np.unique(codigos, return_inverse=True)
+    somas = np.bincount(grupo, weights=pesos, minlength=len(distintos))
+    return distintos, somas.astype(np.int64)
+
+
+def somar_vizinhanca_esparsa(codigos, contagens, k, d):
+    """
+    Mesma soma de _somar_vizinhanca_densa, mas só para os padrões que estão
+    na vizinhança de algum kmer presente.
+    :return (padroes em ordem crescente, contagens com mutação)
+    """
+
+    mascaras = mascaras_vizinhanca(k, d)
+    por_bloco = max(1, VIZINHOS_POR_BLOCO // max(len(codigos), 1))
+
+    padroes = np.zeros(0, dtype=np.uint64)
+    somas = np.zeros(0, dtype=np.int64)
+    for inicio in range(0, len(mascaras), por_bloco):
+        bloco = mascaras[inicio:inicio + por_bloco]
+        vizinhos = (codigos[None, :] ^ bloco[:, None]).reshape(-1)
+        pesos = np.tile(contagens, len(bloco))
+        padroes, somas = agrupar(np.concatenate((padroes, vizinhos)),
+                                 np.concatenate((somas, pesos)))
+
+    return padroes, somas
+
+
+def contar_com_mutacao(codigos, contagens, k, d, inversas=False):
+    """
+    Calcula a contagem com até d mutações de todos os padrões que têm pelo
+    menos uma janela na sua vizinhança.
+    :param codigos: kmers distintos (ver kmers.contar_kmers)
+    :param contagens: quantas vezes cada kmer aparece
+    :param k: tamanho dos kmers
+    :param d: número máximo de erros
+    :param inversas: se True, soma também as ocorrências (com mutação) do
+    complemento reverso de cada padrão
+    :return (padroes em ordem crescente, contagens com mutação)
+    :rtype: tuple
+    """
+
+    validar_k(k)
+    if d < 0:
+        raise ValueError(f"d não pode ser negativo, recebido {d}")
+
+    codigos = np.asarray(codigos, dtype=np.uint64)
+    contagens = np.asarray(contagens, dtype=np.int64)
+
+    if k <= K_MAXIMO_DENSO:
+        densa = vetor_denso(codigos, contagens, k, inversas)
+        return finalizar_denso(_somar_vizinhanca_densa(densa, k, d), k,
+                               inversas)
+
+    padroes, somas = somar_vizinhanca_esparsa(codigos, contagens, k, d)
+    if inversas:
+        padroes, somas = agrupar(
+            np.concatenate((padroes, complemento_reverso(padroes, k))),
+            np.concatenate((somas, somas)))
+
+    return padroes, somas
@@ -0,0 +1,369 @@
+"""
+Contagem de kmers e busca com mutação em paralelo, num ProcessPoolExecutor.
+
+Os dados grandes (a sequencia codificada, os códigos ordenados e as camadas
+da soma sobre a vizinhança) ficam numa memória compartilhada
+(multiprocessing.shared_memory): cada tarefa recebe só o nome da memória e o
+pedaço em que deve trabalhar, nada do genoma é serializado. Os resultados
+são idênticos aos das funções seriais (kmers.contar_kmers e
+mutacoes.contar_com_mutacao).
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from kmers import (K_MAXIMO_BINCOUNT, codificar, codigos_kmers,
+                   complemento_reverso, contar_codigos, contar_kmers,
+                   contar_kmers_multiplos, descontar, validar_k)
+from mutacoes import (K_MAXIMO_DENSO, agrupar, contar_com_mutacao,
+                      espalhar_vizinhanca, finalizar_denso,
+                      somar_vizinhanca_esparsa, vetor_denso)
+
+# quantos pedaços cada processo recebe, para equilibrar a carga
+PEDACOS_POR_PROCESSO = 4
+
+# abaixo desse número de bases não compensa abrir processos
+TAMANHO_MINIMO = 1 << 20
+
+# quantos códigos de cada pedaço entram na amostra que define as faixas
+AMOSTRA_POR_PEDACO = 1024
+
+
+def numero_de_processos(processos=None):
+    if processos is None:
+        return os.cpu_count() or 1
+    if processos < 1:
+        raise ValueError(f"processos deve ser positivo, recebido {processos}")
+    return processos
+
+
+def criar_executor(processos):
+    """
+    Um ProcessPoolExecutor com 'processos' processos. Quando há outras
+    threads rodando (como as de pipeline.simultaneas), os processos não são
+    um fork do processo atual, que copiaria travas presas por essas threads,
+    e sim de um forkserver (ou spawn, onde não houver forkserver).
+    """
+
+    contexto = None
+    if threading.active_count() > 1:
+        metodo = 'forkserver' if 'forkserver' in \
+            multiprocessing.get_all_start_methods() else 'spawn'
+        contexto = multiprocessing.get_context(metodo)
+    return ProcessPoolExecutor(processos, mp_context=contexto)
+
+
+def dividir(total, partes):
+    """
+    Divide range(total) em até 'partes' intervalos (inicio, fim) contíguos e
+    de tamanhos parecidos.
+    :rtype: list
+    """
+
+    limites = np.linspace(0, total, min(partes, max(total, 1)) + 1)
+    limites = limites.round().astype(np.int64)
+    return [(int(a), int(b)) for a, b in zip(limites[:-1], limites[1:])
+            if b > a]
+
+
+class ArrayCompartilhado(object):
+    """
+    Array NumPy numa memória compartilhada. Criado (e liberado) pelo
+    processo principal; os outros processos o acessam por 'descricao'.
+    """
+
+    def __init__(self, formato, tipo):
+        tipo = np.dtype(tipo)
+        tamanho = max(int(np.prod(formato)) * tipo.itemsize, 1)
+        self._memoria = shared_memory.SharedMemory(create=True, size=tamanho)
+        self.descricao = (self._memoria.name, tuple(formato), tipo.str)
+        self.array = np.ndarray(formato, dtype=tipo, buffer=self._memoria.buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        self.array = None
+        self._memoria.close()
+        self._memoria.unlink()
+
+
+def usar_compartilhado(descricoes, funcao, *argumentos):
+    """
+    Abre as memórias compartilhadas de 'descricoes' e chama
+    funcao(*arrays, *argumentos). O retorno não pode ser uma visão de um
+    desses arrays.
+    """
+
+    memorias = []
+    try:
+        for nome, _, _ in descricoes:
+            memorias.append(shared_memory.SharedMemory(name=nome))
+
+        arrays = [np.ndarray(formato, dtype=tipo, buffer=memoria.buf)
+                  for (_, formato, tipo), memoria in zip(descricoes, memorias)]
+        return funcao(*arrays, *argumentos)
+    finally:
+        arrays = None
+        for memoria in memorias:
+            memoria.close()
+
+
+def _contar_trecho(bases, inicio, fim, k):
+    return contar_codigos(codigos_kmers(bases[inicio:fim], k), k)
+
+
+def _contar_pedaco(descricao, inicio, fim, k):
+    return usar_compartilhado([descricao], _contar_trecho, inicio, fim, k)
+
+
+def _ordenar_trecho(bases, saida, inicio, fim, k):
+    codigos = np.sort(codigos_kmers(bases[inicio:fim], k))
+    saida[inicio:inicio + len(codigos)] = codigos
+
+    passo = max(len(codigos) // AMOSTRA_POR_PEDACO, 1)
+    return len(codigos), codigos[::passo].copy()
+
+
+def _ordenar_pedaco(descricao_bases, descricao_saida, inicio, fim, k):
+    return usar_compartilhado([descricao_bases, descricao_saida],
+                              _ordenar_trecho, inicio, fim, k)
+
+
+def _contar_faixa_trecho(codigos, trechos, minimo, maximo):
+    partes = []
+    for inicio, tamanho in trechos:
+        trecho = codigos[inicio:inicio + tamanho]
+        a = np.searchsorted(trecho, minimo) if minimo is not None else 0
+        b = np.searchsorted(trecho, maximo) if maximo is not None \
+            else len(trecho)
+        partes.append(trecho[a:b])
+
+    juntos = np.sort(np.concatenate(partes))
+    if len(juntos) == 0:
+        return juntos, np.zeros(0, dtype=np.int64)
+
+    inicios = np.flatnonzero(np.concatenate(
+        ([True], juntos[1:] != juntos[:-1])))
+    return juntos[inicios], np.diff(np.append(inicios, len(juntos)))
+
+
+def _contar_faixa(descricao, trechos, minimo, maximo):
+    return usar_compartilhado([descricao], _contar_faixa_trecho, trechos,
+                              minimo, maximo)
+
+
+def contar_kmers_paralelo(sequencia, k, processos=None):
+    """
+    Mesmo resultado de kmers.contar_kmers, dividindo o trabalho entre
+    processos. A sequencia é cortada em pedaços que se sobrepõem em k - 1
+    bases, então cada janela é contada em exatamente um pedaço.
+
+    - k pequeno: cada pedaço é contado por inteiro e as contagens parciais
+      são somadas.
+    - k grande: cada pedaço ordena seus códigos numa memória compartilhada;
+      depois o espaço de códigos é dividido em faixas (a partir de uma
+      amostra) e cada faixa é contada por um processo. As faixas já saem em
+      ordem, então juntar o resultado é só concatenar.
+
+    :param sequencia: o código genético (qualquer formato aceito por
+    kmers.codificar, inclusive genoma.Genoma)
+    :param processos: quantos processos usar (padrão: todos os núcleos)
+    :return (codigos distintos em ordem crescente, contagens)
+    :rtype: tuple
+    """
+
+    validar_k(k)
+    processos = numero_de_processos(processos)
+    bases = codificar(sequencia)
+    if processos == 1 or len(bases) < TAMANHO_MINIMO:
+        return contar_kmers(bases, k)
+
+    numero_de_janelas = len(bases) - k + 1
+    pedacos = dividir(numero_de_janelas, processos * PEDACOS_POR_PROCESSO)
+    inicios = [a for a, _ in pedacos]
+    fins = [b + k - 1 for _, b in pedacos]
+
+    with ArrayCompartilhado(bases.shape, bases.dtype) as compartilhado, \
+            criar_executor(processos) as executor:
+        compartilhado.array[:] = bases
+
+        if k <= K_MAXIMO_BINCOUNT:
+            partes = list(executor.map(
+                _contar_pedaco, repeat(compartilhado.descricao), inicios,
+                fins, repeat(k)))
+            codigos = np.concatenate([c for c, _ in partes])
+            pesos = np.concatenate([n for _, n in partes])
+            contagens = np.bincount(codigos.astype(np.intp), weights=pesos,
+                                    minlength=4 ** k).astype(np.int64)
+            presentes = np.flatnonzero(contagens)
+            return presentes.astype(np.uint64), contagens[presentes]
+
+        with ArrayCompartilhado((numero_de_janelas,), np.uint64) as saida:
+            ordenados = list(executor.map(
+                _ordenar_pedaco, repeat(compartilhado.descricao),
+                repeat(saida.descricao), inicios, fins, repeat(k)))
+            trechos = [(inicio, tamanho)
+                       for inicio, (tamanho, _) in zip(inicios, ordenados)]
+
+            amostra = np.sort(np.concatenate([a for _, a in ordenados]))
+            faixas = processos * PEDACOS_POR_PROCESSO
+            divisores = [None] + [
+                amostra[i * len(amostra) // faixas]
+                for i in range(1, faixas)] + [None]
+
+            partes = list(executor.map(
+                _contar_faixa, repeat(saida.descricao), repeat(trechos),
+                divisores[:-1], divisores[1:]))
+
+    return (np.concatenate([c for c, _ in partes]),
+            np.concatenate([n for _, n in partes]))
+
+
+def _contar_multiplos_trecho(bases, inicio, fim, ks):
+    # as janelas de todos os k que começam em [inicio, fim), numa passada
+    # só; as que começam a partir de 'fim' (para k < max(ks)) são do
+    # próximo trecho
+    k_maximo = ks[-1]
+    contagens = contar_kmers_multiplos(bases[inicio:fim + k_maximo - 1], ks)
+    if fim < len(bases):
+        for k in ks[:-1]:
+            contagens[k] = descontar(
+                contagens[k], contar_kmers(bases[fim:fim + k_maximo - 1], k))
+    return contagens
+
+
+def _contar_multiplos_pedaco(descricao, inicio, fim, ks):
+    return usar_compartilhado([descricao], _contar_multiplos_trecho, inicio,
+                              fim, ks)
+
+
+def contar_kmers_multiplos_paralelo(sequencia, ks, processos=None):
+    """
+    Mesmo resultado de kmers.contar_kmers_multiplos. Com mais de um
+    processo e uma sequencia grande, ela é dividida em trechos (com
+    max(ks) - 1 bases a mais no fim de cada um), cada processo conta os
+    seus trechos para todos os k numa única passada, e as contagens dos
+    trechos são juntadas no fim.
+    :return dicionario {k: (codigos distintos em ordem crescente, contagens)}
+    :rtype: dict
+    """
+
+    processos = numero_de_processos(processos)
+    bases = codificar(sequencia)
+    if processos == 1 or len(bases) < TAMANHO_MINIMO:
+        return contar_kmers_multiplos(bases, ks)
+
+    ks = sorted(set(ks))
+    for k in ks:
+        validar_k(k)
+    trechos = dividir(len(bases), processos * PEDACOS_POR_PROCESSO)
+
+    with ArrayCompartilhado(bases.shape, bases.dtype) as compartilhado, \
+            criar_executor(processos) as executor:
+        compartilhado.array[:] = bases
+        partes = list(executor.map(
+            _contar_multiplos_pedaco, repeat(compartilhado.descricao),
+            [a for a, _ in trechos], [b for _, b in trechos], repeat(ks)))
+
+    return {k: agrupar(np.concatenate([parte[k][0] for parte in partes]),
+                       np.concatenate([parte[k][1] for parte in partes]))
+            for k in ks}
+
+
+def _espalhar_trecho(camadas, eixos, formato, fatia):
+    visoes = [camada.reshape(formato[0])[fatia].reshape(formato[1])
+              for camada in camadas]
+    espalhar_vizinhanca(visoes, eixos)
+
+
+def _espalhar_linhas(descricao, a, b, k, m):
+    # fixa as m primeiras bases (linhas a até b) e processa as k - m últimas
+    formato = ((4 ** m, 4 ** (k - m)), (b - a,) + (4,) * (k - m))
+    usar_compartilhado([descricao], _espalhar_trecho, range(1, k - m + 1),
+                       formato, np.s_[a:b])
+
+
+def _espalhar_colunas(descricao, a, b, k, m):
+    # fixa as k - m últimas bases (colunas a até b) e processa as m primeiras
+    formato = ((4 ** m, 4 ** (k - m)), (4,) * m + (b - a,))
+    usar_compartilhado([descricao], _espalhar_trecho, range(m), formato,
+                       np.s_[:, a:b])
+
+
+def contar_com_mutacao_paralelo(codigos, contagens, k, d, inversas=False,
+                                processos=None):
+    """
+    Mesmo resultado de mutacoes.contar_com_mutacao, dividindo o trabalho
+    entre processos.
+
+    - k pequeno (soma densa): as camadas ficam numa memória compartilhada.
+      Primeiro cada processo fixa as m primeiras bases de um bloco de padrões
+      e faz a soma nas outras posições; depois fixa as últimas bases e faz a
+      soma nas m primeiras. As duas etapas juntas cobrem todas as posições.
+    - k grande (soma esparsa): os kmers distintos são repartidos entre os
+      processos e as somas parciais são juntadas.
+
+    :param processos: quantos processos usar (padrão: todos os núcleos)
+    :return (padroes em ordem crescente, contagens com mutação)
+    :rtype: tuple
+    """
+
+    validar_k(k)
+    processos = numero_de_processos(processos)
+    codigos = np.asarray(codigos, dtype=np.uint64)
+    contagens = np.asarray(contagens, dtype=np.int64)
+    pequeno = 4 ** k < TAMANHO_MINIMO if k <= K_MAXIMO_DENSO \
+        else len(codigos) < PEDACOS_POR_PROCESSO * processos
+    if processos == 1 or d <= 0 or pequeno:
+        return contar_com_mutacao(codigos, contagens, k, d, inversas)
+
+    partes = processos * PEDACOS_POR_PROCESSO
+
+    if k > K_MAXIMO_DENSO:
+        blocos = dividir(len(codigos), partes)
+        with criar_executor(processos) as executor:
+            parciais = list(executor.map(
+                somar_vizinhanca_esparsa, [codigos[a:b] for a, b in blocos],
+                [contagens[a:b] for a, b in blocos], repeat(k), repeat(d)))
+
+        padroes = np.concatenate([p for p, _ in parciais])
+        somas = np.concatenate([s for _, s in parciais])
+        if inversas:
+            padroes = np.concatenate((padroes,
+                                      complemento_reverso(padroes, k)))
+            somas = np.concatenate((somas, somas))
+        return agrupar(padroes, somas)
+
+    # m primeiras bases fixadas na primeira etapa: o bastante para ter
+    # pedaços para todos os processos
+    m = 1
+    while m < k - 1 and 4 ** m < partes:
+        m += 1
+
+    densa = vetor_denso(codigos, contagens, k, inversas)
+    with ArrayCompartilhado((min(d, k) + 1, 4 ** k), densa.dtype) as camadas, \
+            criar_executor(processos) as executor:
+        camadas.array[0] = densa
+        camadas.array[1:] = 0
+        del densa
+
+        linhas = dividir(4 ** m, partes)
+        list(executor.map(_espalhar_linhas, repeat(camadas.descricao),
+                          [a for a, _ in linhas], [b for _, b in linhas],
+                          repeat(k), repeat(m)))
+
+        colunas = dividir(4 ** (k - m), partes)
+        list(executor.map(_espalhar_colunas, repeat(camadas.descricao),
+                          [a for a, _ in colunas], [b for _, b in colunas],
+                          repeat(k), repeat(m)))
+
+        somas = camadas.array.sum(axis=0)
+
+    return finalizar_denso(somas, k, inversas)
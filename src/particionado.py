@@ -0,0 +1,221 @@
+"""
+Contagem de kmers fora da memória, em partições no disco, para genomas
+maiores que a RAM.
+
+A sequencia é lida em blocos (ver kmers.blocos_de_bases) e o código de cada
+kmer vai para o arquivo da sua partição, escolhida pelas primeiras bases do
+kmer (os bits mais altos do código). Cada partição é contada sozinha, com
+memória limitada; uma partição que ainda não cabe na memória é dividida de
+novo pelas bases seguintes, quantas vezes for preciso. Como as partições são
+faixas de códigos em ordem, as tabelas contadas só precisam ser emendadas
+(resultados.juntar_contagens) para formar a tabela completa, no mesmo
+formato .kmers da contagem em memória, e os mais frequentes saem de uma
+passada pelas tabelas.
+
+O disco usado é de 8 bytes por janela do genoma (os códigos das partições)
+mais a tabela final.
+"""
+
+import os
+import tempfile
+from collections import namedtuple
+from itertools import repeat
+
+import numpy as np
+
+from kmers import blocos_de_bases, codigos_kmers, mais_frequentes, validar_k
+from paralelo import criar_executor, numero_de_processos
+from resultados import carregar_contagem, juntar_contagens, salvar_contagem
+
+# memória (em bytes) usada por padrão, somando todos os processos
+MEMORIA_PADRAO = 1 << 28
+
+# partições da primeira divisão (arredondado para cima para uma potência
+# de 4: uma partição por prefixo de bases)
+PARTICOES = 64
+
+# no máximo 4^4 = 256 partições (arquivos abertos ao mesmo tempo) em cada
+# divisão
+BASES_MAXIMAS = 4
+
+# bases usadas para dividir de novo uma partição que não cabe na memória
+BASES_POR_DIVISAO = 3
+
+# bytes por base do bloco durante a distribuição (códigos, partições e
+# ordenação)
+_BYTES_POR_BASE = 48
+
+# bytes por código durante a contagem de uma partição (leitura, ordenação e
+# agrupamento)
+_BYTES_POR_CODIGO = 32
+
+_EXTENSAO_CODIGOS = '.codigos'
+
+ContagemParticionada = namedtuple('ContagemParticionada',
+                                  ['distintos', 'janelas', 'frequentes',
+                                   'maior_repeticao'])
+ContagemParticionada.__doc__ = """
+Resultado de contar_particionado (a tabela completa fica no arquivo): o
+número de kmers distintos, o total de janelas contadas, os códigos dos kmers
+de maior repetição, em ordem crescente, e essa repetição.
+"""
+
+
+def _bases_do_prefixo(particoes, k):
+    bases = 0
+    while 4 ** bases < particoes:
+        bases += 1
+    return min(bases, k, BASES_MAXIMAS)
+
+
+def _caminho_da_particao(prefixo, indice, bases):
+    # o índice com dígitos fixos mantém a ordem dos nomes igual à dos códigos
+    return f"{prefixo}_{indice:0{max(bases, 1)}x}{_EXTENSAO_CODIGOS}"
+
+
+def _distribuir(blocos_de_codigos, prefixo, deslocamento, bases):
+    """
+    Grava cada código no arquivo da sua partição: as 'bases' bases logo
+    acima dos 'deslocamento' bits mais baixos.
+    :return os caminhos das partições, em ordem de código (None nas vazias)
+    :rtype: list
+    """
+
+    particoes = 4 ** bases
+    mascara = np.uint64(particoes - 1)
+    caminhos = [None] * particoes
+    arquivos = {}
+    try:
+        for codigos in blocos_de_codigos:
+            if len(codigos) == 0:
+                continue
+            indices = ((codigos >> np.uint64(deslocamento)) &
+                       mascara).astype(np.uint16)
+            ordem = np.argsort(indices, kind='stable')
+            limites = np.concatenate(([0], np.cumsum(
+                np.bincount(indices, minlength=particoes))))
+            codigos = codigos[ordem]
+            for indice in np.flatnonzero(np.diff(limites)).tolist():
+                if indice not in arquivos:
+                    caminhos[indice] = _caminho_da_particao(prefixo, indice,
+                                                            bases)
+                    arquivos[indice] = open(caminhos[indice], 'wb')
+                arquivos[indice].write(
+                    codigos[limites[indice]:limites[indice + 1]].tobytes())
+    finally:
+        for arquivo in arquivos.values():
+            arquivo.close()
+    return caminhos
+
+
+def _ler_em_blocos(caminho, codigos_por_bloco):
+    with open(caminho, 'rb') as arquivo:
+        while True:
+            codigos = np.fromfile(arquivo, dtype=np.uint64,
+                                  count=codigos_por_bloco)
+            if len(codigos) == 0:
+                return
+            yield codigos
+
+
+def _contar_particao(caminho, k, deslocamento, memoria):
+    """
+    Conta os códigos de uma partição (os que têm os mesmos bits acima de
+    'deslocamento'), dividindo-a de novo enquanto ela não couber em
+    'memoria'. O arquivo de códigos é apagado e cada tabela contada vai
+    para um .kmers ao lado dele.
+    :return os caminhos das tabelas, em ordem de código
+    :rtype: list
+    """
+
+    codigos_no_arquivo = os.path.getsize(caminho) // 8
+    base = caminho[:-len(_EXTENSAO_CODIGOS)]
+
+    if deslocamento == 0:
+        # todos os códigos da partição são iguais
+        codigos = np.fromfile(caminho, dtype=np.uint64, count=1)
+        contagens = np.array([codigos_no_arquivo], dtype=np.int64)
+    elif codigos_no_arquivo * _BYTES_POR_CODIGO <= memoria:
+        codigos, contagens = np.unique(np.fromfile(caminho, dtype=np.uint64),
+                                       return_counts=True)
+    else:
+        bases = min(BASES_POR_DIVISAO, deslocamento // 2)
+        deslocamento -= 2 * bases
+        partes = _distribuir(
+            _ler_em_blocos(caminho, max(1, memoria // _BYTES_POR_BASE)), base,
+            deslocamento, bases)
+        os.remove(caminho)
+        tabelas = []
+        for parte in partes:
+            if parte is not None:
+                tabelas += _contar_particao(parte, k, deslocamento, memoria)
+        return tabelas
+
+    tabela = base + '.kmers'
+    salvar_contagem(tabela, codigos, contagens, k)
+    os.remove(caminho)
+    return [tabela]
+
+
+def contar_particionado(sequencia, k, caminho, memoria=MEMORIA_PADRAO,
+                        particoes=PARTICOES, processos=1, diretorio=None):
+    """
+    Conta todos os kmers de tamanho k da sequencia em partições no disco e
+    salva a tabela completa em 'caminho', no formato de
+    resultados.salvar_contagem (igual à de kmers.contar_kmers).
+    :param sequencia: qualquer formato aceito por kmers.codificar; um
+    genoma.Genoma é lido em blocos, sem ser carregado inteiro
+    :param memoria: memória aproximada (em bytes) usada, dividida entre os
+    processos
+    :param particoes: partições da primeira divisão
+    :param processos: processos contando partições ao mesmo tempo (None:
+    todos os núcleos)
+    :param diretorio: onde criar os arquivos temporários (padrão: o
+    diretório temporário do sistema)
+    :rtype: ContagemParticionada
+    """
+
+    validar_k(k)
+    processos = numero_de_processos(processos)
+    memoria_por_processo = max(1, memoria // processos)
+    bases = _bases_do_prefixo(particoes, k)
+    deslocamento = 2 * (k - bases)
+
+    with tempfile.TemporaryDirectory(dir=diretorio) as temporario:
+        blocos = (codigos_kmers(bases_do_bloco, k) for _, bases_do_bloco in
+                  blocos_de_bases(sequencia,
+                                  max(1 << 12, memoria // _BYTES_POR_BASE),
+                                  k - 1))
+        partes = [parte for parte in _distribuir(
+            blocos, os.path.join(temporario, 'p'), deslocamento, bases)
+            if parte is not None]
+
+        if processos > 1 and len(partes) > 1:
+            with criar_executor(processos) as executor:
+                tabelas = list(executor.map(
+                    _contar_particao, partes, repeat(k),
+                    repeat(deslocamento), repeat(memoria_por_processo)))
+        else:
+            tabelas = [_contar_particao(parte, k, deslocamento,
+                                        memoria_por_processo)
+                       for parte in partes]
+        tabelas = [tabela for lista in tabelas for tabela in lista]
+
+        distintos = juntar_contagens(caminho, tabelas, k)
+
+        # os mais frequentes de cada partição, guardando só os que empatam
+        # com a maior repetição vista até agora
+        frequentes, maior_repeticao, janelas = [], 0, 0
+        for tabela in tabelas:
+            codigos, contagens, _ = carregar_contagem(tabela)
+            janelas += int(contagens.sum())
+            codigos, repeticao = mais_frequentes(codigos, contagens)
+            if repeticao > maior_repeticao:
+                frequentes, maior_repeticao = [], repeticao
+            if repeticao == maior_repeticao:
+                frequentes.append(codigos)
+
+    frequentes = np.concatenate(frequentes) if frequentes \
+        else np.zeros(0, dtype=np.uint64)
+    return ContagemParticionada(distintos, janelas, frequentes,
+                                maior_repeticao)
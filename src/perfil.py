@@ -0,0 +1,263 @@
+"""
+Varredura de sequencias com um profile (matriz de probabilidade por posição,
+PWM), em log-probabilidade.
+
+O profile segue o formato do DNA.py: 4 linhas (A, C, G, T) e uma coluna por
+posição do kmer. Multiplicar probabilidades base a base faz qualquer trecho
+um pouco maior virar 0.0; somando logaritmos a pontuação continua
+comparável para qualquer k. Bases fora de ACGT (e probabilidades zero)
+pontuam -inf.
+
+A classe Profile guarda as contagens de uma matriz de motif num array 4 x k
+e pode ser atualizada um kmer por vez (O(k)), sem recontar a matriz inteira
+a cada iteração das buscas de motif.
+"""
+
+import numpy as np
+
+from kmers import BASES, codificar
+
+
+class Profile(object):
+    """
+    Profile de contagens (4 x k, linhas A, C, G, T) de um conjunto de kmers,
+    com pseudocontagens de Laplace. Pode ser passado direto para as funções
+    de varredura (np.asarray(profile) são as probabilidades).
+    """
+
+    __slots__ = ('contagens', 'pseudocontagem', 'total')
+
+    def __init__(self, k, pseudocontagem=0):
+        """
+        :param k: tamanho dos kmers
+        :param pseudocontagem: quanto somar a cada célula ao calcular as
+        probabilidades (1 é a regra de Laplace; 0 mantém as frequências)
+        """
+
+        if pseudocontagem < 0:
+            raise ValueError(f"a pseudocontagem não pode ser negativa, "
+                             f"recebida {pseudocontagem}")
+        self.contagens = np.zeros((4, k), dtype=np.int64)
+        self.pseudocontagem = pseudocontagem
+        self.total = 0
+
+    @classmethod
+    def de_motif(cls, motif, pseudocontagem=0):
+        """
+        Monta o profile de uma matriz de motif (lista de kmers de mesmo
+        tamanho, como strings ou listas de letras, ou um array t x k já
+        codificado), contando todas as células de uma vez.
+        """
+
+        if isinstance(motif, np.ndarray) and motif.ndim == 2:
+            indices = cls._codificar(motif)
+        else:
+            indices = np.stack([cls._codificar(kmer) for kmer in motif])
+        profile = cls(indices.shape[1], pseudocontagem)
+        for base in range(4):
+            profile.contagens[base] = np.count_nonzero(indices == base,
+                                                       axis=0)
+        profile.total = len(indices)
+        return profile
+
+    @staticmethod
+    def _codificar(kmer):
+        indices = codificar(kmer)
+        if np.any(indices > 3):
+            raise ValueError(f"kmer com base inválida: {kmer!r}")
+        return indices
+
+    @property
+    def k(self):
+        return self.contagens.shape[1]
+
+    def __len__(self):
+        return self.total
+
+    def __array__(self, dtype=None, copy=None):
+        probabilidades = self.probabilidades()
+        if dtype is None:
+            return probabilidades
+        return probabilidades.astype(dtype)
+
+    def _atualizar(self, kmer, quantidade):
+        indices = self._codificar(kmer)
+        if len(indices) != self.k:
+            raise ValueError(f"o kmer deve ter tamanho {self.k}, recebido "
+                             f"{len(indices)}")
+        self.contagens[indices, np.arange(self.k)] += quantidade
+        self.total += quantidade
+
+    def adicionar_kmer(self, kmer):
+        """
+        Soma um kmer às contagens.
+        """
+
+        self._atualizar(kmer, 1)
+
+    def remover_kmer(self, kmer):
+        """
+        Retira das contagens um kmer adicionado antes.
+        """
+
+        if self.total == 0:
+            raise ValueError("o profile está vazio")
+        self._atualizar(kmer, -1)
+
+    def copiar(self):
+        copia = Profile(self.k, self.pseudocontagem)
+        copia.contagens[:] = self.contagens
+        copia.total = self.total
+        return copia
+
+    def probabilidades(self):
+        """
+        :return a matriz de probabilidades (contagem + pseudocontagem, sobre
+        o total da coluna); um profile vazio e sem pseudocontagem é uniforme
+        :rtype: numpy.ndarray (4 x k)
+        """
+
+        denominador = self.total + 4 * self.pseudocontagem
+        if denominador == 0:
+            return np.full(self.contagens.shape, 0.25)
+        return (self.contagens + self.pseudocontagem) / denominador
+
+    def consenso(self):
+        """
+        A sequencia mais provável: a base mais frequente de cada coluna (num
+        empate fica a última de ACGT, como em DNA.criar_sequencia_provavel).
+        :rtype: str
+        """
+
+        mais_frequentes = 3 - np.argmax(self.contagens[::-1], axis=0)
+        return ''.join(BASES[i] for i in mais_frequentes).upper()
+
+    def pontuacao(self):
+        """
+        Score do motif: quantas letras de cada coluna diferem da base mais
+        frequente, somado sobre as colunas (quanto menor, melhor).
+        :rtype: int
+        """
+
+        return int(self.total * self.k - self.contagens.max(axis=0).sum())
+
+    def entropia(self):
+        """
+        Soma da entropia (em bits) das frequências de cada coluna, sem as
+        pseudocontagens.
+        :rtype: float
+        """
+
+        if self.total == 0:
+            return 0.0
+        frequencias = self.contagens / self.total
+        with np.errstate(divide='ignore', invalid='ignore'):
+            termos = frequencias * np.log2(frequencias)
+        return float(-np.nansum(termos))
+
+
+def log_profile(profile):
+    """
+    Logaritmo do profile, com uma 5a linha de -inf para bases inválidas.
+    :rtype: numpy.ndarray (5 x k)
+    """
+
+    profile = np.asarray(profile, dtype=np.float64)
+    if profile.ndim != 2 or profile.shape[0] != 4:
+        raise ValueError("o profile deve ter 4 linhas (A, C, G, T)")
+
+    with np.errstate(divide='ignore'):
+        log = np.log(profile)
+
+    return np.vstack((log, np.full(profile.shape[1], -np.inf)))
+
+
+def _e_uma_sequencia(sequencias):
+    if isinstance(sequencias, (str, bytes)):
+        return True
+    if isinstance(sequencias, np.ndarray):
+        return sequencias.ndim == 1
+    return len(sequencias) == 0 or isinstance(sequencias[0], str) and \
+        len(sequencias[0]) == 1
+
+
+def _pontuar(log, indices):
+    """
+    Soma, coluna a coluna do profile, o log da base de cada janela: k
+    operações sobre todas as janelas de uma vez (a última dimensão de
+    'indices' é a das posições na sequencia).
+    """
+
+    k = log.shape[1]
+    janelas = indices.shape[-1] - k + 1
+    if janelas <= 0:
+        return np.zeros(indices.shape[:-1] + (0,))
+
+    pontuacao = np.take(log[:, 0], indices[..., :janelas])
+    for coluna in range(1, k):
+        pontuacao += np.take(log[:, coluna],
+                             indices[..., coluna:coluna + janelas])
+    return pontuacao
+
+
+def pontuar_janelas(profile, sequencias):
+    """
+    Log-probabilidade de cada janela (de tamanho igual ao do profile) de uma
+    ou várias sequencias, numa única operação vetorizada: as bases de todas
+    as janelas indexam o log do profile e são somadas.
+    :param profile: o profile (4 x k)
+    :param sequencias: uma sequencia (str, lista de letras, array) ou uma
+    lista delas (como uma matriz de motif)
+    :return um array com a pontuação de cada janela; para várias sequencias,
+    um array 2D (se todas têm o mesmo tamanho) ou uma lista de arrays
+    """
+
+    log = log_profile(profile)
+    k = log.shape[1]
+
+    if _e_uma_sequencia(sequencias):
+        return _pontuar(log, codificar(sequencias))
+
+    indices = [codificar(s) for s in sequencias]
+    tamanhos = {len(s) for s in indices}
+    if len(tamanhos) == 1 and tamanhos.pop() >= k:
+        return _pontuar(log, np.stack(indices))
+
+    return [_pontuar(log, s) for s in indices]
+
+
+def mais_provavel(profile, sequencia):
+    """
+    Acha o kmer mais provável (profile-most-probable) de uma sequencia. Em
+    caso de empate fica o primeiro.
+    :return (posicao de inicio, log-probabilidade)
+    :rtype: tuple
+    """
+
+    pontuacao = pontuar_janelas(profile, sequencia)
+    inicio = int(np.argmax(pontuacao))
+    return inicio, float(pontuacao[inicio])
+
+
+def mais_provaveis(profile, sequencias):
+    """
+    Posição de início do kmer mais provável de cada sequencia.
+    :rtype: numpy.ndarray (int)
+    """
+
+    pontuacao = pontuar_janelas(profile, sequencias)
+    if isinstance(pontuacao, list):
+        return np.array([int(np.argmax(p)) for p in pontuacao])
+    return np.argmax(pontuacao, axis=-1)
+
+
+def kmers_mais_provaveis(profile, sequencias):
+    """
+    Os kmers mais prováveis de cada sequencia, como strings.
+    :rtype: list
+    """
+
+    k = np.shape(profile)[1]
+    inicios = mais_provaveis(profile, sequencias)
+    return [''.join(sequencia[inicio:inicio + k])
+            for sequencia, inicio in zip(sequencias, inicios)]
@@ -0,0 +1,210 @@
+"""
+Etapas da análise encadeadas como geradores, com os resultados passando de
+uma etapa para a outra na memória.
+
+Cada etapa recebe um iterador e devolve outro: a contagem transforma blocos
+da sequencia em um Registro por k (códigos e contagens), e as etapas
+seguintes recebem e repassam os registros, guardando o que calculam em
+'resultados'. Os registros passam um de cada vez pelas etapas, e nada é
+gravado em arquivo entre uma etapa e outra.
+
+As etapas que só dependem da contagem (como as inversas, as mutações e os
+clumps) podem rodar ao mesmo tempo com 'simultaneas', em threads: as
+operações do NumPy liberam o GIL e a busca com mutação já divide o trabalho
+em processos (ver paralelo.py, que não usa fork enquanto essas threads
+rodam; quem chama divide os núcleos entre os registros em andamento).
+Enquanto as tarefas de um k rodam, as do próximo k já são iniciadas, então
+o tempo total fica perto do da etapa mais lenta.
+
+Exemplo (ver main.main):
+
+    registros = contar(genoma, range(7, 10))
+    registros = simultaneas(registros, {'inversas': ..., 'mutacoes': ...})
+    registros = aplicar(registros, salvar)
+    executar(registros)
+"""
+
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from kmers import blocos_de_bases, contar_kmers, descontar
+from mutacoes import agrupar
+from paralelo import contar_kmers_multiplos_paralelo
+from particionado import MEMORIA_PADRAO, contar_particionado
+from resultados import carregar_contagem
+
+# bases por bloco na leitura da sequencia
+TAMANHO_BLOCO = 1 << 22
+
+# registros com tarefas em andamento ao mesmo tempo em 'simultaneas'
+REGISTROS_EM_ANDAMENTO = 2
+
+Registro = namedtuple('Registro', ['k', 'codigos', 'contagens',
+                                   'resultados'])
+Registro.__doc__ = """
+A contagem dos kmers de tamanho k (códigos distintos em ordem crescente e
+contagens) e um dicionário com o que as etapas calcularam a partir dela.
+"""
+
+
+def _novo_registro(k, contagem):
+    codigos, contagens = contagem
+    return Registro(k, codigos, contagens, {})
+
+
+def contar_blocos(blocos, ks, tamanho, processos=1):
+    """
+    Etapa de contagem: conta cada bloco de uma vez, para todos os k, e junta
+    as contagens dos blocos no fim. Cada bloco conta só as janelas que
+    começam nas suas 'tamanho' primeiras bases (as outras são do próximo
+    bloco).
+    :param blocos: iterador de (inicio, bases), como kmers.blocos_de_bases
+    com sobreposição de pelo menos max(ks) - 1 bases
+    :param processos: processos da contagem de cada bloco (None: todos os
+    núcleos; ver paralelo.py)
+    :return gerador de Registro, em ordem crescente de k
+    """
+
+    ks = sorted(set(ks))
+    k_maximo = ks[-1]
+    partes = {k: [] for k in ks}
+
+    def guardar(contagens):
+        for k, contagem in contagens.items():
+            partes[k].append(contagem)
+
+    # um bloco só é contado quando chega o próximo, para saber se ele é o
+    # último (que conta todas as suas janelas)
+    anterior = None
+    for _, bases in blocos:
+        if anterior is not None:
+            contagens = contar_kmers_multiplos_paralelo(
+                anterior[:tamanho + k_maximo - 1], ks, processos)
+            # para k < k_maximo sobram as janelas que começam depois de
+            # 'tamanho', que o próximo bloco também conta
+            for k in ks[:-1]:
+                contagens[k] = descontar(
+                    contagens[k],
+                    contar_kmers(anterior[tamanho:tamanho + k_maximo - 1], k))
+            guardar(contagens)
+        anterior = bases
+    if anterior is not None:
+        guardar(contar_kmers_multiplos_paralelo(anterior, ks, processos))
+
+    for k in ks:
+        contagens = partes.pop(k)
+        if not contagens:
+            contagem = contar_kmers('', k)
+        elif len(contagens) == 1:
+            contagem = contagens[0]
+        else:
+            # uma única junção, de todos os blocos, no fim
+            codigos, repeticoes = zip(*contagens)
+            contagem = agrupar(np.concatenate(codigos),
+                               np.concatenate(repeticoes))
+        yield _novo_registro(k, contagem)
+
+
+def contar(sequencia, ks, cache=None, tamanho_bloco=TAMANHO_BLOCO,
+          processos=1):
+    """
+    Etapa de contagem a partir da sequencia: do cache (ver
+    cache.CacheDeContagens), se houver, ou lendo a sequencia em blocos.
+    :param processos: processos da contagem do que não estiver no cache
+    (None: todos os núcleos; ver paralelo.py)
+    :return gerador de Registro, em ordem crescente de k
+    """
+
+    if cache is not None:
+        contagens = cache.contagens(sequencia, ks, processos=processos)
+        for k, contagem in sorted(contagens.items()):
+            yield _novo_registro(k, contagem)
+        return
+
+    yield from contar_blocos(
+        blocos_de_bases(sequencia, tamanho_bloco, max(ks) - 1), ks,
+        tamanho_bloco, processos)
+
+
+def contar_em_particoes(sequencia, ks, caminhos, memoria=MEMORIA_PADRAO,
+                        processos=1):
+    """
+    Etapa de contagem para genomas maiores que a memória: cada k é contado
+    em partições no disco (ver particionado.py), usando cerca de 'memoria'
+    bytes, e salvo em caminhos[k]. Os registros trazem a tabela mapeada do
+    arquivo (np.memmap), sem carregá-la.
+    :param caminhos: dicionário {k: caminho da tabela}
+    :return gerador de Registro, em ordem crescente de k
+    """
+
+    for k in sorted(set(ks)):
+        # os temporários ficam ao lado da tabela, e não no diretório
+        # temporário do sistema (que pode estar na memória)
+        contar_particionado(sequencia, k, caminhos[k], memoria,
+                            processos=processos,
+                            diretorio=os.path.dirname(caminhos[k]) or None)
+        codigos, contagens, _ = carregar_contagem(caminhos[k], mapear=True)
+        yield _novo_registro(k, (codigos, contagens))
+
+
+def aplicar(registros, funcao, nome=None):
+    """
+    Etapa que chama funcao(registro) para cada registro, guardando o
+    resultado em registro.resultados[nome] (se 'nome' for dado).
+    :return gerador dos mesmos registros
+    """
+
+    for registro in registros:
+        resultado = funcao(registro)
+        if nome is not None:
+            registro.resultados[nome] = resultado
+        yield registro
+
+
+def simultaneas(registros, tarefas, threads=None,
+                em_andamento=REGISTROS_EM_ANDAMENTO):
+    """
+    Etapa que roda, ao mesmo tempo, tarefas independentes sobre cada
+    registro, guardando o resultado de cada uma em
+    registro.resultados[nome]. As tarefas de até 'em_andamento' registros
+    rodam juntas; os registros saem na ordem em que entraram.
+    :param tarefas: dicionário {nome: funcao(registro)}
+    :param threads: threads do executor (padrão: uma por tarefa de cada
+    registro em andamento)
+    :return gerador dos mesmos registros
+    """
+
+    if threads is None:
+        threads = max(1, len(tarefas) * em_andamento)
+
+    pendentes = deque()
+    with ThreadPoolExecutor(threads) as executor:
+        for registro in registros:
+            pendentes.append((registro, {
+                nome: executor.submit(funcao, registro)
+                for nome, funcao in tarefas.items()}))
+            if len(pendentes) >= em_andamento:
+                yield _concluir(*pendentes.popleft())
+        while pendentes:
+            yield _concluir(*pendentes.popleft())
+
+
+def _concluir(registro, futuros):
+    wait(futuros.values())
+    for nome, futuro in futuros.items():
+        # result() repassa a exceção da tarefa, se houver
+        registro.resultados[nome] = futuro.result()
+    return registro
+
+
+def executar(registros):
+    """
+    Consome o pipeline até o fim.
+    :return os registros que saíram da última etapa
+    :rtype: list
+    """
+
+    return list(registros)
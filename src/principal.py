@@ -1,9 +1,9 @@
-import DNA
+from DNA import DNA
+from sequencia import Sequencia
 
 
 def main():
-    sequencia = "GCAAAGACGCTGACCAA"
-    sequencia = list(sequencia)
+    sequencia = Sequencia("GCAAAGACGCTGACCAA")
     dna = DNA()
     dna.calcular_distancia(sequencia, 8)
 
@@ -0,0 +1,193 @@
+"""
+Armazenamento dos resultados de contagem.
+
+Formato binário (.kmers), pensado para ser lido de uma vez ou mapeado na
+memória (np.memmap):
+
+    bytes 0-7    assinatura b'BIOKMR' + versão (uint16)
+    bytes 8-11   k (uint32)
+    bytes 12-15  opções (uint32; bit 0 = contagem canônica)
+    bytes 16-23  n, número de kmers distintos (uint64)
+    depois       n códigos (uint64) e n contagens (int64), little-endian
+
+Os códigos são os de kmers.py (2 bits por base), então a tabela é salva e
+carregada sem perda nenhuma. Para leitura humana há também a exportação em
+TSV.
+
+Todo arquivo é escrito num temporário e renomeado no fim, então quem o lê ao
+mesmo tempo (outro processo do lote.py, por exemplo) vê a versão anterior
+inteira ou a nova inteira, nunca um arquivo pela metade.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from kmers import decodificar
+
+ASSINATURA = b'BIOKMR'
+VERSAO = 1
+CANONICA = 1
+
+# linhas de um TSV montadas (como texto) de cada vez em salvar_tsv
+LINHAS_POR_PEDACO = 1 << 16
+
+_CABECALHO = np.dtype([('assinatura', 'S6'), ('versao', '<u2'), ('k', '<u4'),
+                       ('opcoes', '<u4'), ('n', '<u8')])
+
+
+@contextmanager
+def _escrever(caminho, modo='wb'):
+    """
+    Abre um temporário ao lado de 'caminho' e, se tudo der certo, o renomeia
+    para 'caminho' (os.replace é atômico).
+    """
+
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporario, modo) as arquivo:
+            yield arquivo
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def salvar_contagem(caminho, codigos, contagens, k, canonica=False):
+    """
+    Salva uma tabela de contagem (códigos e contagens) no formato binário.
+    :param caminho: arquivo de destino (normalmente terminado em .kmers)
+    :param canonica: se os códigos são kmers canônicos
+    """
+
+    codigos = np.ascontiguousarray(codigos, dtype='<u8')
+    contagens = np.ascontiguousarray(contagens, dtype='<i8')
+    if len(codigos) != len(contagens):
+        raise ValueError("códigos e contagens devem ter o mesmo tamanho")
+
+    cabecalho = np.zeros(1, dtype=_CABECALHO)
+    cabecalho[0] = (ASSINATURA, VERSAO, k, CANONICA if canonica else 0,
+                    len(codigos))
+
+    with _escrever(caminho) as arquivo:
+        arquivo.write(cabecalho.tobytes())
+        arquivo.write(codigos.tobytes())
+        arquivo.write(contagens.tobytes())
+
+
+def juntar_contagens(caminho, partes, k, canonica=False):
+    """
+    Junta tabelas salvas por salvar_contagem num único arquivo, lendo (e
+    mapeando) uma parte de cada vez, sem carregar a tabela inteira. As
+    partes devem estar em ordem de código e não repetir códigos entre si,
+    para o resultado continuar ordenado.
+    :param partes: caminhos das tabelas, na ordem
+    :return número de kmers distintos da tabela junta
+    :rtype: int
+    """
+
+    tamanhos = [ler_cabecalho(parte)[2] for parte in partes]
+    cabecalho = np.zeros(1, dtype=_CABECALHO)
+    cabecalho[0] = (ASSINATURA, VERSAO, k, CANONICA if canonica else 0,
+                    sum(tamanhos))
+
+    with _escrever(caminho) as arquivo:
+        arquivo.write(cabecalho.tobytes())
+        # todos os códigos primeiro, depois todas as contagens
+        for coluna in (0, 1):
+            for parte, n in zip(partes, tamanhos):
+                if n:
+                    arquivo.write(carregar_contagem(parte, mapear=True)
+                                  [coluna].tobytes())
+
+    return sum(tamanhos)
+
+
+def ler_cabecalho(caminho):
+    """
+    :return (k, canonica, n)
+    :rtype: tuple
+    """
+
+    cabecalho = np.fromfile(caminho, dtype=_CABECALHO, count=1)
+    if len(cabecalho) == 0 or cabecalho[0]['assinatura'] != ASSINATURA:
+        raise ValueError(f"{caminho} não é um arquivo de contagem de kmers")
+    if cabecalho[0]['versao'] != VERSAO:
+        raise ValueError(f"{caminho}: versão {cabecalho[0]['versao']} do "
+                         f"formato não suportada")
+
+    return (int(cabecalho[0]['k']), bool(cabecalho[0]['opcoes'] & CANONICA),
+            int(cabecalho[0]['n']))
+
+
+def carregar_contagem(caminho, mapear=False):
+    """
+    Carrega uma tabela salva por salvar_contagem.
+    :param mapear: se True, os arrays são mapeados do arquivo (np.memmap)
+    em vez de lidos, e só as partes usadas são carregadas
+    :return (codigos, contagens, k)
+    :rtype: tuple
+    """
+
+    k, _, n = ler_cabecalho(caminho)
+    inicio = _CABECALHO.itemsize
+
+    if mapear:
+        if n == 0:
+            return np.zeros(0, '<u8'), np.zeros(0, '<i8'), k
+        codigos = np.memmap(caminho, dtype='<u8', mode='r', offset=inicio,
+                            shape=(n,))
+        contagens = np.memmap(caminho, dtype='<i8', mode='r',
+                              offset=inicio + 8 * n, shape=(n,))
+        return codigos, contagens, k
+
+    with open(caminho, 'rb') as arquivo:
+        arquivo.seek(inicio)
+        dados = np.fromfile(arquivo, dtype='<u8', count=2 * n)
+
+    return dados[:n], dados[n:].view('<i8'), k
+
+
+def salvar_tsv(caminho, cabecalho, colunas):
+    """
+    Salva colunas (listas ou arrays de mesmo tamanho) num arquivo separado
+    por tabulações, com uma linha de cabeçalho. As linhas são escritas em
+    pedaços de LINHAS_POR_PEDACO, e os arrays só viram listas um pedaço de
+    cada vez.
+    """
+
+    total = min((len(coluna) for coluna in colunas), default=0)
+    with _escrever(caminho, 'w') as arquivo:
+        arquivo.write('\t'.join(cabecalho) + '\n')
+        for inicio in range(0, total, LINHAS_POR_PEDACO):
+            pedaco = [coluna[inicio:inicio + LINHAS_POR_PEDACO]
+                      for coluna in colunas]
+            pedaco = [coluna.tolist() if isinstance(coluna, np.ndarray)
+                      else coluna for coluna in pedaco]
+            arquivo.write(''.join('\t'.join(map(str, linha)) + '\n'
+                                  for linha in zip(*pedaco)))
+
+
+def exportar_tsv(caminho, codigos, contagens, k):
+    """
+    Exporta uma tabela de contagem como TSV (kmer, repeticoes).
+    """
+
+    salvar_tsv(caminho, ('kmer', 'repeticoes'),
+               (decodificar(np.asarray(codigos), k),
+                np.asarray(contagens).tolist()))
+
+
+def carregar_tsv(caminho):
+    """
+    Lê um arquivo salvo por salvar_tsv.
+    :return (cabecalho, linhas), com os campos ainda como strings
+    :rtype: tuple
+    """
+
+    with open(caminho) as arquivo:
+        linhas = [linha.rstrip('\n').split('\t') for linha in arquivo]
+
+    return linhas[0], linhas[1:]
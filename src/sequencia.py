@@ -0,0 +1,242 @@
+"""
+Tipos compactos e imutáveis para sequencias de DNA e matrizes de motif.
+
+Uma lista de letras gasta um ponteiro de 8 bytes por base (uns 40 MB só de
+ponteiros para um genoma de 5 Mbp); aqui cada base é um byte ASCII
+(maiúsculo), guardado num bytes ou num array NumPy somente leitura. Os dois
+tipos se comportam como as listas usadas no DNA.py (len, índice, fatia,
+iteração letra a letra), então o código antigo continua funcionando, e
+np.asarray(...) devolve as bases já codificadas em 2 bits (como genoma.Genoma),
+então eles podem ir direto para as funções de kmers.py, perfil.py, etc.
+"""
+
+import numpy as np
+
+from kmers import INVALIDA, codificar
+
+
+def _para_bytes(sequencia):
+    if isinstance(sequencia, Sequencia):
+        return sequencia.dados
+    if isinstance(sequencia, str):
+        return sequencia.upper().encode('ascii')
+    if isinstance(sequencia, (bytes, bytearray, memoryview)):
+        return bytes(sequencia).upper()
+    if isinstance(sequencia, np.ndarray):
+        return sequencia.astype(np.uint8).tobytes().upper()
+    return ''.join(sequencia).upper().encode('ascii')
+
+
+class Sequencia(object):
+    """
+    Sequencia de DNA imutável, guardada como bytes ASCII.
+
+    - len, índice (uma letra), fatia (outra Sequencia) e iteração funcionam
+      como numa lista de letras;
+    - 'janela' devolve uma memoryview, sem cópia;
+    - o hash é calculado uma vez só, e uma Sequencia é igual à str com as
+      mesmas letras (e tem o mesmo hash), então serve de chave de dict;
+    - 'empacotar' gera a forma de 2 bits por base (4 bases por byte).
+    """
+
+    __slots__ = ('_dados', '_hash')
+
+    def __init__(self, sequencia=b''):
+        """
+        :param sequencia: str, bytes, lista de letras, array de bytes ASCII
+        ou outra Sequencia
+        """
+
+        self._dados = _para_bytes(sequencia)
+        self._hash = None
+
+    @property
+    def dados(self):
+        return self._dados
+
+    def __len__(self):
+        return len(self._dados)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return Sequencia(self._dados[indice])
+        return chr(self._dados[indice])
+
+    def __iter__(self):
+        return iter(self._dados.decode('ascii'))
+
+    def __str__(self):
+        return self._dados.decode('ascii')
+
+    def __repr__(self):
+        if len(self._dados) > 40:
+            return f"Sequencia('{self._dados[:37].decode('ascii')}...', " \
+                   f"{len(self._dados)} bases)"
+        return f"Sequencia('{self}')"
+
+    def __eq__(self, outra):
+        if isinstance(outra, Sequencia):
+            return self._dados == outra._dados
+        if isinstance(outra, str):
+            return self._dados == outra.encode('ascii', 'replace')
+        return NotImplemented
+
+    def __lt__(self, outra):
+        return self._dados < _para_bytes(outra)
+
+    def __hash__(self):
+        if self._hash is None:
+            # o mesmo hash da str, para valer a igualdade com str
+            self._hash = hash(str(self))
+        return self._hash
+
+    def __add__(self, outra):
+        return Sequencia(self._dados + _para_bytes(outra))
+
+    def __array__(self, dtype=None, copy=None):
+        bases = codificar(self._dados)
+        if dtype is None:
+            return bases
+        return bases.astype(dtype)
+
+    def janela(self, inicio, tamanho):
+        """
+        O trecho [inicio, inicio + tamanho) como memoryview (sem cópia).
+        """
+
+        return memoryview(self._dados)[inicio:inicio + tamanho]
+
+    def janelas(self, k):
+        """
+        Gerador das janelas de tamanho k, como memoryviews.
+        """
+
+        visao = memoryview(self._dados)
+        for inicio in range(len(self._dados) - k + 1):
+            yield visao[inicio:inicio + k]
+
+    def ascii(self):
+        """
+        As bases como array uint8 de bytes ASCII, sem cópia (somente
+        leitura).
+        :rtype: numpy.ndarray
+        """
+
+        return np.frombuffer(self._dados, dtype=np.uint8)
+
+    def empacotar(self):
+        """
+        Forma compacta, com 2 bits por base (A=0, C=1, G=2, T=3), a primeira
+        base nos bits mais altos do primeiro byte.
+        :return (array uint8 de ceil(n / 4) bytes, n)
+        :rtype: tuple
+        """
+
+        bases = codificar(self._dados)
+        if np.any(bases == INVALIDA):
+            raise ValueError("só sequencias com ACGT podem ser empacotadas")
+
+        completas = np.zeros(-(-len(bases) // 4) * 4, dtype=np.uint8)
+        completas[:len(bases)] = bases
+        grupos = completas.reshape(-1, 4)
+        empacotado = (grupos[:, 0] << 6) | (grupos[:, 1] << 4) | \
+            (grupos[:, 2] << 2) | grupos[:, 3]
+        return empacotado, len(bases)
+
+    @classmethod
+    def desempacotar(cls, empacotado, tamanho):
+        """
+        Refaz a Sequencia a partir de 'empacotar'.
+        """
+
+        empacotado = np.asarray(empacotado, dtype=np.uint8)
+        bases = np.stack([(empacotado >> deslocamento) & 3
+                          for deslocamento in (6, 4, 2, 0)], axis=1)
+        letras = np.frombuffer(b'ACGT', dtype=np.uint8)
+        return cls(letras[bases.reshape(-1)[:tamanho]])
+
+
+class MatrizMotif(object):
+    """
+    Matriz de motif imutável: t sequencias de mesmo tamanho num array t x n
+    de bytes ASCII (somente leitura). Indexar uma linha devolve uma
+    Sequencia; matriz[i, j] devolve uma letra.
+    """
+
+    __slots__ = ('_dados', '_hash')
+
+    def __init__(self, linhas):
+        """
+        :param linhas: lista de sequencias de mesmo tamanho (str, listas de
+        letras, Sequencia) ou um array t x n de bytes ASCII
+        """
+
+        if isinstance(linhas, MatrizMotif):
+            dados = linhas._dados
+        elif isinstance(linhas, np.ndarray) and linhas.ndim == 2:
+            dados = np.frombuffer(_para_bytes(linhas), dtype=np.uint8)
+            dados = dados.reshape(linhas.shape)
+        else:
+            linhas = [_para_bytes(linha) for linha in linhas]
+            if len({len(linha) for linha in linhas}) > 1:
+                raise ValueError("as linhas do motif devem ter o mesmo "
+                                 "tamanho")
+            colunas = len(linhas[0]) if linhas else 0
+            dados = np.frombuffer(b''.join(linhas), dtype=np.uint8)
+            dados = dados.reshape(len(linhas), colunas)
+
+        self._dados = dados
+        self._hash = None
+
+    @property
+    def formato(self):
+        """
+        (linhas, colunas)
+        """
+
+        return self._dados.shape
+
+    def __len__(self):
+        return len(self._dados)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, tuple):
+            return chr(self._dados[indice])
+        if isinstance(indice, slice):
+            return MatrizMotif(self._dados[indice])
+        return Sequencia(self._dados[indice])
+
+    def __iter__(self):
+        for linha in self._dados:
+            yield Sequencia(linha)
+
+    def __str__(self):
+        return '\n'.join(str(linha) for linha in self)
+
+    def __repr__(self):
+        return f"MatrizMotif({[str(linha) for linha in self]})"
+
+    def __eq__(self, outra):
+        if not isinstance(outra, MatrizMotif):
+            return NotImplemented
+        return self._dados.shape == outra._dados.shape and \
+            np.array_equal(self._dados, outra._dados)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((self._dados.shape, self._dados.tobytes()))
+        return self._hash
+
+    def __array__(self, dtype=None, copy=None):
+        bases = codificar(self._dados)
+        if dtype is None:
+            return bases
+        return bases.astype(dtype)
+
+    def ascii(self):
+        """
+        A matriz de bytes ASCII (somente leitura, sem cópia).
+        :rtype: numpy.ndarray (t x n)
+        """
+
+        return self._dados
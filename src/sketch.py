@@ -0,0 +1,238 @@
+"""
+Kmers mais frequentes em memória limitada, para k grande.
+
+Com k >= 20 quase toda janela de um genoma é um kmer distinto, e a tabela
+exata (kmers.contar_kmers) cresce com o genoma. Aqui o genoma é lido em
+blocos e cada bloco alimenta duas estruturas de tamanho fixo:
+
+- um count-min sketch (EsbocoContagem): 'profundidade' linhas de
+  'largura' contadores, cada linha com o seu hash multiplicativo do código
+  do kmer. A estimativa de um kmer (o menor dos seus contadores) nunca é
+  menor que a contagem real e, com probabilidade 1 - e^-profundidade, passa
+  dela em no máximo e / largura vezes o total de janelas;
+- um resumo de Misra-Gries (ResumoFrequentes) com 'capacidade' kmers. Ao
+  juntar um bloco, se passar da capacidade, todas as contagens diminuem do
+  mesmo tanto; a soma dessas diminuições (o 'decremento', no máximo
+  janelas / (capacidade + 1)) é o quanto uma contagem do resumo pode estar
+  abaixo da real, e todo kmer que aparece mais vezes que isso está no
+  resumo.
+
+Cada candidato do resumo sai com um intervalo [minimo, maximo] para a
+contagem real. Uma segunda passada opcional conta exatamente só os
+candidatos.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from kmers import blocos_de_bases, codigos_kmers, validar_k
+
+# memória total (em bytes) usada por padrão por mais_frequentes_aproximado
+MEMORIA_PADRAO = 1 << 26
+
+# linhas do count-min sketch
+PROFUNDIDADE = 4
+
+# bytes por base do bloco durante a contagem de um bloco (códigos, ordenação
+# e agrupamento)
+_BYTES_POR_BASE = 48
+
+# bytes por kmer do resumo durante a junção com um bloco
+_BYTES_POR_CANDIDATO = 64
+
+Frequentes = namedtuple('Frequentes', ['codigos', 'minimos', 'maximos',
+                                       'exatas', 'janelas', 'decremento'])
+Frequentes.__doc__ = """
+Resultado de mais_frequentes_aproximado, do mais frequente para o menos:
+os códigos dos kmers, o intervalo [minimos, maximos] de cada contagem real,
+as contagens exatas (None sem a segunda passada), o total de janelas
+contadas e o decremento do resumo (todo kmer com mais ocorrências que ele
+foi considerado).
+"""
+
+
+class EsbocoContagem(object):
+    """
+    Count-min sketch de códigos de kmers (ver o começo do módulo).
+    """
+
+    __slots__ = ('contadores', 'multiplicadores', 'deslocamento', 'total')
+
+    def __init__(self, largura, profundidade=PROFUNDIDADE, semente=0):
+        """
+        :param largura: contadores por linha (arredondada para baixo para
+        uma potência de 2)
+        """
+
+        bits = max(1, int(largura).bit_length() - 1)
+        self.contadores = np.zeros((profundidade, 1 << bits), dtype=np.int64)
+        # multiplicadores ímpares de 64 bits; o hash de cada linha são os
+        # bits altos de código * multiplicador
+        gerador = np.random.default_rng(semente)
+        self.multiplicadores = gerador.integers(
+            0, 1 << 63, profundidade, dtype=np.uint64) * np.uint64(2) + \
+            np.uint64(1)
+        self.deslocamento = np.uint64(64 - bits)
+        self.total = 0
+
+    @classmethod
+    def com_memoria(cls, memoria, profundidade=PROFUNDIDADE, semente=0):
+        """
+        O maior sketch que cabe em 'memoria' bytes.
+        """
+
+        return cls(max(2, memoria // (8 * profundidade)), profundidade,
+                   semente)
+
+    @property
+    def largura(self):
+        return self.contadores.shape[1]
+
+    @property
+    def memoria(self):
+        return self.contadores.nbytes
+
+    def _colunas(self, codigos, linha):
+        return ((codigos * self.multiplicadores[linha]) >>
+                self.deslocamento).astype(np.intp)
+
+    def adicionar(self, codigos, contagens):
+        """
+        Soma 'contagens' às ocorrências de cada código.
+        """
+
+        codigos = np.asarray(codigos, dtype=np.uint64)
+        for linha, contadores in enumerate(self.contadores):
+            contadores += np.bincount(self._colunas(codigos, linha),
+                                      weights=contagens,
+                                      minlength=self.largura).astype(np.int64)
+        self.total += int(np.sum(contagens))
+
+    def estimar(self, codigos):
+        """
+        Estimativa (nunca menor que a real) das ocorrências de cada código.
+        :rtype: numpy.ndarray (int64)
+        """
+
+        codigos = np.asarray(codigos, dtype=np.uint64)
+        estimativas = None
+        for linha, contadores in enumerate(self.contadores):
+            valores = contadores[self._colunas(codigos, linha)]
+            estimativas = valores if estimativas is None \
+                else np.minimum(estimativas, valores)
+        return estimativas
+
+    def erro(self):
+        """
+        Quanto uma estimativa passa da contagem real, no máximo, com
+        probabilidade 1 - e^-profundidade.
+        :rtype: int
+        """
+
+        return int(np.ceil(np.e / self.largura * self.total))
+
+
+class ResumoFrequentes(object):
+    """
+    Resumo de Misra-Gries que junta contagens de blocos inteiros (ver o
+    começo do módulo).
+    """
+
+    __slots__ = ('capacidade', 'codigos', 'contagens', 'decremento')
+
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self.codigos = np.zeros(0, dtype=np.uint64)
+        self.contagens = np.zeros(0, dtype=np.int64)
+        self.decremento = 0
+
+    def adicionar(self, codigos, contagens):
+        """
+        Junta as contagens de um bloco (códigos distintos).
+        """
+
+        todos, grupo = np.unique(np.concatenate((self.codigos, codigos)),
+                                 return_inverse=True)
+        somas = np.bincount(grupo, weights=np.concatenate(
+            (self.contagens, contagens)), minlength=len(todos))
+        somas = somas.astype(np.int64)
+
+        if len(todos) > self.capacidade:
+            # a (capacidade + 1)-ésima maior contagem sai de todas
+            corte = int(np.partition(somas, len(somas) - self.capacidade - 1)
+                        [len(somas) - self.capacidade - 1])
+            somas -= corte
+            self.decremento += corte
+            manter = somas > 0
+            todos, somas = todos[manter], somas[manter]
+
+        self.codigos, self.contagens = todos, somas
+
+
+def _contar_bloco(bases, k):
+    return np.unique(codigos_kmers(bases, k), return_counts=True)
+
+
+def contar_candidatos(sequencia, k, candidatos, tamanho_bloco):
+    """
+    Contagem exata só dos 'candidatos' (códigos em ordem crescente), numa
+    passada pela sequencia em blocos.
+    :rtype: numpy.ndarray (int64)
+    """
+
+    exatas = np.zeros(len(candidatos), dtype=np.int64)
+    if len(candidatos) == 0:
+        return exatas
+
+    for _, bases in blocos_de_bases(sequencia, tamanho_bloco, k - 1):
+        codigos = codigos_kmers(bases, k)
+        indices = np.minimum(np.searchsorted(candidatos, codigos),
+                             len(candidatos) - 1)
+        encontrados = candidatos[indices] == codigos
+        exatas += np.bincount(indices[encontrados], minlength=len(candidatos))
+    return exatas
+
+
+def mais_frequentes_aproximado(sequencia, k, quantos=10,
+                               memoria=MEMORIA_PADRAO, verificar=False,
+                               profundidade=PROFUNDIDADE, semente=0):
+    """
+    Os 'quantos' kmers mais frequentes, em memória limitada. A memória é
+    dividida entre o sketch (metade), o resumo e o bloco de leitura (um
+    quarto cada).
+    :param sequencia: qualquer formato aceito por kmers.codificar; um
+    genoma.Genoma é lido em blocos
+    :param memoria: memória aproximada (em bytes) das estruturas
+    :param verificar: faz a segunda passada, com a contagem exata dos
+    candidatos (e ordena por ela)
+    :param semente: semente dos hashes do sketch
+    :rtype: Frequentes
+    """
+
+    validar_k(k)
+    esboco = EsbocoContagem.com_memoria(memoria // 2, profundidade, semente)
+    resumo = ResumoFrequentes(max(quantos, memoria // 4 //
+                                  _BYTES_POR_CANDIDATO))
+    tamanho_bloco = max(1 << 12, memoria // 4 // _BYTES_POR_BASE)
+
+    for _, bases in blocos_de_bases(sequencia, tamanho_bloco, k - 1):
+        codigos, contagens = _contar_bloco(bases, k)
+        esboco.adicionar(codigos, contagens)
+        resumo.adicionar(codigos, contagens)
+
+    candidatos = resumo.codigos
+    minimos = resumo.contagens
+    maximos = np.minimum(esboco.estimar(candidatos),
+                         minimos + resumo.decremento)
+
+    exatas = None
+    if verificar:
+        exatas = contar_candidatos(sequencia, k, candidatos, tamanho_bloco)
+        ordem = np.lexsort((candidatos, -exatas))[:quantos]
+        exatas = exatas[ordem]
+    else:
+        ordem = np.lexsort((candidatos, -maximos, -minimos))[:quantos]
+
+    return Frequentes(candidatos[ordem], minimos[ordem], maximos[ordem],
+                      exatas, esboco.total, resumo.decremento)
@@ -0,0 +1,181 @@
+"""
+Desvio (skew) G - C ao longo do genoma e localização da origem de
+replicação.
+
+O desvio depois das i primeiras bases é (#G - #C) nelas; ele cai ao longo
+da fita que é replicada primeiro e sobe depois, então o mínimo aponta para
+a região da origem (ori). A soma acumulada é feita com NumPy em blocos,
+carregando o valor de um bloco para o outro, então mesmo um genoma de
+10 Mbp é percorrido com memória limitada ao tamanho do bloco (um
+genoma.Genoma é lido em pedaços, ver Genoma.blocos).
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from kmers import blocos_de_bases, codificar
+from sequencia import Sequencia
+
+# bases por bloco na leitura do genoma
+TAMANHO_BLOCO = 1 << 22
+
+# bytes por base de um bloco (os passos e o desvio acumulado), para escolher
+# o tamanho_bloco a partir de uma memória
+BYTES_POR_BASE = 24
+
+# tamanho padrão da região em volta do mínimo (como as janelas escolhidas
+# à mão para a ori de Vibrio cholerae)
+TAMANHO_REGIAO = 500
+
+# bases por janela do perfil do desvio salvo pela análise (ver
+# main.localizar_ori)
+JANELA_DO_PERFIL = 100
+
+_C, _G = 1, 2
+
+_LETRAS = np.frombuffer(b'ACGTN', dtype=np.uint8)
+
+Extremos = namedtuple('Extremos', ['minimo', 'posicoes_minimo', 'maximo',
+                                   'posicoes_maximo', 'final'])
+Extremos.__doc__ = """
+Menor e maior desvio, com todas as posições (número de bases lidas) em que
+cada um acontece, e o desvio no fim do genoma.
+"""
+
+Perfil = namedtuple('Perfil', ['inicios', 'desvios', 'acumulados'])
+Perfil.__doc__ = """
+Desvio por janela: o início de cada janela, (G - C) / (G + C) dentro dela
+(0 se ela não tem G nem C) e o desvio acumulado no fim dela.
+"""
+
+Regiao = namedtuple('Regiao', ['inicio', 'fim', 'sequencia'])
+Regiao.__doc__ = """
+A região [inicio, fim) do genoma em volta do menor desvio, e as suas
+bases (uma Sequencia).
+"""
+
+
+def _passos(bases):
+    return (bases == _G).astype(np.int8) - (bases == _C).astype(np.int8)
+
+
+def desvio_acumulado(sequencia):
+    """
+    O desvio depois de cada prefixo: o elemento i é o desvio das i
+    primeiras bases (o primeiro é 0). Guarda o genoma inteiro; para só os
+    extremos, use extremos_do_desvio.
+    :rtype: numpy.ndarray (int64)
+    """
+
+    bases = codificar(sequencia)
+    desvio = np.zeros(len(bases) + 1, dtype=np.int64)
+    np.cumsum(_passos(bases), out=desvio[1:])
+    return desvio
+
+
+def extremos_do_desvio(sequencia, tamanho_bloco=TAMANHO_BLOCO):
+    """
+    Menor e maior desvio e onde eles acontecem, em blocos.
+    :rtype: Extremos
+    """
+
+    minimo = maximo = atual = 0
+    posicoes_minimo, posicoes_maximo = [0], [0]
+    lidas = 0
+    for _, bases in blocos_de_bases(sequencia, tamanho_bloco):
+        desvio = np.cumsum(_passos(bases), dtype=np.int64) + atual
+        if len(desvio) == 0:
+            continue
+
+        menor, maior = int(desvio.min()), int(desvio.max())
+        if menor < minimo:
+            minimo, posicoes_minimo = menor, []
+        if menor == minimo:
+            posicoes_minimo.extend(
+                (lidas + 1 + np.flatnonzero(desvio == menor)).tolist())
+        if maior > maximo:
+            maximo, posicoes_maximo = maior, []
+        if maior == maximo:
+            posicoes_maximo.extend(
+                (lidas + 1 + np.flatnonzero(desvio == maior)).tolist())
+
+        atual = int(desvio[-1])
+        lidas += len(bases)
+
+    return Extremos(minimo, posicoes_minimo, maximo, posicoes_maximo, atual)
+
+
+def perfil_do_desvio(sequencia, janela, tamanho_bloco=TAMANHO_BLOCO):
+    """
+    O desvio em janelas consecutivas (sem sobreposição) de 'janela' bases,
+    em blocos. A última janela pode ser menor.
+    :rtype: Perfil
+    """
+
+    if janela < 1:
+        raise ValueError(f"a janela deve ter pelo menos uma base, recebida "
+                         f"{janela}")
+
+    # blocos com um número inteiro de janelas, para nenhuma ficar dividida
+    tamanho_bloco = max(1, tamanho_bloco // janela) * janela
+    inicios, desvios, acumulados = [], [], []
+    atual = lidas = 0
+    for _, bases in blocos_de_bases(sequencia, tamanho_bloco):
+        if len(bases) == 0:
+            continue
+        cortes = np.arange(0, len(bases), janela)
+        g = np.add.reduceat((bases == _G).astype(np.int64), cortes)
+        c = np.add.reduceat((bases == _C).astype(np.int64), cortes)
+
+        inicios.append(lidas + cortes)
+        desvios.append((g - c) / np.maximum(g + c, 1))
+        acumulados.append(atual + np.cumsum(g - c))
+        atual = int(acumulados[-1][-1])
+        lidas += len(bases)
+
+    if not inicios:
+        return Perfil(np.zeros(0, dtype=np.int64), np.zeros(0),
+                      np.zeros(0, dtype=np.int64))
+    return Perfil(np.concatenate(inicios), np.concatenate(desvios),
+                  np.concatenate(acumulados))
+
+
+def trecho(sequencia, inicio, fim, tamanho_bloco=TAMANHO_BLOCO):
+    """
+    As bases [inicio, fim) da sequencia, lendo só até elas.
+    :rtype: Sequencia
+    """
+
+    pedacos = []
+    lidas = 0
+    for _, bases in blocos_de_bases(sequencia, tamanho_bloco):
+        if lidas + len(bases) > inicio:
+            pedacos.append(bases[max(inicio - lidas, 0):fim - lidas])
+        lidas += len(bases)
+        if lidas >= fim:
+            break
+
+    bases = np.concatenate(pedacos) if pedacos else np.zeros(0, np.uint8)
+    return Sequencia(_LETRAS[bases])
+
+
+def regiao_ori(sequencia, tamanho=TAMANHO_REGIAO, tamanho_bloco=TAMANHO_BLOCO):
+    """
+    A região de 'tamanho' bases centrada no (primeiro) menor desvio, a
+    candidata a origem de replicação; ajustada para caber no genoma (um
+    genoma menor que 'tamanho' é devolvido inteiro). Ela pode ir direto
+    para as funções de contagem (kmers.py, main.py).
+    :rtype: Regiao
+    """
+
+    extremos = extremos_do_desvio(sequencia, tamanho_bloco)
+    centro = extremos.posicoes_minimo[0]
+    inicio = max(centro - tamanho // 2, 0)
+    regiao = trecho(sequencia, inicio, inicio + tamanho, tamanho_bloco)
+    if len(regiao) < tamanho and inicio > 0:
+        # perto do fim do genoma: a região é puxada para trás
+        fim = inicio + len(regiao)
+        inicio = max(fim - tamanho, 0)
+        regiao = trecho(sequencia, inicio, fim, tamanho_bloco)
+    return Regiao(inicio, inicio + len(regiao), regiao)
@@ -0,0 +1,124 @@
+"""
+Vizinhanças de Hamming: todos os kmers a no máximo d erros de um padrão,
+como códigos de 2 bits (os mesmos de kmers.py).
+
+Cada vizinhança é o código do padrão com um XOR de cada máscara de
+mutacoes.mascaras_vizinhanca (geradas uma vez por (k, d)), sem passar por
+strings. As vizinhanças prontas ficam num cache LRU limitado pelo total de
+códigos guardados (para k = 12 e d = 3 cada uma tem 6.571 códigos), com
+contadores de acertos e faltas, e podem ser entregues aos poucos por um
+gerador.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from hamming import codificar_padroes
+from kmers import decodificar, validar_k
+from mutacoes import mascaras_vizinhanca
+
+# total de códigos guardados no cache (8 bytes cada)
+CODIGOS_NO_CACHE = 1 << 22
+
+# códigos convertidos para int de cada vez pelo gerador
+CODIGOS_POR_PEDACO = 1 << 12
+
+
+class Vizinhancas(object):
+    """
+    Vizinhanças d de padrões, guardadas num cache LRU. Os arrays devolvidos
+    são compartilhados com o cache e, por isso, somente leitura.
+    """
+
+    __slots__ = ('capacidade', 'acertos', 'faltas', 'ocupados', '_cache')
+
+    def __init__(self, capacidade=CODIGOS_NO_CACHE):
+        """
+        :param capacidade: total de códigos guardados; uma vizinhança maior
+        que isso é calculada, mas não guardada
+        """
+
+        self.capacidade = capacidade
+        self.acertos = 0
+        self.faltas = 0
+        self.ocupados = 0
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, chave):
+        return chave in self._cache
+
+    def codigos(self, codigo, k, d):
+        """
+        Os códigos a no máximo d erros do kmer de código 'codigo' (ele
+        incluído), em ordem crescente.
+        :rtype: numpy.ndarray (uint64)
+        """
+
+        chave = (int(codigo), k, d)
+        vizinhos = self._cache.get(chave)
+        if vizinhos is not None:
+            self._cache.move_to_end(chave)
+            self.acertos += 1
+            return vizinhos
+
+        self.faltas += 1
+        validar_k(k)
+        if d < 0:
+            raise ValueError(f"d não pode ser negativo, recebido {d}")
+        vizinhos = np.sort(np.uint64(chave[0]) ^ mascaras_vizinhanca(k, d))
+        vizinhos.flags.writeable = False
+
+        if len(vizinhos) <= self.capacidade:
+            self._cache[chave] = vizinhos
+            self.ocupados += len(vizinhos)
+            while self.ocupados > self.capacidade:
+                _, antiga = self._cache.popitem(last=False)
+                self.ocupados -= len(antiga)
+        return vizinhos
+
+    def vizinhanca(self, padrao, d):
+        """
+        A vizinhança d de um padrão (str, lista de letras ou bases
+        codificadas; só ACGT).
+        :return (codigos em ordem crescente, k)
+        :rtype: tuple
+        """
+
+        codigo, k = codificar_padroes([padrao])
+        return self.codigos(codigo[0], k, d), k
+
+    def gerar(self, padrao, d):
+        """
+        Gera, um de cada vez, os códigos (int) da vizinhança d do padrão, em
+        ordem crescente. A vizinhança só é procurada (ou calculada) quando o
+        primeiro código é pedido.
+        """
+
+        vizinhos, _ = self.vizinhanca(padrao, d)
+        for inicio in range(0, len(vizinhos), CODIGOS_POR_PEDACO):
+            yield from vizinhos[inicio:inicio + CODIGOS_POR_PEDACO].tolist()
+
+    def kmers(self, padrao, d):
+        """
+        A vizinhança d do padrão como strings, em ordem alfabética.
+        :rtype: list
+        """
+
+        vizinhos, k = self.vizinhanca(padrao, d)
+        return decodificar(vizinhos, k, maiusculas=True)
+
+    def limpar(self):
+        """
+        Esvazia o cache (os contadores continuam).
+        """
+
+        self._cache.clear()
+        self.ocupados = 0
+
+
+# o cache compartilhado pelo programa (ver DNA.vizinhanca)
+VIZINHANCAS = Vizinhancas()